@@ -0,0 +1,101 @@
+"""
+Tenant/User AI Configuration Cache
+==================================
+TTL LRU in front of db.get_user_ai_config / db.get_tenant_ai_config, which
+were queried on every client lookup.
+
+Writes go through the update endpoints, which call invalidate_user /
+invalidate_tenant: the entry is dropped locally and the invalidation is
+published on Redis (AI_CONFIG_CHANNEL) so every other API worker drops
+it too. If Redis is unavailable, entries still expire after
+AI_CONFIG_CACHE_TTL seconds.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+import db
+from query_cache import TTLCache
+from redis_jobs import get_job_manager
+
+logger = logging.getLogger("cloudmigrate-ai-config")
+
+AI_CONFIG_CACHE_SIZE = int(os.getenv("AI_CONFIG_CACHE_SIZE", "1000"))
+AI_CONFIG_CACHE_TTL = float(os.getenv("AI_CONFIG_CACHE_TTL", "60"))
+AI_CONFIG_CHANNEL = "ai-config:invalidate"
+
+# ("user" | "tenant", id) -> (config or None,); the tuple caches "not found" too
+_configs = TTLCache(AI_CONFIG_CACHE_SIZE, AI_CONFIG_CACHE_TTL)
+_listener: Optional[asyncio.Task] = None
+
+
+async def _get(kind: str, entity_id: str, load) -> Optional[Dict[str, Any]]:
+    _ensure_listener()
+    entry = _configs.get((kind, entity_id))
+    if entry is None:
+        entry = (await load(entity_id),)
+        _configs.put((kind, entity_id), entry)
+    # Copies, so callers can't alter the cached config
+    return dict(entry[0]) if entry[0] is not None else None
+
+
+async def get_user_ai_config(user_id: str) -> Optional[Dict[str, Any]]:
+    """Cached db.get_user_ai_config."""
+    return await _get("user", user_id, db.get_user_ai_config)
+
+
+async def get_tenant_ai_config(tenant_id: str) -> Optional[Dict[str, Any]]:
+    """Cached db.get_tenant_ai_config."""
+    return await _get("tenant", tenant_id, db.get_tenant_ai_config)
+
+
+async def _invalidate(kind: str, entity_id: str) -> None:
+    _configs.pop((kind, entity_id))
+    try:
+        r = await (await get_job_manager()).get_redis()
+        await r.publish(AI_CONFIG_CHANNEL, json.dumps({"kind": kind, "id": entity_id}))
+    except Exception as e:
+        logger.warning(f"Could not publish AI config invalidation ({e}); other workers catch up within the TTL")
+
+
+async def invalidate_user(user_id: str) -> None:
+    """Drop a user's cached config here and in every other worker."""
+    await _invalidate("user", user_id)
+
+
+async def invalidate_tenant(tenant_id: str) -> None:
+    """Drop a tenant's cached config here and in every other worker."""
+    await _invalidate("tenant", tenant_id)
+
+
+def _ensure_listener() -> None:
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(_listen())
+
+
+async def _listen() -> None:
+    """Apply invalidations published by other workers (reconnects on error)."""
+    while True:
+        try:
+            r = await (await get_job_manager()).get_redis()
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(AI_CONFIG_CHANNEL)
+            # Anything published while we weren't listening is lost
+            _configs.clear()
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    _configs.pop((data["kind"], data["id"]))
+            finally:
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"AI config invalidation listener error: {e}")
+            await asyncio.sleep(5)
@@ -0,0 +1,237 @@
+"""
+Conversation History Compaction
+===============================
+Keeps chat prompts within a token budget instead of resending the whole
+conversation on every request.
+
+- History is counted with tiktoken (tokenizer.count_tokens). While it fits
+  CHAT_HISTORY_MAX_TOKENS it is sent verbatim
+- Over budget, the oldest turns are folded into a running summary and only
+  a rolling window of recent turns (CHAT_HISTORY_WINDOW_FILL of the budget)
+  is kept. The summary is updated incrementally: the model sees the
+  previous summary plus the newly dropped turns, never the full transcript
+- The window is trimmed well below the budget, so summarisation happens
+  once every few turns rather than on every request
+- Tool results are cut to CHAT_TOOL_RESULT_TOKENS, keeping the snippets
+  that share the most terms with the user's question
+
+Callers persist the returned HistoryState: /api/chat hands the summary back
+to the client, Sophia stores it on the CoachingSession row.
+"""
+
+import os
+import re
+import json
+import logging
+from dataclasses import dataclass
+from typing import List, Dict, Any, Tuple
+
+from openai import AsyncOpenAI
+
+from tokenizer import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger("cloudmigrate-chat-history")
+
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "6000"))
+CHAT_HISTORY_SUMMARY_TOKENS = int(os.getenv("CHAT_HISTORY_SUMMARY_TOKENS", "500"))
+CHAT_TOOL_RESULT_TOKENS = int(os.getenv("CHAT_TOOL_RESULT_TOKENS", "1500"))
+
+# Fraction of the budget the verbatim window is trimmed to when compacting
+CHAT_HISTORY_WINDOW_FILL = 0.5
+
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Separators tool results are split on when picking snippets, coarsest first
+_SNIPPET_SEPARATORS = ("\n\n---\n\n", "\n\n", "\n")
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and a cloud "
+    "architecture assistant. Update the summary with the new messages. Keep the user's "
+    "goals, decisions, constraints, open questions and any facts the assistant relied on. "
+    "Drop pleasantries. Write at most {max_tokens} tokens of plain text."
+)
+
+
+@dataclass
+class HistoryState:
+    """Running summary and how many leading messages of the conversation it covers."""
+    summary: str = ""
+    summarized_count: int = 0
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """Tokens a chat message adds to the prompt."""
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(message.get("content") or "")
+    for call in message.get("tool_calls") or []:
+        tokens += count_tokens(call["function"]["name"]) + count_tokens(call["function"]["arguments"])
+    return tokens
+
+
+def history_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Tokens a list of chat messages adds to the prompt."""
+    return sum(message_tokens(m) for m in messages)
+
+
+def summary_message(summary: str) -> Dict[str, str]:
+    """System message carrying the summary of earlier turns."""
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+
+
+# ----------------------------------------------------------------------
+# Tool results
+# ----------------------------------------------------------------------
+
+def _terms(text: str) -> set:
+    return set(_WORD.findall(text.lower()))
+
+
+def compress_tool_result(result: str, query: str = "", max_tokens: int = CHAT_TOOL_RESULT_TOKENS) -> str:
+    """
+    Shrink a tool result to max_tokens.
+
+    JSON is re-serialised without indentation first. If that is still too
+    long, the result is split into snippets (search hits, paragraphs, lines)
+    and the ones sharing the most terms with query are kept, in their
+    original order.
+
+    Args:
+        result: Tool output
+        query: Text the snippets are ranked against (usually the user's message)
+        max_tokens: Token budget for the result
+    """
+    try:
+        result = json.dumps(json.loads(result), separators=(",", ":"), ensure_ascii=False)
+    except (ValueError, TypeError):
+        pass
+    total = count_tokens(result)
+    if total <= max_tokens:
+        return result
+
+    separator = next((s for s in _SNIPPET_SEPARATORS if s in result), None)
+    if separator is None:
+        return truncate_to_tokens(result, max_tokens)
+
+    snippets = [s for s in result.split(separator) if s.strip()]
+    query_terms = _terms(query)
+    # Most relevant first; earlier snippets win ties (search results are ranked)
+    ranked = sorted(range(len(snippets)), key=lambda i: (-len(query_terms & _terms(snippets[i])), i))
+
+    marker_tokens = 16
+    budget = max_tokens - marker_tokens
+    keep = []
+    for i in ranked:
+        tokens = count_tokens(snippets[i]) + count_tokens(separator)
+        if tokens <= budget:
+            keep.append(i)
+            budget -= tokens
+        elif not keep:
+            # Nothing fits whole: cut the best snippet
+            snippets[i] = truncate_to_tokens(snippets[i], budget)
+            keep.append(i)
+            break
+
+    kept = separator.join(snippets[i] for i in sorted(keep))
+    return f"{kept}\n[{len(snippets) - len(keep)} of {len(snippets)} parts omitted, {total} tokens originally]"
+
+
+# ----------------------------------------------------------------------
+# History
+# ----------------------------------------------------------------------
+
+def split_window(messages: List[Dict[str, Any]], budget: int) -> int:
+    """
+    Index where the verbatim window of messages starts.
+
+    The window is the newest messages fitting budget, starting on a user
+    message so no exchange is cut in half. The newest exchange is always kept.
+    """
+    start = len(messages)
+    tokens = 0
+    for i in range(len(messages) - 1, -1, -1):
+        tokens += message_tokens(messages[i])
+        if tokens > budget:
+            break
+        if messages[i].get("role") == "user":
+            start = i
+    if start == len(messages):
+        # Even the newest exchange is over budget: keep it from its user message
+        start = next(
+            (i for i in range(len(messages) - 1, -1, -1) if messages[i].get("role") == "user"),
+            max(len(messages) - 1, 0),
+        )
+    return start
+
+
+def _transcript(messages: List[Dict[str, Any]]) -> str:
+    lines = []
+    for m in messages:
+        content = m.get("content") or ""
+        if m.get("role") == "tool":
+            content = truncate_to_tokens(content, 200)
+        lines.append(f"{m.get('role', 'user')}: {content}")
+    return "\n\n".join(lines)
+
+
+async def summarize(client: AsyncOpenAI, model: str, summary: str, messages: List[Dict[str, Any]]) -> str:
+    """Fold messages into an existing summary (one model call)."""
+    parts = []
+    if summary:
+        parts.append(f"Current summary:\n{summary}")
+    parts.append(f"New messages:\n{_transcript(messages)}")
+    response = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_tokens=CHAT_HISTORY_SUMMARY_TOKENS)},
+            {"role": "user", "content": "\n\n".join(parts)},
+        ],
+        temperature=0.2,
+        max_tokens=CHAT_HISTORY_SUMMARY_TOKENS,
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+async def compact_history(
+    messages: List[Dict[str, Any]],
+    state: HistoryState,
+    client: AsyncOpenAI,
+    model: str,
+    max_tokens: int = CHAT_HISTORY_MAX_TOKENS,
+) -> Tuple[List[Dict[str, Any]], HistoryState]:
+    """
+    Fit a conversation into max_tokens.
+
+    Args:
+        messages: The whole conversation so far, oldest first (no system prompt,
+            no current message); the first state.summarized_count are already
+            in state.summary
+        state: Summary from the previous call
+        client: Client for the summary call
+        model: Chat model for the summary call
+        max_tokens: Token budget for summary plus verbatim history
+
+    Returns:
+        (Messages to send, new state). If summarising fails the dropped
+        turns are lost from the prompt and the state is left unchanged.
+    """
+    pending = messages[state.summarized_count:]
+    summary_tokens = count_tokens(state.summary) + MESSAGE_OVERHEAD_TOKENS if state.summary else 0
+    if history_tokens(pending) + summary_tokens <= max_tokens:
+        prefix = [summary_message(state.summary)] if state.summary else []
+        return prefix + pending, state
+
+    start = split_window(pending, int((max_tokens - CHAT_HISTORY_SUMMARY_TOKENS) * CHAT_HISTORY_WINDOW_FILL))
+    older, window = pending[:start], pending[start:]
+    if not older:
+        return ([summary_message(state.summary)] if state.summary else []) + window, state
+
+    try:
+        summary = await summarize(client, model, state.summary, older)
+    except Exception as e:
+        logger.warning(f"History summary failed ({e}); dropping {len(older)} older messages")
+        return ([summary_message(state.summary)] if state.summary else []) + window, state
+
+    logger.info(f"Folded {len(older)} messages into the history summary")
+    state = HistoryState(summary=summary, summarized_count=state.summarized_count + len(older))
+    return [summary_message(summary)] + window, state
@@ -0,0 +1,188 @@
+"""
+Async Contextual Embeddings
+===========================
+Situates chunks within their source document before embedding
+(USE_CONTEXTUAL_EMBEDDINGS=true) without blocking the event loop.
+
+- Requests fan out under a process-wide concurrency cap
+- Every prompt for a document starts with the same document prefix, so
+  provider-side prompt caching can reuse it across requests
+- Several chunks of the same document share one structured (JSON) request
+  when they fit; malformed batch replies fall back to per-chunk requests
+"""
+
+import os
+import json
+import asyncio
+import logging
+from typing import List, Dict, Tuple, Optional
+
+from openai import AsyncOpenAI
+
+from tokenizer import count_tokens
+from openai_clients import get_async_client
+
+logger = logging.getLogger("cloudmigrate-contextual")
+
+# Document prefix sent with every request (unchanged from the sync version)
+CONTEXT_DOCUMENT_CHARS = 25000
+
+CONTEXTUAL_MAX_CONCURRENCY = int(os.getenv("CONTEXTUAL_MAX_CONCURRENCY", "8"))
+CONTEXTUAL_CHUNKS_PER_REQUEST = int(os.getenv("CONTEXTUAL_CHUNKS_PER_REQUEST", "8"))
+CONTEXTUAL_MAX_CHUNK_TOKENS = int(os.getenv("CONTEXTUAL_MAX_CHUNK_TOKENS", "8000"))
+
+# Output budget per chunk context
+CONTEXT_MAX_TOKENS = 200
+
+SYSTEM_PROMPT = "You are a helpful assistant that provides concise contextual information."
+
+_semaphore = asyncio.Semaphore(CONTEXTUAL_MAX_CONCURRENCY)
+
+
+def _get_client(api_key: str) -> AsyncOpenAI:
+    return get_async_client(api_key)
+
+
+def _document_block(full_document: str) -> str:
+    """Identical leading text for every request about this document."""
+    return f"<document>\n{full_document[:CONTEXT_DOCUMENT_CHARS]}\n</document>\n"
+
+
+def _single_prompt(document_block: str, chunk: str) -> str:
+    return (
+        f"{document_block}"
+        "Here is the chunk we want to situate within the whole document\n"
+        f"<chunk>\n{chunk}\n</chunk>\n"
+        "Please give a short succinct context to situate this chunk within the overall document "
+        "for the purposes of improving search retrieval of the chunk. "
+        "Answer only with the succinct context and nothing else."
+    )
+
+
+def _batch_prompt(document_block: str, chunks: List[str]) -> str:
+    numbered = "\n".join(f'<chunk index="{i}">\n{chunk}\n</chunk>' for i, chunk in enumerate(chunks))
+    return (
+        f"{document_block}"
+        "Here are the chunks we want to situate within the whole document\n"
+        f"{numbered}\n"
+        "For each chunk, give a short succinct context to situate it within the overall document "
+        "for the purposes of improving search retrieval of the chunk. "
+        f'Respond with JSON: {{"contexts": [...]}} containing exactly {len(chunks)} strings, in chunk index order.'
+    )
+
+
+def pack_chunk_groups(chunks: List[str]) -> List[List[int]]:
+    """Group chunk indices of one document into requests bounded by count and tokens."""
+    groups: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, chunk in enumerate(chunks):
+        tokens = count_tokens(chunk)
+        if current and (
+            len(current) >= CONTEXTUAL_CHUNKS_PER_REQUEST
+            or current_tokens + tokens > CONTEXTUAL_MAX_CHUNK_TOKENS
+        ):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def _situate_one(client: AsyncOpenAI, model: str, document_block: str, chunk: str) -> Tuple[str, bool]:
+    try:
+        async with _semaphore:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": _single_prompt(document_block, chunk)},
+                ],
+                temperature=0.3,
+                max_tokens=CONTEXT_MAX_TOKENS,
+            )
+        context = response.choices[0].message.content.strip()
+        return f"{context}\n---\n{chunk}", True
+    except Exception as e:
+        logger.warning(f"Error generating contextual embedding: {e}. Using original chunk instead.")
+        return chunk, False
+
+
+async def _situate_group(client: AsyncOpenAI, model: str, document_block: str, chunks: List[str]) -> List[Tuple[str, bool]]:
+    if len(chunks) == 1:
+        return [await _situate_one(client, model, document_block, chunks[0])]
+
+    try:
+        async with _semaphore:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": _batch_prompt(document_block, chunks)},
+                ],
+                temperature=0.3,
+                max_tokens=CONTEXT_MAX_TOKENS * len(chunks),
+                response_format={"type": "json_object"},
+            )
+        contexts = json.loads(response.choices[0].message.content).get("contexts")
+        if not isinstance(contexts, list) or len(contexts) != len(chunks):
+            raise ValueError(f"expected {len(chunks)} contexts, got {len(contexts) if isinstance(contexts, list) else 'none'}")
+        return [(f"{str(context).strip()}\n---\n{chunk}", True) for context, chunk in zip(contexts, chunks)]
+    except Exception as e:
+        logger.warning(f"Batched contextualisation failed ({e}); retrying chunks individually")
+        return list(await asyncio.gather(*[
+            _situate_one(client, model, document_block, chunk) for chunk in chunks
+        ]))
+
+
+async def contextualize_chunks(
+    urls: List[str],
+    chunks: List[str],
+    url_to_full_document: Dict[str, str],
+    api_key: str,
+    model: str,
+) -> List[Tuple[str, bool]]:
+    """
+    Prefix each chunk with a short LLM-written context about its document.
+
+    Args:
+        urls: Source URL of each chunk
+        chunks: Chunk texts
+        url_to_full_document: Full markdown per URL
+        api_key: OpenAI API key
+        model: Chat model to use
+
+    Returns:
+        (text to embed, contextualised?) aligned with chunks; failures keep the raw chunk
+    """
+    if not chunks:
+        return []
+
+    client = _get_client(api_key)
+
+    by_document: Dict[str, List[int]] = {}
+    for i, url in enumerate(urls):
+        by_document.setdefault(url, []).append(i)
+
+    async def situate_document(url: str, indices: List[int]) -> List[Tuple[str, bool]]:
+        document_block = _document_block(url_to_full_document.get(url, ""))
+        doc_chunks = [chunks[i] for i in indices]
+        groups = [[doc_chunks[g] for g in group] for group in pack_chunk_groups(doc_chunks)]
+        # First request writes the provider's prefix cache; the rest can then hit it
+        outcome = await _situate_group(client, model, document_block, groups[0])
+        for rest in await asyncio.gather(*[
+            _situate_group(client, model, document_block, group) for group in groups[1:]
+        ]):
+            outcome.extend(rest)
+        return outcome
+
+    documents = list(by_document.items())
+    outcomes = await asyncio.gather(*[situate_document(url, indices) for url, indices in documents])
+
+    results: List[Optional[Tuple[str, bool]]] = [None] * len(chunks)
+    for (_, indices), outcome in zip(documents, outcomes):
+        for i, result in zip(indices, outcome):
+            results[i] = result
+    return results
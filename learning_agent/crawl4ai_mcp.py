@@ -14,41 +14,61 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from sentence_transformers import CrossEncoder
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
-from urllib.parse import urlparse, urldefrag
-from xml.etree import ElementTree
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 from pathlib import Path
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-import requests
 import asyncio
 import json
 import os
-import re
-import concurrent.futures
+import time
 import uvicorn
 import uuid
 import logging
 import httpx
 
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode, MemoryAdaptiveDispatcher
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode, MemoryAdaptiveDispatcher, RateLimiter
 
 from utils import (
     add_documents_to_supabase as add_documents_to_db,
     search_documents,
     extract_code_blocks,
-    generate_code_example_summary,
     add_code_examples_to_supabase as add_code_examples_to_db,
     update_source_info,
-    extract_source_summary,
+    queue_source_summary,
     search_code_examples,
     ApiKeyRequiredError,
+    SEARCH_MODES,
+    DEFAULT_SEARCH_MODE,
 )
 
 # Neo4j driver for AWS services knowledge graph
 from neo4j import AsyncGraphDatabase
 
+# Page fingerprints for incremental recrawls
+import recrawl
+
+# Streaming crawl -> chunk -> embed -> write -> graph pipeline
+from crawl_pipeline import CrawlPipeline
+
+# Single-pass, token-aware markdown chunking
+from markdown_chunker import chunk_markdown, chunk_size_to_tokens
+
+# Async streaming sitemap parser
+from sitemap import fetch_sitemap_urls
+
+# Persistent, resumable URL frontier for recursive crawls
+from crawl_frontier import MemoryFrontier, RedisFrontier, FRONTIER_BATCH_SIZE, CRAWL_MAX_PAGES
+
+# Precompiled AWS service matcher and batched (UNWIND) graph writes
+from service_graph import ServiceGraphWriter, extract_page_graph, write_page_graphs
+
+# Batched cross-encoder reranking and in-process metrics
+import metrics
+from reranker import RerankService, RERANK_OVERFETCH
+
 # Redis-based job queue with rate limiting
 from redis_jobs import (
     create_crawl_job as redis_create_job,
@@ -56,11 +76,29 @@ from redis_jobs import (
     update_crawl_job as redis_update_job,
     check_tenant_rate_limit,
     get_tenant_crawl_stats,
-    list_tenant_jobs
+    list_tenant_jobs,
+    count_tenant_jobs,
+    enqueue_crawl_job,
+    heartbeat_crawl_jobs,
+    job_is_live,
+    publish_job_event,
+    get_job_manager,
+    JOB_HEARTBEAT_SECONDS,
+    TERMINAL_JOB_STATUSES
 )
 
-# OpenAI for chat agent
-from openai import OpenAI, AsyncOpenAI
+# "inline" runs crawls as API background tasks; "worker" queues them for crawl_worker.py
+CRAWL_EXECUTION = os.getenv("CRAWL_EXECUTION", "inline")
+
+# OpenAI for chat agent (clients shared per API key)
+from openai import AsyncOpenAI
+from openai_clients import get_async_client
+
+# Cached tenant/user AI config (invalidated across workers via Redis)
+import ai_config
+
+# Token-budgeted chat history (rolling window + running summary)
+from chat_history import HistoryState, compact_history, compress_tool_result
 
 # ============================================
 # OPENAI MODEL CONFIGURATION
@@ -115,14 +153,10 @@ AVAILABLE_MODELS = {
 # Default model when tenant hasn't configured one
 DEFAULT_MODEL = "gpt-4.1"
 
-# Cache for tenant OpenAI clients (tenant_id -> AsyncOpenAI)
-_tenant_clients: Dict[str, AsyncOpenAI] = {}
-
-
 async def get_tenant_openai_config(tenant_id: str) -> Optional[Dict[str, Any]]:
-    """Get tenant's OpenAI configuration from database."""
+    """Get tenant's OpenAI configuration (cached, see ai_config.py)."""
     try:
-        config = await db.get_tenant_ai_config(tenant_id)
+        config = await ai_config.get_tenant_ai_config(tenant_id)
         return config
     except Exception as e:
         logger.warning(f"Failed to get tenant AI config: {e}")
@@ -150,7 +184,7 @@ async def get_openai_client_for_tenant(
     # Try user-level config first
     if user_id:
         try:
-            user_config = await db.get_user_ai_config(user_id)
+            user_config = await ai_config.get_user_ai_config(user_id)
             if user_config and user_config.get("openai_api_key"):
                 api_key = user_config["openai_api_key"]
                 model = user_config.get("preferred_model", DEFAULT_MODEL)
@@ -161,7 +195,7 @@ async def get_openai_client_for_tenant(
     # Try tenant-level config
     if not api_key and tenant_id:
         try:
-            tenant_config = await db.get_tenant_ai_config(tenant_id)
+            tenant_config = await ai_config.get_tenant_ai_config(tenant_id)
             if tenant_config and tenant_config.get("openai_api_key"):
                 api_key = tenant_config["openai_api_key"]
                 model = tenant_config.get("preferred_model", DEFAULT_MODEL)
@@ -179,12 +213,8 @@ async def get_openai_client_for_tenant(
     if model not in AVAILABLE_MODELS:
         model = DEFAULT_MODEL
     
-    # Create or get cached client
-    cache_key = f"{tenant_id or 'system'}:{user_id or 'default'}:{api_key[:8]}"
-    if cache_key not in _tenant_clients:
-        _tenant_clients[cache_key] = AsyncOpenAI(api_key=api_key)
-    
-    return _tenant_clients[cache_key], model
+    # Shared client for this key (see openai_clients.py)
+    return get_async_client(api_key), model
 
 
 # Agent prompts
@@ -243,80 +273,6 @@ def format_neo4j_error(error: Exception) -> str:
     else:
         return f"Neo4j error: {str(error)}"
 
-# AWS Services list for extraction
-AWS_SERVICES = {
-    # Compute
-    "EC2": "Compute", "Lambda": "Compute", "ECS": "Compute", "EKS": "Compute", 
-    "Fargate": "Compute", "Lightsail": "Compute", "Batch": "Compute", "Elastic Beanstalk": "Compute",
-    "App Runner": "Compute", "Outposts": "Compute",
-    # Storage
-    "S3": "Storage", "EBS": "Storage", "EFS": "Storage", "FSx": "Storage", 
-    "Storage Gateway": "Storage", "Backup": "Storage", "Snow Family": "Storage",
-    # Database
-    "RDS": "Database", "DynamoDB": "Database", "Aurora": "Database", "ElastiCache": "Database",
-    "Neptune": "Database", "DocumentDB": "Database", "Keyspaces": "Database", "QLDB": "Database",
-    "Timestream": "Database", "MemoryDB": "Database", "Redshift": "Database",
-    # Networking
-    "VPC": "Networking", "CloudFront": "Networking", "Route 53": "Networking", 
-    "API Gateway": "Networking", "Direct Connect": "Networking", "Global Accelerator": "Networking",
-    "Transit Gateway": "Networking", "PrivateLink": "Networking", "App Mesh": "Networking",
-    "Cloud Map": "Networking", "ELB": "Networking", "ALB": "Networking", "NLB": "Networking",
-    # Security
-    "IAM": "Security", "Cognito": "Security", "Secrets Manager": "Security", 
-    "KMS": "Security", "CloudHSM": "Security", "WAF": "Security", "Shield": "Security",
-    "GuardDuty": "Security", "Inspector": "Security", "Macie": "Security",
-    "Security Hub": "Security", "Detective": "Security", "Firewall Manager": "Security",
-    # Management
-    "CloudWatch": "Management", "CloudTrail": "Management", "Config": "Management",
-    "Systems Manager": "Management", "CloudFormation": "Management", "Service Catalog": "Management",
-    "Trusted Advisor": "Management", "Control Tower": "Management", "Organizations": "Management",
-    "License Manager": "Management", "Cost Explorer": "Management",
-    # Migration
-    "Migration Hub": "Migration", "Application Migration Service": "Migration", 
-    "Database Migration Service": "Migration", "DMS": "Migration", "DataSync": "Migration",
-    "Transfer Family": "Migration", "Snow Family": "Migration", "Application Discovery Service": "Migration",
-    # Analytics
-    "Athena": "Analytics", "EMR": "Analytics", "Kinesis": "Analytics", "QuickSight": "Analytics",
-    "Data Pipeline": "Analytics", "Glue": "Analytics", "Lake Formation": "Analytics",
-    "MSK": "Analytics", "OpenSearch": "Analytics", "Elasticsearch": "Analytics",
-    # AI/ML
-    "SageMaker": "AI/ML", "Rekognition": "AI/ML", "Comprehend": "AI/ML", "Polly": "AI/ML",
-    "Transcribe": "AI/ML", "Translate": "AI/ML", "Lex": "AI/ML", "Personalize": "AI/ML",
-    "Forecast": "AI/ML", "Textract": "AI/ML", "Bedrock": "AI/ML", "CodeWhisperer": "AI/ML",
-    # Integration
-    "SQS": "Integration", "SNS": "Integration", "EventBridge": "Integration", 
-    "Step Functions": "Integration", "MQ": "Integration", "AppFlow": "Integration",
-    # Developer Tools
-    "CodeCommit": "Developer Tools", "CodeBuild": "Developer Tools", "CodeDeploy": "Developer Tools",
-    "CodePipeline": "Developer Tools", "CodeArtifact": "Developer Tools", "X-Ray": "Developer Tools",
-    "Cloud9": "Developer Tools", "CloudShell": "Developer Tools",
-}
-
-# Common relationship patterns between AWS services
-AWS_RELATIONSHIP_PATTERNS = [
-    # Compute relationships
-    (["Lambda"], ["S3", "DynamoDB", "SQS", "SNS", "API Gateway", "EventBridge", "Kinesis"], "TRIGGERS"),
-    (["EC2", "ECS", "EKS"], ["ELB", "ALB", "NLB"], "BEHIND"),
-    (["EC2", "ECS", "EKS", "Lambda"], ["RDS", "Aurora", "DynamoDB", "ElastiCache"], "CONNECTS_TO"),
-    (["EC2", "ECS", "EKS"], ["EBS", "EFS"], "USES_STORAGE"),
-    # Storage relationships
-    (["S3"], ["CloudFront"], "DISTRIBUTED_BY"),
-    (["S3"], ["Lambda", "Glue", "Athena"], "TRIGGERS"),
-    # Database relationships
-    (["RDS", "Aurora"], ["Secrets Manager"], "STORES_CREDENTIALS_IN"),
-    (["DynamoDB"], ["DAX"], "CACHED_BY"),
-    # Security relationships
-    (["EC2", "ECS", "EKS", "Lambda", "RDS"], ["IAM"], "AUTHENTICATED_BY"),
-    (["Secrets Manager", "KMS"], ["RDS", "Aurora", "S3", "EBS"], "ENCRYPTS"),
-    (["CloudFront", "ALB", "API Gateway"], ["WAF"], "PROTECTED_BY"),
-    # Monitoring relationships
-    (["EC2", "ECS", "EKS", "Lambda", "RDS", "DynamoDB"], ["CloudWatch"], "MONITORED_BY"),
-    (["CloudWatch"], ["SNS"], "ALERTS_VIA"),
-    # Migration relationships
-    (["Migration Hub"], ["Application Migration Service", "Database Migration Service", "DMS"], "TRACKS"),
-    (["DMS"], ["RDS", "Aurora", "DynamoDB", "Redshift"], "MIGRATES_TO"),
-]
-
 # Default tenant ID for Neo4j (Community Edition - single DB, use tenant_id property)
 DEFAULT_TENANT_ID = "cmiq0pitp0001w5fml5rwn1xe"  # Anais Solutions
 
@@ -325,91 +281,18 @@ async def extract_aws_services_to_neo4j(content: str, source_url: str, neo4j_dri
     
     Multi-tenant isolation: All nodes have tenant_id property for filtering.
     Community Edition doesn't support multiple databases, so we use property-based isolation.
+    Crawl jobs batch many pages per write with ServiceGraphWriter; this writes one page.
     """
     if not neo4j_driver:
         return {"extracted": 0, "relationships": 0}
     
-    tenant_id = tenant_id or DEFAULT_TENANT_ID
-    
-    # Find all mentioned services
-    mentioned_services = set()
-    content_lower = content.lower()
-    
-    for service, category in AWS_SERVICES.items():
-        # Check for service name (case insensitive)
-        if service.lower() in content_lower:
-            mentioned_services.add(service)
-        # Also check for "AWS <service>" pattern
-        if f"aws {service.lower()}" in content_lower:
-            mentioned_services.add(service)
-        # Check for "Amazon <service>" pattern
-        if f"amazon {service.lower()}" in content_lower:
-            mentioned_services.add(service)
-    
-    if not mentioned_services:
+    page = extract_page_graph(content, source_url)
+    if not page.services:
         return {"extracted": 0, "relationships": 0}
     
-    relationships_created = 0
-    
     try:
-        async with neo4j_driver.session() as session:
-            # Create/update service nodes (scoped by tenant_id)
-            for service in mentioned_services:
-                category = AWS_SERVICES.get(service, "Other")
-                await session.run("""
-                    MERGE (s:AWSService {name: $name, tenant_id: $tenant_id})
-                    SET s.category = $category,
-                        s.last_seen = datetime(),
-                        s.mention_count = COALESCE(s.mention_count, 0) + 1
-                """, name=service, category=category, tenant_id=tenant_id)
-            
-            # Create relationships based on co-occurrence and known patterns
-            service_list = list(mentioned_services)
-            for i, service1 in enumerate(service_list):
-                for service2 in service_list[i+1:]:
-                    # Check if there's a known relationship pattern
-                    for sources, targets, rel_type in AWS_RELATIONSHIP_PATTERNS:
-                        if service1 in sources and service2 in targets:
-                            await session.run(f"""
-                                MATCH (s1:AWSService {{name: $s1, tenant_id: $tenant_id}}), 
-                                      (s2:AWSService {{name: $s2, tenant_id: $tenant_id}})
-                                MERGE (s1)-[r:{rel_type}]->(s2)
-                                SET r.source_url = $url, r.updated = datetime()
-                            """, s1=service1, s2=service2, url=source_url, tenant_id=tenant_id)
-                            relationships_created += 1
-                        elif service2 in sources and service1 in targets:
-                            await session.run(f"""
-                                MATCH (s1:AWSService {{name: $s1, tenant_id: $tenant_id}}), 
-                                      (s2:AWSService {{name: $s2, tenant_id: $tenant_id}})
-                                MERGE (s1)-[r:{rel_type}]->(s2)
-                                SET r.source_url = $url, r.updated = datetime()
-                            """, s1=service2, s2=service1, url=source_url, tenant_id=tenant_id)
-                            relationships_created += 1
-                    
-                    # Also create a generic CO_MENTIONED relationship for co-occurring services
-                    await session.run("""
-                        MATCH (s1:AWSService {name: $s1, tenant_id: $tenant_id}), 
-                              (s2:AWSService {name: $s2, tenant_id: $tenant_id})
-                        MERGE (s1)-[r:CO_MENTIONED]-(s2)
-                        SET r.count = COALESCE(r.count, 0) + 1,
-                            r.last_url = $url
-                    """, s1=service1, s2=service2, url=source_url, tenant_id=tenant_id)
-            
-            # Link services to source document (scoped by tenant_id)
-            await session.run("""
-                MERGE (d:Document {url: $url, tenant_id: $tenant_id})
-                SET d.crawled_at = datetime()
-            """, url=source_url, tenant_id=tenant_id)
-            
-            for service in mentioned_services:
-                await session.run("""
-                    MATCH (s:AWSService {name: $service, tenant_id: $tenant_id}), 
-                          (d:Document {url: $url, tenant_id: $tenant_id})
-                    MERGE (d)-[:MENTIONS]->(s)
-                """, service=service, url=source_url, tenant_id=tenant_id)
-        
-        return {"extracted": len(mentioned_services), "relationships": relationships_created, "services": list(mentioned_services)}
-    
+        await write_page_graphs(neo4j_driver, [page], tenant_id or DEFAULT_TENANT_ID)
+        return {"extracted": len(page.services), "relationships": len(page.relationships), "services": page.services}
     except Exception as e:
         print(f"Error extracting AWS services to Neo4j: {e}")
         return {"extracted": 0, "relationships": 0, "error": str(e)}
@@ -687,6 +570,7 @@ class Crawl4AIContext:
     """Context for the Crawl4AI API server."""
     crawler: AsyncWebCrawler
     reranking_model: Optional[CrossEncoder] = None
+    reranker: Optional[RerankService] = None  # Batched, cached scoring over reranking_model
     neo4j_driver: Optional[Any] = None  # Neo4j driver for AWS services graph
 
 # Global context - initialized on first use
@@ -743,6 +627,7 @@ async def get_context() -> Crawl4AIContext:
         _app_context = Crawl4AIContext(
             crawler=crawler,
             reranking_model=reranking_model,
+            reranker=RerankService(reranking_model) if reranking_model else None,
             neo4j_driver=neo4j_driver
         )
     return _app_context
@@ -798,48 +683,17 @@ async def api_key_required_handler(request: Request, exc: ApiKeyRequiredError):
 async def health():
     return {"status": "ok", "service": "crawl4ai-rag"}
 
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Rolling latency percentiles (p50/p99) and counters."""
+    return metrics.snapshot()
+
 # Request models
 class ChatRequest(BaseModel):
     message: str
     conversation_history: Optional[List[Dict[str, str]]] = None
-
-def rerank_results(model: CrossEncoder, query: str, results: List[Dict[str, Any]], content_key: str = "content") -> List[Dict[str, Any]]:
-    """
-    Rerank search results using a cross-encoder model.
-    
-    Args:
-        model: The cross-encoder model to use for reranking
-        query: The search query
-        results: List of search results
-        content_key: The key in each result dict that contains the text content
-        
-    Returns:
-        Reranked list of results
-    """
-    if not model or not results:
-        return results
-    
-    try:
-        # Extract content from results
-        texts = [result.get(content_key, "") for result in results]
-        
-        # Create pairs of [query, document] for the cross-encoder
-        pairs = [[query, text] for text in texts]
-        
-        # Get relevance scores from the cross-encoder
-        scores = model.predict(pairs)
-        
-        # Add scores to results and sort by score (descending)
-        for i, result in enumerate(results):
-            result["rerank_score"] = float(scores[i])
-        
-        # Sort by rerank score
-        reranked = sorted(results, key=lambda x: x.get("rerank_score", 0), reverse=True)
-        
-        return reranked
-    except Exception as e:
-        print(f"Error during reranking: {e}")
-        return results
+    history_summary: Optional[str] = None  # Summary of turns dropped from conversation_history
 
 def is_sitemap(url: str) -> bool:
     """
@@ -865,105 +719,18 @@ def is_txt(url: str) -> bool:
     """
     return url.endswith('.txt')
 
-def parse_sitemap(sitemap_url: str) -> List[str]:
-    """
-    Parse a sitemap and extract URLs.
-    
-    Args:
-        sitemap_url: URL of the sitemap
-        
-    Returns:
-        List of URLs found in the sitemap
-    """
-    resp = requests.get(sitemap_url)
-    urls = []
-
-    if resp.status_code == 200:
-        try:
-            tree = ElementTree.fromstring(resp.content)
-            urls = [loc.text for loc in tree.findall('.//{*}loc')]
-        except Exception as e:
-            print(f"Error parsing sitemap XML: {e}")
-
-    return urls
-
-def smart_chunk_markdown(text: str, chunk_size: int = 5000) -> List[str]:
-    """Split text into chunks, respecting code blocks and paragraphs."""
-    chunks = []
-    start = 0
-    text_length = len(text)
-
-    while start < text_length:
-        # Calculate end position
-        end = start + chunk_size
-
-        # If we're at the end of the text, just take what's left
-        if end >= text_length:
-            chunks.append(text[start:].strip())
-            break
-
-        # Try to find a code block boundary first (```)
-        chunk = text[start:end]
-        code_block = chunk.rfind('```')
-        if code_block != -1 and code_block > chunk_size * 0.3:
-            end = start + code_block
-
-        # If no code block, try to break at a paragraph
-        elif '\n\n' in chunk:
-            # Find the last paragraph break
-            last_break = chunk.rfind('\n\n')
-            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_break
-
-        # If no paragraph break, try to break at a sentence
-        elif '. ' in chunk:
-            # Find the last sentence break
-            last_period = chunk.rfind('. ')
-            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_period + 1
-
-        # Extract chunk and clean it up
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-
-        # Move start position for next chunk
-        start = end
-
-    return chunks
-
-def extract_section_info(chunk: str) -> Dict[str, Any]:
+async def parse_sitemap(sitemap_url: str, since: Optional[str] = None) -> List[str]:
     """
-    Extracts headers and stats from a chunk.
+    Parse a sitemap (following sitemap indexes) and extract URLs.
     
     Args:
-        chunk: Markdown chunk
+        sitemap_url: URL of the sitemap or sitemap index (.xml or .xml.gz)
+        since: Only include pages whose lastmod is at or after this ISO date
         
     Returns:
-        Dictionary with headers and stats
+        Deduplicated list of URLs found in the sitemap
     """
-    headers = re.findall(r'^(#+)\s+(.+)$', chunk, re.MULTILINE)
-    header_str = '; '.join([f'{h[0]} {h[1]}' for h in headers]) if headers else ''
-
-    return {
-        "headers": header_str,
-        "char_count": len(chunk),
-        "word_count": len(chunk.split())
-    }
-
-def process_code_example(args):
-    """
-    Process a single code example to generate its summary.
-    This function is designed to be used with concurrent.futures.
-    
-    Args:
-        args: Tuple containing (code, context_before, context_after)
-        
-    Returns:
-        The generated summary
-    """
-    code, context_before, context_after = args
-    return generate_code_example_summary(code, context_before, context_after)
+    return await fetch_sitemap_urls(sitemap_url, since=since)
 
 @app.post("/api/crawl/single")
 async def crawl_single_page(url: str) -> str:
@@ -983,8 +750,8 @@ async def crawl_single_page(url: str) -> str:
             parsed_url = urlparse(url)
             source_id = parsed_url.netloc or parsed_url.path
             
-            # Chunk the content
-            chunks = smart_chunk_markdown(result.markdown)
+            # Chunk the content (section metadata comes from the same pass)
+            chunks = chunk_markdown(result.markdown, max_tokens=chunk_size_to_tokens(5000))
             
             # Prepare data for database
             urls = []
@@ -996,10 +763,9 @@ async def crawl_single_page(url: str) -> str:
             for i, chunk in enumerate(chunks):
                 urls.append(url)
                 chunk_numbers.append(i)
-                contents.append(chunk)
+                contents.append(chunk.text)
                 
-                # Extract metadata
-                meta = extract_section_info(chunk)
+                meta = dict(chunk.metadata)
                 meta["chunk_index"] = i
                 meta["url"] = url
                 meta["source"] = source_id
@@ -1012,50 +778,19 @@ async def crawl_single_page(url: str) -> str:
             # Create url_to_full_document mapping
             url_to_full_document = {url: result.markdown}
             
-            # Update source information FIRST (before inserting documents)
-            source_summary = extract_source_summary(result.markdown[:5000])
-            await update_source_info(source_id, source_summary, total_word_count)
+            # Source row first; its summary is generated in the background
+            await update_source_info(source_id, None, total_word_count)
             
             # Add documentation chunks to database (AFTER source exists)
             await add_documents_to_db(urls, chunk_numbers, contents, metadatas, url_to_full_document)
+            await queue_source_summary(source_id, result.markdown)
             
-            # Extract and process code examples only if enabled
+            # Extract and process code examples only if enabled (summaries are queued)
+            code_blocks = []
             extract_code_examples = os.getenv("USE_AGENTIC_RAG", "false") == "true"
             if extract_code_examples:
                 code_blocks = extract_code_blocks(result.markdown)
                 if code_blocks:
-                    code_urls = []
-                    code_chunk_numbers = []
-                    code_examples = []
-                    code_summaries = []
-                    code_metadatas = []
-                    
-                    # Process code examples in parallel
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                        # Prepare arguments for parallel processing
-                        summary_args = [(block['code'], block['context_before'], block['context_after']) 
-                                        for block in code_blocks]
-                        
-                        # Generate summaries in parallel
-                        summaries = list(executor.map(process_code_example, summary_args))
-                    
-                    # Prepare code example data
-                    for i, (block, summary) in enumerate(zip(code_blocks, summaries)):
-                        code_urls.append(url)
-                        code_chunk_numbers.append(i)
-                        code_examples.append(block['code'])
-                        code_summaries.append(summary)
-                        
-                        # Create metadata for code example
-                        code_meta = {
-                            "chunk_index": i,
-                            "url": url,
-                            "source": source_id,
-                            "char_count": len(block['code']),
-                            "word_count": len(block['code'].split())
-                        }
-                        code_metadatas.append(code_meta)
-                    
                     # Add code examples to database
                     await add_code_examples_to_db(url, code_blocks, source_id)
             
@@ -1094,9 +829,26 @@ async def crawl_single_page(url: str) -> str:
             "error": str(e)
         }, indent=2)
 
-async def _execute_crawl_job(job_id: str, url: str, max_depth: int, max_concurrent: int, chunk_size: int, tenant_id: str = None):
-    """Background task to execute the actual crawling work."""
+async def _execute_crawl_job(job_id: str, url: str, max_depth: int, max_concurrent: int, chunk_size: int, tenant_id: str = None, incremental: bool = False, max_pages: int = CRAWL_MAX_PAGES, since: Optional[str] = None):
+    """Background task to execute the actual crawling work.
+    
+    Pages stream through crawl -> chunk -> embed -> write -> graph stages
+    (see crawl_pipeline.py), so chunks are searchable while the crawl runs and
+    per-page progress is written to the job record.
+    
+    With incremental=True, pages whose markdown hash (or HTTP validators, for
+    sitemaps) match the stored fingerprint are skipped entirely, and changed
+    pages only re-embed chunks whose content differs from the previous crawl.
+    
+    Recursive crawls keep their frontier in Redis (see crawl_frontier.py) until
+    the job completes, so a failed or interrupted job can be resumed with
+    POST /api/crawl/resume/{job_id}.
+    
+    For sitemaps, since= limits the crawl to pages whose <lastmod> is at or
+    after that date (scheduled recrawls).
+    """
     tenant_id = tenant_id or DEFAULT_TENANT_ID
+    frontier = None
     
     # Mark job as running
     await update_crawl_job(job_id, "running")
@@ -1106,128 +858,156 @@ async def _execute_crawl_job(job_id: str, url: str, max_depth: int, max_concurre
         crawler = ctx.crawler
         
         # Determine the crawl strategy
-        crawl_results = []
+        pages = None
         crawl_type = None
+        pages_probed_unchanged = 0
+        pages_removed = 0
         
         if is_txt(url):
-            crawl_results = await crawl_markdown_file(crawler, url)
+            async def markdown_file_pages():
+                for page in await crawl_markdown_file(crawler, url):
+                    yield page
+            pages = markdown_file_pages()
             crawl_type = "text_file"
         elif is_sitemap(url):
-            sitemap_urls = parse_sitemap(url)
-            if not sitemap_urls:
+            sitemap_urls = await parse_sitemap(url, since=since)
+            if not sitemap_urls and not since:
                 await update_crawl_job(job_id, "failed", error="No URLs found in sitemap")
                 return
-            crawl_results = await crawl_batch(crawler, sitemap_urls, max_concurrent=max_concurrent)
+            if incremental:
+                # Skip fetching pages whose validators still match, drop pages that are gone.
+                # Pages merely missing from this sitemap are kept: the host may have other
+                # sitemaps, or pages from recursive and single-page crawls.
+                known = await db.get_page_fingerprints(sitemap_urls)
+                probe = await recrawl.probe_unchanged(sitemap_urls, known, max_concurrent=max_concurrent * 2)
+                pages_probed_unchanged = len(probe["unchanged"])
+                for removed_url in probe["gone"]:
+                    await db.delete_crawled_page(removed_url)
+                pages_removed = len(probe["gone"])
+                sitemap_urls = probe["changed"]
+            pages = stream_crawl_batch(crawler, sitemap_urls, max_concurrent=max_concurrent)
             crawl_type = "sitemap"
         else:
-            crawl_results = await crawl_recursive_internal_links(crawler, [url], max_depth=max_depth, max_concurrent=max_concurrent)
+            frontier = RedisFrontier(job_id, max_pages=max_pages)
+            pages = stream_crawl_recursive_internal_links(
+                crawler, [url], max_depth=max_depth, max_concurrent=max_concurrent, frontier=frontier
+            )
             crawl_type = "webpage"
         
-        if not crawl_results:
-            await update_crawl_job(job_id, "failed", error="No content found")
-            return
+        def chunk_page(markdown: str):
+            return [(chunk.text, chunk.metadata) for chunk in chunk_markdown(markdown, max_tokens=chunk_size_to_tokens(chunk_size))]
         
-        # Process results and store in database
-        urls = []
-        chunk_numbers = []
-        contents = []
-        metadatas = []
-        chunk_count = 0
-        code_examples = []
-        
-        # Track sources and their content
-        source_content_map = {}
-        source_word_counts = {}
-        
-        # Process documentation chunks
-        for doc in crawl_results:
-            source_url = doc['url']
-            md = doc['markdown']
-            chunks = smart_chunk_markdown(md, chunk_size=chunk_size)
-            
-            parsed_url = urlparse(source_url)
-            source_id = parsed_url.netloc or parsed_url.path
-            
-            if source_id not in source_content_map:
-                source_content_map[source_id] = md[:5000]
-                source_word_counts[source_id] = 0
-            
-            for i, chunk in enumerate(chunks):
-                urls.append(source_url)
-                chunk_numbers.append(i)
-                contents.append(chunk)
-                
-                meta = extract_section_info(chunk)
-                meta["chunk_index"] = i
-                meta["url"] = source_url
-                meta["source"] = source_id
-                meta["crawl_type"] = crawl_type
-                meta["crawl_time"] = datetime.utcnow().isoformat()
-                meta["tenant_id"] = tenant_id
-                metadatas.append(meta)
-                
-                source_word_counts[source_id] += meta.get("word_count", 0)
-                chunk_count += 1
+        extract_code_examples_enabled = os.getenv("USE_AGENTIC_RAG", "false") == "true"
         
-        # Create url_to_full_document mapping
-        url_to_full_document = {doc['url']: doc['markdown'] for doc in crawl_results}
+        graph_writer = ServiceGraphWriter(ctx.neo4j_driver, tenant_id or DEFAULT_TENANT_ID) if ctx.neo4j_driver else None
         
-        # Update source information (with tenant_id)
-        for source_id, content in source_content_map.items():
-            summary = extract_source_summary(content)
-            word_count = source_word_counts.get(source_id, 0)
-            await update_source_info(source_id, summary, word_count, tenant_id)
+        async def graph_stage(page) -> Dict[str, int]:
+            outcome = {"code_examples": 0, "services": 0, "relationships": 0}
+            if extract_code_examples_enabled:
+                code_blocks = extract_code_blocks(page.markdown)
+                if code_blocks:
+                    await add_code_examples_to_db(page.url, code_blocks, page.source_id, tenant_id)
+                    outcome["code_examples"] = len(code_blocks)
+            if graph_writer:
+                extraction_result = await graph_writer.add(page.markdown, page.url)
+                outcome["services"] = extraction_result.get("extracted", 0)
+                outcome["relationships"] = extraction_result.get("relationships", 0)
+            return outcome
+        
+        async def report_progress(progress: Dict[str, Any]) -> None:
+            await redis_update_job(job_id, progress=progress)
+        
+        async def report_event(event: Dict[str, Any]) -> None:
+            await publish_job_event(job_id, event)
+        
+        pipeline = CrawlPipeline(
+            crawl_type=crawl_type,
+            tenant_id=tenant_id,
+            chunker=chunk_page,
+            incremental=incremental,
+            graph_stage=graph_stage if (extract_code_examples_enabled or ctx.neo4j_driver) else None,
+            on_progress=report_progress,
+            on_event=report_event,
+        )
+        stats = await pipeline.run(pages)
+        if graph_writer:
+            await graph_writer.flush()
+        pages_skipped = stats["pages_skipped"] + pages_probed_unchanged
         
-        # Add documentation chunks to database (with tenant_id)
-        await add_documents_to_db(urls, chunk_numbers, contents, metadatas, url_to_full_document, tenant_id)
+        # Nothing changed since the cutoff is a successful no-op for scheduled recrawls
+        if not stats["pages_crawled"] and not (pages_skipped or pages_removed or since):
+            await update_crawl_job(job_id, "failed", error="No content found")
+            return
         
-        # Extract and process code examples if enabled
-        extract_code_examples_enabled = os.getenv("USE_AGENTIC_RAG", "false") == "true"
-        if extract_code_examples_enabled:
-            for doc in crawl_results:
-                doc_url = doc['url']
-                parsed = urlparse(doc_url)
-                doc_source_id = parsed.netloc or parsed.path
-                doc_code_blocks = extract_code_blocks(doc['markdown'])
-                if doc_code_blocks:
-                    code_examples.extend(doc_code_blocks)
-                    await add_code_examples_to_db(doc_url, doc_code_blocks, doc_source_id, tenant_id)
-        
-        # Extract AWS services to Neo4j (with tenant_id)
-        neo4j_stats = {"total_services": 0, "total_relationships": 0}
-        if ctx.neo4j_driver:
-            for doc in crawl_results:
-                extraction_result = await extract_aws_services_to_neo4j(
-                    doc['markdown'], doc['url'], ctx.neo4j_driver, tenant_id
-                )
-                neo4j_stats["total_services"] += extraction_result.get("extracted", 0)
-                neo4j_stats["total_relationships"] += extraction_result.get("relationships", 0)
+        # Word counts now; summaries are generated off the critical path (enrichment queue)
+        for source_id, content in pipeline.source_samples.items():
+            await update_source_info(source_id, None, pipeline.source_word_counts[source_id], tenant_id)
+            await queue_source_summary(source_id, content)
         
-        # Calculate total word count
-        total_words = sum(source_word_counts.values())
+        total_words = sum(pipeline.source_word_counts.values())
         
         # Update job with success result
         await update_crawl_job(job_id, "completed", result={
             "url": url,
             "crawl_type": crawl_type,
-            "pages_crawled": len(crawl_results),
-            "chunks_stored": chunk_count,
-            "code_examples_stored": len(code_examples),
-            "sources_updated": len(source_content_map),
+            "incremental": incremental,
+            "since": since,
+            "pages_crawled": stats["pages_crawled"],
+            "pages_skipped": pages_skipped,
+            "pages_updated": stats["pages_updated"],
+            "pages_removed": pages_removed,
+            "chunks_stored": stats["chunks_stored"],
+            "code_examples_stored": stats["code_examples_stored"],
+            "sources_updated": len(pipeline.source_samples),
             "total_words": total_words,
-            "aws_services_extracted": neo4j_stats["total_services"],
-            "aws_relationships_created": neo4j_stats["total_relationships"],
-            "urls_crawled": [doc['url'] for doc in crawl_results][:10],
+            "aws_services_extracted": stats["aws_services_extracted"],
+            "aws_relationships_created": stats["aws_relationships_created"],
+            "embedding_cache_hits": stats["embedding_cache_hits"],
+            "embedding_cache_misses": stats["embedding_cache_misses"],
+            "elapsed_seconds": stats["elapsed_seconds"],
+            "stages": stats["stages"],
+            "urls_crawled": pipeline.crawled_urls[:10],
+            "max_pages": max_pages,
             "tenant_id": tenant_id
         })
+        if frontier:
+            await frontier.clear()
         
-        print(f"✓ Crawl job {job_id} completed: {len(crawl_results)} pages, {chunk_count} chunks, {total_words} words (tenant: {tenant_id})")
+        print(f"✓ Crawl job {job_id} completed: {stats['pages_crawled']} pages ({stats['pages_updated']} updated, {pages_skipped} skipped, {pages_removed} removed), {stats['chunks_stored']} chunks, {total_words} words in {stats['elapsed_seconds']}s (tenant: {tenant_id})")
         
     except Exception as e:
         await update_crawl_job(job_id, "failed", error=str(e))
         print(f"✗ Crawl job {job_id} failed: {str(e)}")
 
 
+async def run_crawl_job(job: Dict[str, Any]) -> None:
+    """Execute a stored crawl job with its saved parameters."""
+    params = job.get("params") or {}
+    await _execute_crawl_job(
+        job["id"], job["url"],
+        params.get("max_depth", 3), params.get("max_concurrent", 10), params.get("chunk_size", 5000),
+        job.get("tenant_id"), params.get("incremental", False), params.get("max_pages", CRAWL_MAX_PAGES), params.get("since")
+    )
+
+
+async def run_inline_crawl_job(job: Dict[str, Any]) -> None:
+    """Run a crawl job in this process, heartbeating like a crawl worker so resume can tell it is alive."""
+    
+    async def heartbeat():
+        while True:
+            try:
+                await heartbeat_crawl_jobs([job["id"]])
+            except Exception as e:
+                logger.warning(f"Heartbeat failed for crawl job {job['id']}: {e}")
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+    
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        await run_crawl_job(job)
+    finally:
+        heartbeat_task.cancel()
+
+
 @app.post("/api/crawl/smart")
 async def smart_crawl_url(
     background_tasks: BackgroundTasks,
@@ -1235,7 +1015,10 @@ async def smart_crawl_url(
     max_depth: int = 3, 
     max_concurrent: int = 10, 
     chunk_size: int = 5000,
-    tenant_id: str = None
+    tenant_id: str = None,
+    incremental: bool = False,
+    max_pages: int = CRAWL_MAX_PAGES,
+    since: str = None
 ) -> Dict[str, Any]:
     """
     Start an async crawl job. Returns immediately with job ID.
@@ -1246,7 +1029,11 @@ async def smart_crawl_url(
     - Max 20 crawls per hour
     
     Args:
+        chunk_size: Target chunk size in characters (converted to a token budget)
         tenant_id: Tenant ID for multi-tenant isolation
+        incremental: Skip unchanged pages and only re-embed changed chunks
+        max_pages: Page budget for recursive crawls (0 = unlimited)
+        since: Sitemaps only - crawl pages with lastmod at or after this ISO date
     """
     tenant_id = tenant_id or DEFAULT_TENANT_ID
     
@@ -1254,7 +1041,7 @@ async def smart_crawl_url(
     job_result = await create_crawl_job(
         url=url, 
         tenant_id=tenant_id,
-        params={"max_depth": max_depth, "max_concurrent": max_concurrent, "chunk_size": chunk_size}
+        params={"max_depth": max_depth, "max_concurrent": max_concurrent, "chunk_size": chunk_size, "incremental": incremental, "max_pages": max_pages, "since": since}
     )
     
     # Check if rate limited
@@ -1268,8 +1055,11 @@ async def smart_crawl_url(
     job = job_result["job"]
     job_id = job["id"]
     
-    # Start background task
-    background_tasks.add_task(_execute_crawl_job, job_id, url, max_depth, max_concurrent, chunk_size, tenant_id)
+    # Hand off to a crawl worker, or run in this process
+    if CRAWL_EXECUTION == "worker":
+        await enqueue_crawl_job(job_id)
+    else:
+        background_tasks.add_task(run_inline_crawl_job, job)
     
     return {
         "success": True,
@@ -1278,10 +1068,99 @@ async def smart_crawl_url(
         "url": url,
         "tenant_id": tenant_id,
         "status": "queued",
-        "check_status_url": f"/api/crawl/status/{job_id}"
+        "check_status_url": f"/api/crawl/status/{job_id}",
+        "stream_url": f"/api/crawl/stream/{job_id}"
+    }
+
+
+@app.post("/api/crawl/resume/{job_id}")
+async def resume_crawl_job(background_tasks: BackgroundTasks, job_id: str) -> Dict[str, Any]:
+    """
+    Resume a failed or interrupted crawl job from its last checkpointed depth.
+    
+    Recursive crawls pick up their Redis frontier; other crawl types simply
+    re-run (page upserts are idempotent). A running job can only be resumed
+    once its runner (crawl worker or API process) stops heartbeating.
+    """
+    job = await get_crawl_job(job_id)
+    if not job:
+        return {"success": False, "error": f"Job '{job_id}' not found"}
+    if job["status"] not in ("failed", "running"):
+        return {"success": False, "error": f"Job '{job_id}' is {job['status']} and cannot be resumed"}
+    
+    # Two runs on one frontier would duplicate pages and overrun the page budget
+    if job_is_live(job):
+        runner = f" on {job['worker']}" if job.get("worker") else ""
+        return {"success": False, "error": f"Job '{job_id}' is still running{runner}"}
+    
+    if CRAWL_EXECUTION == "worker":
+        await enqueue_crawl_job(job_id)
+    else:
+        background_tasks.add_task(run_inline_crawl_job, job)
+    
+    return {
+        "success": True,
+        "message": "Crawl resumed from its last checkpoint.",
+        "job_id": job_id,
+        "url": job["url"],
+        "tenant_id": job.get("tenant_id"),
+        "status": "queued",
+        "check_status_url": f"/api/crawl/status/{job_id}",
+        "stream_url": f"/api/crawl/stream/{job_id}"
     }
 
 
+@app.get("/api/crawl/stream/{job_id}")
+async def stream_crawl_progress(job_id: str):
+    """
+    Live crawl progress with SSE (instead of polling /api/crawl/status).
+    
+    Sends a snapshot of the job first, then its events as they happen:
+    page, page_skipped, embedded, written, error, progress (counters and
+    per-stage throughput) and status. The stream ends when the job
+    completes or fails.
+    """
+    
+    async def event_stream():
+        manager = await get_job_manager()
+        events = manager.job_events(job_id)
+        try:
+            # Subscribe before reading the snapshot so no event is missed
+            await events.__anext__()
+            job = await manager.get_job(job_id)
+            if not job:
+                yield f"data: {json.dumps({'type': 'error', 'message': f'Job {job_id} not found'})}\n\n"
+                return
+            
+            snapshot = {key: job.get(key) for key in ("status", "progress", "result", "error", "started_at", "completed_at")}
+            yield f"data: {json.dumps({'type': 'snapshot', 'job_id': job_id, **snapshot})}\n\n"
+            if job["status"] in TERMINAL_JOB_STATUSES:
+                return
+            
+            async for event in events:
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+                if event.get("type") == "status" and event.get("status") in TERMINAL_JOB_STATUSES:
+                    return
+        except Exception as e:
+            logger.error(f"Crawl progress stream error: {e}")
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        finally:
+            await events.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
 @app.get("/api/crawl/status/{job_id}")
 async def get_crawl_status(job_id: str) -> Dict[str, Any]:
     """Check the status of a crawl job."""
@@ -1320,10 +1199,12 @@ async def get_crawl_status(job_id: str) -> Dict[str, Any]:
 
 
 @app.get("/api/crawl/jobs")
-async def list_crawl_jobs_endpoint(tenant_id: str = None) -> Dict[str, Any]:
-    """List crawl jobs for a tenant (recent first)."""
+async def list_crawl_jobs_endpoint(tenant_id: str = None, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """List crawl jobs for a tenant (recent first, paginated)."""
     tenant_id = tenant_id or DEFAULT_TENANT_ID
-    jobs = await list_tenant_jobs(tenant_id, limit=20)
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    jobs = await list_tenant_jobs(tenant_id, limit=limit, offset=offset)
     
     return {
         "success": True,
@@ -1336,6 +1217,8 @@ async def list_crawl_jobs_endpoint(tenant_id: str = None) -> Dict[str, Any]:
             "tenant_id": j.get("tenant_id")
         } for j in jobs],
         "count": len(jobs),
+        "total": await count_tenant_jobs(tenant_id),
+        "offset": offset,
         "tenant_id": tenant_id
     }
 
@@ -1380,22 +1263,29 @@ async def get_available_sources(tenant_id: str = None) -> str:
         }, indent=2)
 
 @app.post("/api/search")
-async def perform_rag_query(query: str, source: str = None, match_count: int = 5) -> str:
-    """Perform a RAG query on the stored content."""
+async def perform_rag_query(query: str, source: str = None, match_count: int = 5, recall: str = None, search_mode: str = None) -> str:
+    """
+    Perform a RAG query on the stored content.
+    
+    recall: fast | balanced | exact
+    search_mode: vector | lexical | hybrid (vector + full-text fused with RRF)
+    """
     try:
         ctx = await get_context()
+        search_mode = search_mode or DEFAULT_SEARCH_MODE
+        use_reranking = os.getenv("USE_RERANKING", "false") == "true" and ctx.reranker is not None
         
-        # Vector search
+        # Over-fetch candidates when reranking, then keep the best match_count
         results = await search_documents(
             query=query,
             source_id=source if source and source.strip() else None,
-            match_count=match_count
+            match_count=match_count * RERANK_OVERFETCH if use_reranking else match_count,
+            recall=recall,
+            search_mode=search_mode
         )
         
-        # Apply reranking if enabled
-        use_reranking = os.getenv("USE_RERANKING", "false") == "true"
-        if use_reranking and ctx.reranking_model:
-            results = rerank_results(ctx.reranking_model, query, results, content_key="content")
+        if use_reranking:
+            results = await ctx.reranker.rerank(query, results, content_key="content", top_k=match_count)
         
         # Format the results
         formatted_results = []
@@ -1406,6 +1296,10 @@ async def perform_rag_query(query: str, source: str = None, match_count: int = 5
                 "metadata": result.get("metadata"),
                 "similarity": result.get("similarity")
             }
+            # Include lexical / fused scores if available
+            for score_key in ("lexical_score", "rrf_score"):
+                if score_key in result:
+                    formatted_result[score_key] = result[score_key]
             # Include rerank score if available
             if "rerank_score" in result:
                 formatted_result["rerank_score"] = result["rerank_score"]
@@ -1415,8 +1309,8 @@ async def perform_rag_query(query: str, source: str = None, match_count: int = 5
             "success": True,
             "query": query,
             "source_filter": source,
-            "search_mode": "vector",
-            "reranking_applied": use_reranking and ctx.reranking_model is not None,
+            "search_mode": search_mode,
+            "reranking_applied": use_reranking,
             "results": formatted_results,
             "count": len(formatted_results)
         }, indent=2)
@@ -1448,6 +1342,11 @@ CHAT_TOOLS = [
                     "source": {
                         "type": "string",
                         "description": "Optional: filter by source domain (e.g., 'docs.aws.amazon.com')"
+                    },
+                    "search_mode": {
+                        "type": "string",
+                        "enum": list(SEARCH_MODES),
+                        "description": "Optional: 'hybrid' for queries with exact identifiers (CLI commands, API actions), 'vector' for conceptual questions, 'lexical' for exact-term lookups"
                     }
                 },
                 "required": ["query"]
@@ -1650,6 +1549,9 @@ CHAT_TOOLS = [
     }
 ]
 
+# Tool names get their own latency metric; anything else the model invents is pooled
+CHAT_TOOL_NAMES = {tool["function"]["name"] for tool in CHAT_TOOLS}
+
 
 async def execute_tool(tool_name: str, tool_args: dict) -> str:
     """Execute a tool and return the result as a string."""
@@ -1658,7 +1560,8 @@ async def execute_tool(tool_name: str, tool_args: dict) -> str:
             results = await search_documents(
                 query=tool_args.get("query", ""),
                 source_id=tool_args.get("source"),
-                match_count=5
+                match_count=5,
+                search_mode=tool_args.get("search_mode")
             )
             if results:
                 formatted = []
@@ -1765,125 +1668,215 @@ async def execute_tool(tool_name: str, tool_args: dict) -> str:
         return f"Error executing {tool_name}: {str(e)}"
 
 
-@app.post("/api/chat")
-async def chat(request: ChatRequest) -> Dict[str, Any]:
+# Agent loop limits: model turns that may call tools, and seconds per tool call
+CHAT_MAX_TOOL_ITERATIONS = int(os.getenv("CHAT_MAX_TOOL_ITERATIONS", "5"))
+CHAT_TOOL_TIMEOUT = float(os.getenv("CHAT_TOOL_TIMEOUT", "60"))
+
+
+async def _run_tool_call(tool_call: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute one tool call under CHAT_TOOL_TIMEOUT; failures become the tool's result."""
+    tool_name = tool_call["function"]["name"]
+    start = time.perf_counter()
+    try:
+        tool_args = json.loads(tool_call["function"]["arguments"] or "{}")
+    except json.JSONDecodeError as e:
+        tool_args = {}
+        result = f"Error executing {tool_name}: invalid arguments ({e})"
+    else:
+        try:
+            result = await asyncio.wait_for(execute_tool(tool_name, tool_args), timeout=CHAT_TOOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.increment("chat_tool_timeouts")
+            result = f"Error executing {tool_name}: timed out after {CHAT_TOOL_TIMEOUT:g}s"
+    metric = tool_name if tool_name in CHAT_TOOL_NAMES else "unknown"
+    metrics.observe(f"chat_tool.{metric}", time.perf_counter() - start)
+    return {"id": tool_call["id"], "tool": tool_name, "args": tool_args, "result": result}
+
+
+async def run_chat_agent(
+    client: AsyncOpenAI,
+    model: str,
+    messages: List[Dict[str, Any]],
+    query: str = ""
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    Chat with the CloudMigrate AI assistant.
+    Async tool loop behind /api/chat and /api/chat/stream.
     
-    Args:
-        request: ChatRequest with message and optional conversation_history
+    Each model turn is streamed; tool calls of a turn run concurrently. After
+    CHAT_MAX_TOOL_ITERATIONS turns with tool calls the model must answer
+    without tools.
     
-    Returns:
-        JSON with the assistant's response and updated conversation history
+    Args:
+        client: Shared AsyncOpenAI client
+        model: Chat model
+        messages: System, history and user messages (extended in place)
+        query: User message tool results are trimmed against
+    
+    Yields:
+        Events: content (token delta), tool_calls, tool_result, turn
+        (latency and token usage of one model turn) and finally done
     """
-    try:
-        message = request.message
-        conversation_history = request.conversation_history
-        
-        # Get API key from request context (set by endpoint) - no env fallback
-        from utils import get_request_api_key
-        api_key = get_request_api_key()
-        if not api_key:
-            raise ApiKeyRequiredError(
-                "OpenAI API key required. Please configure your API key in Settings."
-            )
-        
-        client = OpenAI(api_key=api_key)
-        from utils import get_request_model
-        model = get_request_model()
-        
-        # Build messages array
-        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-        
-        # Add conversation history if provided
-        if conversation_history:
-            messages.extend(conversation_history)
-        
-        # Add current user message
-        messages.append({"role": "user", "content": message})
+    tools_used = []
+    turns = []
+    
+    for iteration in range(CHAT_MAX_TOOL_ITERATIONS + 1):
+        start = time.perf_counter()
+        first_token = None
+        content = []
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        usage = None
         
-        # Initial API call with tools
-        response = client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model=model,
             messages=messages,
             tools=CHAT_TOOLS,
-            tool_choice="auto",
+            tool_choice="auto" if iteration < CHAT_MAX_TOOL_ITERATIONS else "none",
             temperature=0.7,
-            max_tokens=2000
+            max_tokens=2000,
+            stream=True,
+            stream_options={"include_usage": True}
         )
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                content.append(delta.content)
+                yield {"type": "content", "content": delta.content}
+            # Tool calls arrive in fragments keyed by index
+            for fragment in delta.tool_calls or []:
+                call = tool_calls.setdefault(fragment.index, {
+                    "id": None, "type": "function", "function": {"name": "", "arguments": ""}
+                })
+                if fragment.id:
+                    call["id"] = fragment.id
+                if fragment.function:
+                    call["function"]["name"] += fragment.function.name or ""
+                    call["function"]["arguments"] += fragment.function.arguments or ""
+        
+        model_seconds = time.perf_counter() - start
+        calls = [tool_calls[index] for index in sorted(tool_calls)]
+        turn = {
+            "turn": iteration + 1,
+            "latency_ms": round(model_seconds * 1000, 1),
+            "first_token_ms": round(first_token * 1000, 1) if first_token is not None else None,
+            "prompt_tokens": usage.prompt_tokens if usage else None,
+            "completion_tokens": usage.completion_tokens if usage else None,
+            "tool_calls": len(calls),
+        }
+        metrics.observe("chat_turn", model_seconds)
+        if first_token is not None:
+            metrics.observe("chat_first_token", first_token)
+        if usage:
+            metrics.increment("chat_prompt_tokens", usage.prompt_tokens)
+            metrics.increment("chat_completion_tokens", usage.completion_tokens)
+        
+        if not calls:
+            turns.append(turn)
+            yield {"type": "turn", **turn}
+            break
         
-        assistant_message = response.choices[0].message
+        yield {"type": "tool_calls", "tools": [call["function"]["name"] for call in calls]}
+        tools_start = time.perf_counter()
+        results = await asyncio.gather(*[_run_tool_call(call) for call in calls])
+        turn["tools_ms"] = round((time.perf_counter() - tools_start) * 1000, 1)
+        turns.append(turn)
+        yield {"type": "turn", **turn}
         
-        # Handle tool calls if any
-        tool_calls_made = []
-        while assistant_message.tool_calls:
-            # Process each tool call
-            tool_results = []
-            for tool_call in assistant_message.tool_calls:
-                tool_name = tool_call.function.name
-                tool_args = json.loads(tool_call.function.arguments)
-                
-                # Execute the tool
-                result = await execute_tool(tool_name, tool_args)
-                
-                tool_calls_made.append({
-                    "tool": tool_name,
-                    "args": tool_args,
-                    "result_preview": result[:200] + "..." if len(result) > 200 else result
-                })
-                
-                tool_results.append({
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "content": result
-                })
-            
-            # Add assistant message with tool calls to messages
+        messages.append({"role": "assistant", "content": "".join(content) or None, "tool_calls": calls})
+        for result in results:
+            preview = result["result"][:200] + "..." if len(result["result"]) > 200 else result["result"]
+            tools_used.append({"tool": result["tool"], "args": result["args"], "result_preview": preview})
+            yield {"type": "tool_result", "tool": result["tool"], "result_preview": preview}
             messages.append({
-                "role": "assistant",
-                "content": assistant_message.content,
-                "tool_calls": [
-                    {
-                        "id": tc.id,
-                        "type": "function",
-                        "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments
-                        }
-                    }
-                    for tc in assistant_message.tool_calls
-                ]
+                "tool_call_id": result["id"],
+                "role": "tool",
+                "content": compress_tool_result(result["result"], query)
             })
-            
-            # Add tool results
-            messages.extend(tool_results)
-            
-            # Get next response
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                tools=CHAT_TOOLS,
-                tool_choice="auto",
-                temperature=0.7,
-                max_tokens=2000
-            )
-            
-            assistant_message = response.choices[0].message
-        
-        # Final response
-        final_content = assistant_message.content or "I apologize, but I couldn't generate a response."
+    
+    yield {
+        "type": "done",
+        "response": "".join(content) or "I apologize, but I couldn't generate a response.",
+        "tools_used": tools_used,
+        "turns": turns,
+        "usage": {
+            "prompt_tokens": sum(t["prompt_tokens"] or 0 for t in turns),
+            "completion_tokens": sum(t["completion_tokens"] or 0 for t in turns),
+        },
+    }
+
+
+async def _chat_context(request: ChatRequest, client: AsyncOpenAI, model: str) -> Tuple[List[Dict[str, Any]], HistoryState]:
+    """
+    Prompt messages for a chat request: system prompt, the client's history
+    compacted to its token budget, and the new message.
+    
+    Returns:
+        (messages, state); the client's history minus the first
+        state.summarized_count messages is the window it should send next time
+    """
+    history = request.conversation_history or []
+    window, state = await compact_history(history, HistoryState(summary=request.history_summary or ""), client, model)
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, *window]
+    messages.append({"role": "user", "content": request.message})
+    return messages, state
+
+
+def _chat_client() -> AsyncOpenAI:
+    # Get API key from request context (set by endpoint) - no env fallback
+    from utils import get_request_api_key
+    api_key = get_request_api_key()
+    if not api_key:
+        raise ApiKeyRequiredError(
+            "OpenAI API key required. Please configure your API key in Settings."
+        )
+    return get_async_client(api_key)
+
+
+def _updated_history(request: ChatRequest, state: HistoryState, response: str) -> Dict[str, Any]:
+    """Conversation history (the verbatim window) and summary for the client, with this exchange appended."""
+    updated_history = (request.conversation_history or [])[state.summarized_count:]
+    updated_history.append({"role": "user", "content": request.message})
+    updated_history.append({"role": "assistant", "content": response})
+    return {"conversation_history": updated_history, "history_summary": state.summary or None}
+
+
+@app.post("/api/chat")
+async def chat(request: ChatRequest) -> Dict[str, Any]:
+    """
+    Chat with the CloudMigrate AI assistant.
+    
+    Args:
+        request: ChatRequest with message, optional conversation_history and
+            the history_summary returned by the previous call
+    
+    Returns:
+        JSON with the assistant's response, updated conversation history
+        (older turns are folded into history_summary once the history
+        exceeds its token budget) and per-turn latency and token usage
+    """
+    try:
+        client = _chat_client()
+        from utils import get_request_model
+        model = get_request_model()
         
-        # Build updated conversation history for the client
-        updated_history = conversation_history or []
-        updated_history.append({"role": "user", "content": message})
-        updated_history.append({"role": "assistant", "content": final_content})
+        messages, state = await _chat_context(request, client, model)
+        async for event in run_chat_agent(client, model, messages, query=request.message):
+            if event["type"] == "done":
+                result = event
         
         return {
             "success": True,
-            "response": final_content,
-            "tools_used": tool_calls_made,
-            "conversation_history": updated_history,
-            "model": model
+            "response": result["response"],
+            "tools_used": result["tools_used"],
+            **_updated_history(request, state, result["response"]),
+            "model": model,
+            "turns": result["turns"],
+            "usage": result["usage"]
         }
     
     except Exception as e:
@@ -1893,6 +1886,46 @@ async def chat(request: ChatRequest) -> Dict[str, Any]:
         }
 
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Chat with the CloudMigrate AI assistant, streamed with SSE.
+    
+    Sends content events (assistant token deltas) as they are generated,
+    tool_calls / tool_result events around tool execution, a turn event with
+    latency and token usage per model turn, and finally a done event carrying
+    the same fields as the /api/chat response.
+    """
+    from utils import get_request_model
+    model = get_request_model()
+    
+    async def event_stream():
+        try:
+            client = _chat_client()
+            messages, state = await _chat_context(request, client, model)
+            async for event in run_chat_agent(client, model, messages, query=request.message):
+                if event["type"] == "done":
+                    event = {
+                        **event,
+                        **_updated_history(request, state, event["response"]),
+                        "model": model
+                    }
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}")
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
 # ============================================
 # AWS SERVICES KNOWLEDGE GRAPH ENDPOINTS
 # ============================================
@@ -2194,11 +2227,57 @@ async def crawl_markdown_file(crawler: AsyncWebCrawler, url: str) -> List[Dict[s
 
     result = await crawler.arun(url=url, config=crawl_config)
     if result.success and result.markdown:
-        return [{'url': url, 'markdown': result.markdown}]
+        return [{'url': url, 'markdown': result.markdown, 'headers': result.response_headers or {}}]
     else:
         print(f"Failed to crawl {url}: {result.error_message}")
         return []
 
+def _page_record(result) -> Dict[str, Any]:
+    """The fields the ingestion pipeline needs from a crawl result."""
+    return {'url': result.url, 'markdown': result.markdown, 'headers': result.response_headers or {}}
+
+
+# Per-host politeness: randomised delay between requests to the same host,
+# with backoff on 429/503
+CRAWL_HOST_DELAY_MIN = float(os.getenv("CRAWL_HOST_DELAY_MIN", "0.5"))
+CRAWL_HOST_DELAY_MAX = float(os.getenv("CRAWL_HOST_DELAY_MAX", "1.5"))
+
+
+def _crawl_dispatcher(max_concurrent: int) -> MemoryAdaptiveDispatcher:
+    """Memory-adaptive dispatcher with per-host rate limiting."""
+    return MemoryAdaptiveDispatcher(
+        memory_threshold_percent=70.0,
+        check_interval=1.0,
+        max_session_permit=max_concurrent,
+        rate_limiter=RateLimiter(
+            base_delay=(CRAWL_HOST_DELAY_MIN, CRAWL_HOST_DELAY_MAX),
+            max_delay=60.0,
+            max_retries=3,
+            rate_limit_codes=[429, 503],
+        ),
+    )
+
+
+async def stream_crawl_batch(crawler: AsyncWebCrawler, urls: List[str], max_concurrent: int = 10) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Crawl multiple URLs in parallel, yielding each page as soon as it finishes.
+    
+    Args:
+        crawler: AsyncWebCrawler instance
+        urls: List of URLs to crawl
+        max_concurrent: Maximum number of concurrent browser sessions
+        
+    Yields:
+        Dictionaries with URL, markdown content and response headers
+    """
+    crawl_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=True)
+    dispatcher = _crawl_dispatcher(max_concurrent)
+
+    async for result in await crawler.arun_many(urls=urls, config=crawl_config, dispatcher=dispatcher):
+        if result.success and result.markdown:
+            yield _page_record(result)
+
+
 async def crawl_batch(crawler: AsyncWebCrawler, urls: List[str], max_concurrent: int = 10) -> List[Dict[str, Any]]:
     """
     Batch crawl multiple URLs in parallel.
@@ -2211,15 +2290,72 @@ async def crawl_batch(crawler: AsyncWebCrawler, urls: List[str], max_concurrent:
     Returns:
         List of dictionaries with URL and markdown content
     """
-    crawl_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
-    dispatcher = MemoryAdaptiveDispatcher(
-        memory_threshold_percent=70.0,
-        check_interval=1.0,
-        max_session_permit=max_concurrent
-    )
+    return [page async for page in stream_crawl_batch(crawler, urls, max_concurrent)]
+
+
+async def stream_crawl_recursive_internal_links(
+    crawler: AsyncWebCrawler,
+    start_urls: List[str],
+    max_depth: int = 3,
+    max_concurrent: int = 10,
+    frontier: Optional[MemoryFrontier] = None,
+    max_pages: int = 0,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Recursively crawl internal links from start URLs up to a maximum depth,
+    yielding each page as soon as it finishes.
+    
+    Discovered URLs are canonicalised and deduplicated by the frontier and
+    crawled in batches of FRONTIER_BATCH_SIZE, so memory stays bounded by the
+    batch rather than the site. With a RedisFrontier the crawl resumes from
+    the last checkpointed depth, skipping URLs already crawled.
+    
+    Args:
+        crawler: AsyncWebCrawler instance
+        start_urls: List of starting URLs
+        max_depth: Maximum recursion depth
+        max_concurrent: Maximum number of concurrent browser sessions
+        frontier: URL frontier (defaults to an in-memory one)
+        max_pages: Page budget for the default frontier (0 = unlimited)
+        
+    Yields:
+        Dictionaries with URL, markdown content and response headers
+    """
+    run_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=True)
+    dispatcher = _crawl_dispatcher(max_concurrent)
+    frontier = frontier or MemoryFrontier(max_pages)
+
+    depth = await frontier.start(start_urls)
+    pages = await frontier.pages_emitted()
+
+    while depth < max_depth and not frontier.budget_exhausted(pages):
+        while True:
+            batch_size = FRONTIER_BATCH_SIZE
+            if frontier.max_pages:
+                batch_size = min(batch_size, frontier.max_pages - pages)
+            batch = await frontier.pending(depth, batch_size)
+            if not batch:
+                break
+
+            next_level_urls = set()
+            async for result in await crawler.arun_many(urls=batch, config=run_config, dispatcher=dispatcher):
+                if result.success and result.markdown:
+                    if depth + 1 < max_depth:
+                        next_level_urls.update(link["href"] for link in result.links.get("internal", []))
+                    pages = await frontier.count_page()
+                    yield _page_record(result)
+
+            # Queue children before completing the batch so a crash in between loses nothing
+            if next_level_urls:
+                await frontier.add(depth + 1, next_level_urls)
+            await frontier.complete(depth, batch)
+
+            if frontier.budget_exhausted(pages):
+                return
+
+        depth += 1
+        await frontier.checkpoint(depth)
 
-    results = await crawler.arun_many(urls=urls, config=crawl_config, dispatcher=dispatcher)
-    return [{'url': r.url, 'markdown': r.markdown} for r in results if r.success and r.markdown]
 
 async def crawl_recursive_internal_links(crawler: AsyncWebCrawler, start_urls: List[str], max_depth: int = 3, max_concurrent: int = 10) -> List[Dict[str, Any]]:
     """
@@ -2234,43 +2370,10 @@ async def crawl_recursive_internal_links(crawler: AsyncWebCrawler, start_urls: L
     Returns:
         List of dictionaries with URL and markdown content
     """
-    run_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, stream=False)
-    dispatcher = MemoryAdaptiveDispatcher(
-        memory_threshold_percent=70.0,
-        check_interval=1.0,
-        max_session_permit=max_concurrent
-    )
-
-    visited = set()
-
-    def normalize_url(url):
-        return urldefrag(url)[0]
-
-    current_urls = set([normalize_url(u) for u in start_urls])
-    results_all = []
-
-    for depth in range(max_depth):
-        urls_to_crawl = [normalize_url(url) for url in current_urls if normalize_url(url) not in visited]
-        if not urls_to_crawl:
-            break
-
-        results = await crawler.arun_many(urls=urls_to_crawl, config=run_config, dispatcher=dispatcher)
-        next_level_urls = set()
-
-        for result in results:
-            norm_url = normalize_url(result.url)
-            visited.add(norm_url)
-
-            if result.success and result.markdown:
-                results_all.append({'url': result.url, 'markdown': result.markdown})
-                for link in result.links.get("internal", []):
-                    next_url = normalize_url(link["href"])
-                    if next_url not in visited:
-                        next_level_urls.add(next_url)
-
-        current_urls = next_level_urls
-
-    return results_all
+    return [
+        page async for page in
+        stream_crawl_recursive_internal_links(crawler, start_urls, max_depth, max_concurrent)
+    ]
 
 
 # ============================================
@@ -2404,7 +2507,7 @@ def get_async_openai(api_key: Optional[str] = None) -> AsyncOpenAI:
         raise ApiKeyRequiredError(
             "OpenAI API key required. Please configure your API key in Settings."
         )
-    return AsyncOpenAI(api_key=key)
+    return get_async_client(key)
 
 
 # ============================================
@@ -2584,9 +2687,10 @@ async def get_coaching_response(
     message: str,
     scenario: Optional[CloudScenario] = None,
     challenge_id: Optional[str] = None,
-    context: Optional[Dict[str, Any]] = None
+    context: Optional[Dict[str, Any]] = None,
+    history: Optional[List[Dict[str, str]]] = None
 ) -> str:
-    """Get a coaching response for the user's message"""
+    """Get a coaching response for the user's message (history: compacted earlier turns)"""
     
     context_parts = []
     
@@ -2617,6 +2721,7 @@ CURRENT CONTEXT:
         response = await async_chat_completion(
             messages=[
                 {"role": "system", "content": system_prompt},
+                *(history or []),
                 {"role": "user", "content": message},
             ],
             model="gpt-4o",
@@ -2836,10 +2941,9 @@ async def generate_scenario_stream_endpoint(request: LocationRequest):
                     kb_query = f"{research.company_info.industry} {skill_context} AWS architecture"
                 
                 # Get embedding for the query
-                from openai import AsyncOpenAI
                 from utils import get_request_api_key
                 
-                client = AsyncOpenAI(api_key=get_request_api_key())
+                client = get_async_client(get_request_api_key())
                 embed_response = await client.embeddings.create(
                     model="text-embedding-3-small",
                     input=kb_query
@@ -2987,6 +3091,22 @@ async def learning_chat_endpoint(request: LearningChatRequestWithSession):
             if scenario_data:
                 scenario = CloudScenario(**scenario_data)
         
+        # Earlier turns within the token budget; the summary of older ones lives on the session
+        history = None
+        if request.session_id:
+            try:
+                stored = await db.get_coaching_history_state(session_id)
+                state = HistoryState(summary=stored["summary"], summarized_count=0)
+                history, new_state = await compact_history(stored["messages"], state, get_async_openai(), "gpt-4o")
+                if new_state.summarized_count:
+                    await db.save_coaching_history_summary(
+                        session_id,
+                        new_state.summary,
+                        stored["summarized_count"] + new_state.summarized_count,
+                    )
+            except Exception as db_err:
+                logger.warning(f"Failed to load session history: {db_err}")
+        
         # Save user message to DB
         try:
             await db.save_coaching_message(
@@ -3003,7 +3123,8 @@ async def learning_chat_endpoint(request: LearningChatRequestWithSession):
             message=request.message,
             scenario=scenario,
             challenge_id=request.challenge_id,
-            context=request.context
+            context=request.context,
+            history=history
         )
         
         # Save assistant response to DB
@@ -3272,7 +3393,7 @@ async def audit_diagram_endpoint(request: AuditDiagramRequest):
         if not api_key:
             raise HTTPException(status_code=402, detail="OpenAI API key required. Please configure your API key in Settings.")
         
-        client = AsyncOpenAI(api_key=api_key)
+        client = get_async_client(api_key)
         model = get_request_model() or "gpt-4o"
         
         # Call OpenAI for structured audit
@@ -4146,11 +4267,7 @@ async def update_tenant_ai_config_endpoint(tenant_id: str, request: UpdateAIConf
     )
     
     if success:
-        # Clear cached client for this tenant
-        keys_to_remove = [k for k in _tenant_clients.keys() if k.startswith(f"{tenant_id}:")]
-        for k in keys_to_remove:
-            del _tenant_clients[k]
-        
+        await ai_config.invalidate_tenant(tenant_id)
         return {"success": True, "message": "AI configuration updated"}
     
     return {"success": False, "error": "Failed to update configuration"}
@@ -4165,11 +4282,7 @@ async def remove_tenant_api_key(tenant_id: str):
     )
     
     if success:
-        # Clear cached client
-        keys_to_remove = [k for k in _tenant_clients.keys() if k.startswith(f"{tenant_id}:")]
-        for k in keys_to_remove:
-            del _tenant_clients[k]
-        
+        await ai_config.invalidate_tenant(tenant_id)
         return {"success": True, "message": "API key removed, using system default"}
     
     return {"success": False, "error": "Failed to remove API key"}
@@ -4213,11 +4326,7 @@ async def update_user_ai_config_endpoint(user_id: str, request: UpdateAIConfigRe
     )
     
     if success:
-        # Clear cached client for this user
-        keys_to_remove = [k for k in _tenant_clients.keys() if f":{user_id}:" in k]
-        for k in keys_to_remove:
-            del _tenant_clients[k]
-        
+        await ai_config.invalidate_user(user_id)
         return {"success": True, "message": "AI configuration updated"}
     
     return {"success": False, "error": "Failed to update configuration"}
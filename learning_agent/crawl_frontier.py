@@ -0,0 +1,200 @@
+"""
+Crawl Frontier
+==============
+URL frontier for recursive crawls: canonicalisation, dedupe, per-depth
+pending sets, a max-pages budget and crash-resume.
+
+Two backends with the same interface:
+- RedisFrontier: state lives in Redis under crawl:frontier:{job_id}:*, so
+  a restarted job resumes from its last checkpointed depth and skips pages
+  already crawled
+- MemoryFrontier: in-process sets for one-off crawls (URLs only, never
+  page content)
+
+Pending URLs are removed only after they've been crawled, so a crash
+mid-batch re-crawls at most that batch (chunk upserts are idempotent).
+"""
+
+import os
+import re
+from typing import List, Dict, Set, Iterable
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from redis_jobs import get_job_manager, JOB_EXPIRY_HOURS
+
+FRONTIER_PREFIX = "crawl:frontier:"
+
+# URLs crawled per arun_many call (bounds in-flight results)
+FRONTIER_BATCH_SIZE = int(os.getenv("FRONTIER_BATCH_SIZE", "50"))
+
+# Default page budget per crawl job (0 = unlimited)
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "5000"))
+
+# Query parameters that never change page content
+STRIPPED_QUERY_PARAMS = {
+    "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_", "ref_src",
+    "sc_channel", "sc_campaign", "sc_medium", "sc_content", "sc_country",
+    "sessionid", "sid", "phpsessid", "jsessionid",
+}
+STRIPPED_QUERY_PREFIXES = ("utm_", "trk", "_ga")
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_DUPLICATE_SLASHES = re.compile(r"/{2,}")
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Canonical form used for dedupe.
+
+    Lowercases scheme and host, drops default ports, fragments, tracking and
+    session query params, sorts remaining params, collapses duplicate
+    slashes and removes trailing slashes (except the root path).
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    path = _DUPLICATE_SLASHES.sub("/", parts.path or "/")
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/") or "/"
+
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in STRIPPED_QUERY_PARAMS
+        and not key.lower().startswith(STRIPPED_QUERY_PREFIXES)
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+class MemoryFrontier:
+    """In-process frontier (no resume)."""
+
+    def __init__(self, max_pages: int = 0):
+        self.max_pages = max_pages
+        self._seen: Set[str] = set()
+        self._pending: Dict[int, Set[str]] = {}
+        self._depth = 0
+        self._pages = 0
+
+    async def start(self, seed_urls: Iterable[str]) -> int:
+        """Seed the frontier; returns the depth to start (or resume) from."""
+        await self.add(0, seed_urls)
+        return self._depth
+
+    async def add(self, depth: int, urls: Iterable[str]) -> int:
+        """Queue unseen canonical URLs at depth; returns how many were new."""
+        new = {u for u in (canonicalize_url(u) for u in urls) if u not in self._seen}
+        self._seen |= new
+        self._pending.setdefault(depth, set()).update(new)
+        return len(new)
+
+    async def pending(self, depth: int, count: int = FRONTIER_BATCH_SIZE) -> List[str]:
+        """Up to count pending URLs at depth (left pending until complete())."""
+        pending = self._pending.get(depth, set())
+        return [url for _, url in zip(range(count), pending)]
+
+    async def complete(self, depth: int, urls: Iterable[str]) -> None:
+        """Mark URLs at depth as crawled."""
+        self._pending.get(depth, set()).difference_update(canonicalize_url(u) for u in urls)
+
+    async def checkpoint(self, depth: int) -> None:
+        """Record that every depth below this one is finished."""
+        self._depth = depth
+        self._pending.pop(depth - 1, None)
+
+    async def count_page(self) -> int:
+        """Count an emitted page; returns the running total."""
+        self._pages += 1
+        return self._pages
+
+    async def pages_emitted(self) -> int:
+        return self._pages
+
+    def budget_exhausted(self, pages: int) -> bool:
+        return bool(self.max_pages) and pages >= self.max_pages
+
+    async def clear(self) -> None:
+        self._seen.clear()
+        self._pending.clear()
+
+
+class RedisFrontier(MemoryFrontier):
+    """Redis-backed frontier keyed by crawl job id, resumable after a crash."""
+
+    def __init__(self, job_id: str, max_pages: int = 0):
+        super().__init__(max_pages)
+        self.job_id = job_id
+        self._prefix = f"{FRONTIER_PREFIX}{job_id}:"
+        self._ttl = 3600 * JOB_EXPIRY_HOURS
+
+    def _key(self, name: str) -> str:
+        return f"{self._prefix}{name}"
+
+    async def _redis(self):
+        return await (await get_job_manager()).get_redis()
+
+    async def start(self, seed_urls: Iterable[str]) -> int:
+        r = await self._redis()
+        meta = await r.hgetall(self._key("meta"))
+        if meta:
+            # Resume: seeds are already in the seen set
+            return int(meta.get("depth", 0))
+        await r.hset(self._key("meta"), mapping={"depth": 0, "pages": 0, "max_pages": self.max_pages})
+        await r.expire(self._key("meta"), self._ttl)
+        await self.add(0, seed_urls)
+        return 0
+
+    async def add(self, depth: int, urls: Iterable[str]) -> int:
+        canonical = list({canonicalize_url(u) for u in urls})
+        if not canonical:
+            return 0
+        r = await self._redis()
+        seen_key = self._key("seen")
+        pending_key = self._key(f"pending:{depth}")
+
+        async with r.pipeline(transaction=False) as pipe:
+            for url in canonical:
+                pipe.sadd(seen_key, url)
+            added = await pipe.execute()
+
+        new = [url for url, was_added in zip(canonical, added) if was_added]
+        async with r.pipeline(transaction=False) as pipe:
+            if new:
+                pipe.sadd(pending_key, *new)
+            pipe.expire(seen_key, self._ttl)
+            pipe.expire(pending_key, self._ttl)
+            await pipe.execute()
+        return len(new)
+
+    async def pending(self, depth: int, count: int = FRONTIER_BATCH_SIZE) -> List[str]:
+        r = await self._redis()
+        return await r.srandmember(self._key(f"pending:{depth}"), count) or []
+
+    async def complete(self, depth: int, urls: Iterable[str]) -> None:
+        canonical = [canonicalize_url(u) for u in urls]
+        if canonical:
+            r = await self._redis()
+            await r.srem(self._key(f"pending:{depth}"), *canonical)
+
+    async def checkpoint(self, depth: int) -> None:
+        r = await self._redis()
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key("meta"), "depth", depth)
+            pipe.delete(self._key(f"pending:{depth - 1}"))
+            await pipe.execute()
+
+    async def count_page(self) -> int:
+        r = await self._redis()
+        return await r.hincrby(self._key("meta"), "pages", 1)
+
+    async def pages_emitted(self) -> int:
+        r = await self._redis()
+        return int(await r.hget(self._key("meta"), "pages") or 0)
+
+    async def clear(self) -> None:
+        r = await self._redis()
+        keys = [key async for key in r.scan_iter(match=f"{self._prefix}*")]
+        if keys:
+            await r.delete(*keys)
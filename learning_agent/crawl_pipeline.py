@@ -0,0 +1,344 @@
+"""
+Streaming Crawl Pipeline
+========================
+crawl -> chunk -> embed -> write -> graph, connected by bounded queues.
+
+Pages move through the stages as soon as they are crawled:
+- Memory is bounded by the queue sizes, not the site size
+- Chunks become searchable while the crawl is still running
+- A slow embedding or database stage blocks the queues behind it, which
+  stops the crawler pulling more results (backpressure)
+
+Each stage records items processed and busy time; the snapshot is written
+to the job's progress after every stored page. Finer-grained events (page
+fetched, chunks embedded, rows written, errors) go to on_event as they
+happen, for live progress streams.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, Awaitable, AsyncIterator, Tuple
+from urllib.parse import urlparse
+
+import db
+import recrawl
+from utils import embed_chunk_rows
+
+logger = logging.getLogger("cloudmigrate-crawl-pipeline")
+
+# Pages buffered between stages
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+
+# Chunks grouped into one embed + write round, and concurrent embed workers
+PIPELINE_EMBED_BATCH = int(os.getenv("PIPELINE_EMBED_BATCH", "64"))
+PIPELINE_EMBED_WORKERS = int(os.getenv("PIPELINE_EMBED_WORKERS", "2"))
+
+# Characters of each source's first page kept for its summary
+SOURCE_SAMPLE_CHARS = 5000
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Items processed and time spent working (not waiting) in a stage."""
+    items: int = 0
+    busy_seconds: float = 0.0
+
+    def snapshot(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 2),
+            "items_per_sec": round(self.items / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+@dataclass
+class PageWork:
+    """A crawled page on its way through the pipeline."""
+    url: str
+    source_id: str
+    markdown: str
+    page_hash: str
+    chunk_hashes: List[str]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    chunk_numbers: List[int] = field(default_factory=list)
+    contents: List[str] = field(default_factory=list)
+    metadatas: List[Dict[str, Any]] = field(default_factory=list)
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class CrawlPipeline:
+    """
+    Run one crawl job's pages through chunking, embedding, storage and
+    graph extraction concurrently.
+
+    Args:
+        crawl_type: Recorded in chunk metadata
+        tenant_id: Tenant the job runs for
+        chunker: markdown -> [(chunk_text, section_metadata), ...]
+        incremental: Skip unchanged pages and only embed changed chunks
+        graph_stage: Optional async fn(page) -> {"code_examples", "services", "relationships"}
+        on_progress: Optional async fn(progress_dict), called after each stored page
+        on_event: Optional async fn(event_dict) for per-stage events, each with a "type":
+            page, page_skipped, embedded, written or error
+    """
+
+    def __init__(
+        self,
+        crawl_type: str,
+        tenant_id: str,
+        chunker: Callable[[str], List[Tuple[str, Dict[str, Any]]]],
+        incremental: bool = False,
+        graph_stage: Optional[Callable[[PageWork], Awaitable[Dict[str, int]]]] = None,
+        on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        embed_batch: int = PIPELINE_EMBED_BATCH,
+        embed_workers: int = PIPELINE_EMBED_WORKERS,
+    ):
+        self.crawl_type = crawl_type
+        self.tenant_id = tenant_id
+        self.chunker = chunker
+        self.incremental = incremental
+        self.graph_stage = graph_stage
+        self.on_progress = on_progress
+        self.on_event = on_event
+        self.embed_batch = embed_batch
+        self.embed_workers = embed_workers
+        self.use_contextual_embeddings = os.getenv("USE_CONTEXTUAL_EMBEDDINGS", "false") == "true"
+
+        self._chunk_q: asyncio.Queue = asyncio.Queue(queue_size)
+        self._embed_q: asyncio.Queue = asyncio.Queue(queue_size)
+        self._write_q: asyncio.Queue = asyncio.Queue(max(1, queue_size // 4))
+        self._graph_q: asyncio.Queue = asyncio.Queue(queue_size)
+
+        self.stages = {name: StageStats() for name in ("crawl", "chunk", "embed", "write", "graph")}
+        self.embedding_stats = {"embedding_cache_hits": 0, "embedding_cache_misses": 0}
+        self.pages_skipped = 0
+        self.pages_updated = 0
+        self.chunks_stored = 0
+        self.code_examples_stored = 0
+        self.services_extracted = 0
+        self.relationships_created = 0
+        self.crawled_urls: List[str] = []
+        self.source_samples: Dict[str, str] = {}
+        self.source_word_counts: Dict[str, int] = {}
+        self._known_sources: set = set()
+        self._started = 0.0
+
+    # ------------------------------------------------------------------
+    # Stages
+    # ------------------------------------------------------------------
+
+    async def _emit(self, event_type: str, **data: Any) -> None:
+        if self.on_event is None:
+            return
+        try:
+            await self.on_event({"type": event_type, **data})
+        except Exception as e:
+            # Progress reporting must never stop the crawl
+            logger.warning(f"Could not report {event_type} event: {e}")
+
+    async def _crawl(self, pages: AsyncIterator[Dict[str, Any]]) -> None:
+        async for doc in pages:
+            self.stages["crawl"].items += 1
+            self.crawled_urls.append(doc["url"])
+            await self._emit("page", url=doc["url"], pages_crawled=self.stages["crawl"].items)
+            await self._chunk_q.put(doc)
+        await self._chunk_q.put(_DONE)
+
+    async def _chunk(self) -> None:
+        stats = self.stages["chunk"]
+        while (doc := await self._chunk_q.get()) is not _DONE:
+            start = time.perf_counter()
+            page = await self._prepare_page(doc)
+            stats.busy_seconds += time.perf_counter() - start
+            if page is None:
+                self.pages_skipped += 1
+                await self._emit("page_skipped", url=doc["url"], pages_skipped=self.pages_skipped)
+                continue
+            stats.items += 1
+            await self._embed_q.put(page)
+        for _ in range(self.embed_workers):
+            await self._embed_q.put(_DONE)
+
+    async def _prepare_page(self, doc: Dict[str, Any]) -> Optional[PageWork]:
+        url = doc["url"]
+        md = doc["markdown"]
+        page_hash = recrawl.content_hash(md)
+
+        previous = None
+        if self.incremental:
+            previous = (await db.get_page_fingerprints([url])).get(url)
+            if previous and previous["content_hash"] == page_hash:
+                return None
+
+        chunks = self.chunker(md)
+        chunk_hashes = [recrawl.content_hash(text) for text, _ in chunks]
+        changed = recrawl.changed_chunk_indices(chunk_hashes, previous["chunk_hashes"] if previous else [])
+
+        parsed = urlparse(url)
+        source_id = parsed.netloc or parsed.path
+        if source_id not in self.source_samples:
+            self.source_samples[source_id] = md[:SOURCE_SAMPLE_CHARS]
+            self.source_word_counts[source_id] = 0
+        self.source_word_counts[source_id] += len(md.split())
+
+        etag, last_modified = recrawl.get_validators(doc.get("headers"))
+        page = PageWork(url, source_id, md, page_hash, chunk_hashes, etag, last_modified)
+        crawl_time = datetime.utcnow().isoformat()
+        for i in changed:
+            text, section_info = chunks[i]
+            page.chunk_numbers.append(i)
+            page.contents.append(text)
+            page.metadatas.append({
+                **section_info,
+                "chunk_index": i,
+                "url": url,
+                "source": source_id,
+                "crawl_type": self.crawl_type,
+                "crawl_time": crawl_time,
+                "tenant_id": self.tenant_id,
+            })
+        return page
+
+    async def _embed(self, remaining: List[int]) -> None:
+        stats = self.stages["embed"]
+        done = False
+        while not done:
+            first = await self._embed_q.get()
+            if first is _DONE:
+                break
+            # Group whatever is already queued, up to the batch size
+            group = [first]
+            chunk_count = len(first.contents)
+            while chunk_count < self.embed_batch and not self._embed_q.empty():
+                page = self._embed_q.get_nowait()
+                if page is _DONE:
+                    done = True
+                    break
+                group.append(page)
+                chunk_count += len(page.contents)
+
+            start = time.perf_counter()
+            urls, numbers, contents, metadatas = [], [], [], []
+            for page in group:
+                urls.extend([page.url] * len(page.contents))
+                numbers.extend(page.chunk_numbers)
+                contents.extend(page.contents)
+                metadatas.extend(page.metadatas)
+            rows = await embed_chunk_rows(
+                urls, numbers, contents, metadatas,
+                {page.url: page.markdown for page in group},
+                self.use_contextual_embeddings, self.embedding_stats
+            )
+            offset = 0
+            for page in group:
+                page.rows = rows[offset:offset + len(page.contents)]
+                offset += len(page.contents)
+            stats.items += chunk_count
+            stats.busy_seconds += time.perf_counter() - start
+            await self._emit("embedded", chunks=chunk_count, pages=len(group), chunks_embedded=stats.items)
+            await self._write_q.put(group)
+
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            await self._write_q.put(_DONE)
+
+    async def _write(self) -> None:
+        stats = self.stages["write"]
+        while (group := await self._write_q.get()) is not _DONE:
+            start = time.perf_counter()
+            new_sources = {page.source_id for page in group} - self._known_sources
+            if new_sources:
+                await db.ensure_sources(list(new_sources))
+                self._known_sources |= new_sources
+
+            rows = [row for page in group for row in page.rows]
+            written = await db.bulk_save_crawled_pages(rows)
+            self.chunks_stored += written
+            for page in group:
+                # Also trims chunks left over from a longer previous version
+                await db.save_page_fingerprint(
+                    page.url, page.source_id, page.page_hash, page.chunk_hashes,
+                    page.etag, page.last_modified
+                )
+                page.rows = []
+            stats.items += len(group)
+            stats.busy_seconds += time.perf_counter() - start
+            self.pages_updated += len(group)
+            await self._emit("written", rows=written, pages=len(group), chunks_stored=self.chunks_stored)
+
+            if self.on_progress:
+                await self.on_progress(self.progress())
+            for page in group:
+                await self._graph_q.put(page)
+        await self._graph_q.put(_DONE)
+
+    async def _graph(self) -> None:
+        stats = self.stages["graph"]
+        while (page := await self._graph_q.get()) is not _DONE:
+            if self.graph_stage is None:
+                continue
+            start = time.perf_counter()
+            try:
+                outcome = await self.graph_stage(page)
+                self.code_examples_stored += outcome.get("code_examples", 0)
+                self.services_extracted += outcome.get("services", 0)
+                self.relationships_created += outcome.get("relationships", 0)
+            except Exception as e:
+                logger.error(f"Graph stage failed for {page.url}: {e}")
+                await self._emit("error", stage="graph", url=page.url, message=str(e))
+            stats.items += 1
+            stats.busy_seconds += time.perf_counter() - start
+
+    # ------------------------------------------------------------------
+    # Orchestration
+    # ------------------------------------------------------------------
+
+    def progress(self) -> Dict[str, Any]:
+        """Per-page counters and per-stage throughput so far."""
+        elapsed = time.perf_counter() - self._started
+        return {
+            "pages_crawled": self.stages["crawl"].items,
+            "pages_skipped": self.pages_skipped,
+            "pages_stored": self.pages_updated,
+            "chunks_stored": self.chunks_stored,
+            "elapsed_seconds": round(elapsed, 2),
+            "stages": {name: s.snapshot(elapsed) for name, s in self.stages.items()},
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+
+    async def run(self, pages: AsyncIterator[Dict[str, Any]]) -> Dict[str, Any]:
+        """Stream pages through every stage; returns the final counters."""
+        self._started = time.perf_counter()
+        remaining_embed_workers = [self.embed_workers]
+        tasks = [
+            asyncio.create_task(self._crawl(pages)),
+            asyncio.create_task(self._chunk()),
+            *[asyncio.create_task(self._embed(remaining_embed_workers)) for _ in range(self.embed_workers)],
+            asyncio.create_task(self._write()),
+            asyncio.create_task(self._graph()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        return {
+            **self.progress(),
+            "pages_updated": self.pages_updated,
+            "code_examples_stored": self.code_examples_stored,
+            "aws_services_extracted": self.services_extracted,
+            "aws_relationships_created": self.relationships_created,
+            **self.embedding_stats,
+        }
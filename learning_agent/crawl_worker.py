@@ -0,0 +1,173 @@
+"""
+Crawl Worker
+============
+Runs crawl jobs outside the API process, so browser-heavy crawls don't
+compete with chat latency and survive API redeploys.
+
+- Jobs arrive on the crawl:stream Redis stream (consumer group
+  crawl-workers); start the API with CRAWL_EXECUTION=worker to queue them
+- Each worker runs up to CRAWL_WORKER_CONCURRENCY jobs and heartbeats
+  them (XCLAIM on its own pending entries + heartbeat_at on the job)
+- Entries idle for JOB_VISIBILITY_TIMEOUT (a crashed or killed worker) are
+  reclaimed with XAUTOCLAIM and run again; recursive crawls resume from
+  their Redis frontier. After CRAWL_MAX_ATTEMPTS runs the job is failed
+- On SIGTERM a worker stops reading, gives in-flight jobs
+  CRAWL_SHUTDOWN_GRACE seconds, then leaves the rest for reclaim
+
+Usage:
+    python3 crawl_worker.py [--concurrency 2]
+
+Run as many worker processes as needed; they share the consumer group.
+"""
+
+import os
+import signal
+import socket
+import asyncio
+import argparse
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple, Set
+
+from dotenv import load_dotenv
+
+# Same project-root .env as the API, loaded before modules read their settings
+load_dotenv(Path(__file__).resolve().parent.parent / ".env", override=True)
+
+from redis_jobs import (
+    get_job_manager,
+    JOB_STREAM_KEY,
+    JOB_STREAM_GROUP,
+    JOB_VISIBILITY_TIMEOUT,
+    JOB_HEARTBEAT_SECONDS,
+)
+from crawl4ai_mcp import run_crawl_job
+
+logger = logging.getLogger("cloudmigrate-crawl-worker")
+
+CRAWL_WORKER_CONCURRENCY = int(os.getenv("CRAWL_WORKER_CONCURRENCY", "2"))
+CRAWL_MAX_ATTEMPTS = int(os.getenv("CRAWL_MAX_ATTEMPTS", "3"))
+CRAWL_SHUTDOWN_GRACE = float(os.getenv("CRAWL_SHUTDOWN_GRACE", "30"))
+
+READ_BLOCK_MS = 5000
+
+
+class CrawlWorker:
+    """Consumes crawl jobs from the job stream with at-least-once delivery."""
+
+    def __init__(self, concurrency: int = CRAWL_WORKER_CONCURRENCY, consumer: str = None):
+        self.concurrency = max(1, concurrency)
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._inflight: Dict[str, str] = {}  # stream entry id -> job id
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run(self) -> None:
+        manager = await get_job_manager()
+        await manager.ensure_job_stream()
+        r = await manager.get_redis()
+        heartbeat = asyncio.create_task(self._heartbeat_loop(manager, r))
+        logger.info(f"Crawl worker {self.consumer} started (concurrency {self.concurrency})")
+
+        try:
+            while not self._stopping.is_set():
+                free = self.concurrency - len(self._inflight)
+                if free <= 0:
+                    await asyncio.wait(self._tasks, timeout=JOB_HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                try:
+                    entries = await self._reclaim(r, free) or await self._read(r, free)
+                except Exception as e:
+                    logger.error(f"Error reading crawl jobs: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for entry_id, job_id in entries:
+                    self._inflight[entry_id] = job_id
+                    task = asyncio.create_task(self._run_job(manager, r, entry_id, job_id))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        finally:
+            if self._tasks:
+                logger.info(f"Waiting up to {CRAWL_SHUTDOWN_GRACE}s for {len(self._tasks)} crawl jobs")
+                _, pending = await asyncio.wait(self._tasks, timeout=CRAWL_SHUTDOWN_GRACE)
+                # Unacknowledged entries are reclaimed by another worker
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            heartbeat.cancel()
+
+    async def _read(self, r, count: int) -> List[Tuple[str, str]]:
+        response = await r.xreadgroup(
+            JOB_STREAM_GROUP, self.consumer, {JOB_STREAM_KEY: ">"}, count=count, block=READ_BLOCK_MS
+        )
+        if not response:
+            return []
+        return [(entry_id, fields["job_id"]) for entry_id, fields in response[0][1]]
+
+    async def _reclaim(self, r, count: int) -> List[Tuple[str, str]]:
+        """Take over entries whose worker stopped heartbeating."""
+        response = await r.xautoclaim(
+            JOB_STREAM_KEY, JOB_STREAM_GROUP, self.consumer,
+            min_idle_time=JOB_VISIBILITY_TIMEOUT * 1000, start_id="0-0", count=count,
+        )
+        entries = [(entry_id, fields["job_id"]) for entry_id, fields in response[1] if fields]
+        for _, job_id in entries:
+            logger.warning(f"Reclaimed crawl job {job_id} from a lost worker")
+        return entries
+
+    async def _run_job(self, manager, r, entry_id: str, job_id: str) -> None:
+        try:
+            job = await manager.claim_job(job_id, self.consumer)
+            if job is None:
+                logger.info(f"Crawl job {job_id} is gone or already finished; dropping")
+            elif job["attempts"] > CRAWL_MAX_ATTEMPTS:
+                await manager.update_job(
+                    job_id, status="failed", error=f"Crawl worker lost {CRAWL_MAX_ATTEMPTS} times; giving up"
+                )
+            else:
+                # _execute_crawl_job records completion or failure on the job itself
+                await run_crawl_job(job)
+        except asyncio.CancelledError:
+            # Shutting down: leave the entry pending for another worker
+            self._inflight.pop(entry_id, None)
+            raise
+        except Exception as e:
+            logger.error(f"Crawl job {job_id} errored in worker: {e}")
+            await manager.update_job(job_id, status="failed", error=str(e))
+
+        self._inflight.pop(entry_id, None)
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.xack(JOB_STREAM_KEY, JOB_STREAM_GROUP, entry_id)
+            pipe.xdel(JOB_STREAM_KEY, entry_id)
+            await pipe.execute()
+
+    async def _heartbeat_loop(self, manager, r) -> None:
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            entries = dict(self._inflight)
+            if not entries:
+                continue
+            try:
+                # Resets the entries' idle time so no one reclaims them
+                await r.xclaim(JOB_STREAM_KEY, JOB_STREAM_GROUP, self.consumer, 0, list(entries), justid=True)
+                await manager.heartbeat_jobs(list(entries.values()))
+            except Exception as e:
+                logger.error(f"Crawl worker heartbeat failed: {e}")
+
+
+async def main(concurrency: int) -> None:
+    worker = CrawlWorker(concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=CRAWL_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))
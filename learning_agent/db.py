@@ -7,10 +7,13 @@ Connects to PostgreSQL via asyncpg for storing scenarios, progress, and learning
 import os
 import json
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 from datetime import datetime, timezone
 import asyncpg
 
+from pgvector_codec import register_vector_codec
+from vector_index import apply_recall
+
 logger = logging.getLogger("cloud-academy-db")
 
 # Database connection pool
@@ -33,6 +36,7 @@ async def get_pool() -> asyncpg.Pool:
             database_url,
             min_size=2,
             max_size=10,
+            init=register_vector_codec,
         )
         logger.info("Database pool created")
     return _pool
@@ -47,6 +51,28 @@ async def close_pool():
         logger.info("Database pool closed")
 
 
+# =============================================================================
+# SOURCE WRITE HOOKS - notified when a source's chunks change (cache invalidation)
+# =============================================================================
+
+_source_write_hooks: List[Callable[[str], None]] = []
+
+
+def register_source_write_hook(hook: Callable[[str], None]) -> None:
+    """Register hook(source_id), called after chunks for a source are written or deleted."""
+    if hook not in _source_write_hooks:
+        _source_write_hooks.append(hook)
+
+
+def _notify_source_write(*source_ids: str) -> None:
+    for source_id in set(source_ids):
+        for hook in _source_write_hooks:
+            try:
+                hook(source_id)
+            except Exception as e:
+                logger.warning(f"Source write hook failed for {source_id}: {e}")
+
+
 # =============================================================================
 # SCENARIOS
 # =============================================================================
@@ -1251,6 +1277,50 @@ async def get_session_history(session_id: str, limit: int = 50) -> List[dict]:
         ]
 
 
+async def get_coaching_history_state(session_id: str) -> dict:
+    """
+    Get a session's history summary and the messages it doesn't cover yet.
+
+    Returns:
+        {"summary", "summarized_count", "messages"}; messages are oldest first
+    """
+    pool = await get_pool()
+
+    async with pool.acquire() as conn:
+        session = await conn.fetchrow("""
+            SELECT "historySummary", "summarizedCount" FROM "CoachingSession"
+            WHERE id = $1
+        """, session_id)
+        summarized_count = session["summarizedCount"] if session else 0
+
+        rows = await conn.fetch("""
+            SELECT role, content FROM "CoachingMessage"
+            WHERE "sessionId" = $1
+            ORDER BY "createdAt", id
+            OFFSET $2
+        """, session_id, summarized_count)
+
+        return {
+            "summary": (session["historySummary"] if session else None) or "",
+            "summarized_count": summarized_count,
+            "messages": [{"role": row["role"], "content": row["content"]} for row in rows],
+        }
+
+
+async def save_coaching_history_summary(session_id: str, summary: str, summarized_count: int) -> None:
+    """Store a session's history summary and how many messages it covers."""
+    pool = await get_pool()
+
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE "CoachingSession"
+            SET "historySummary" = $2,
+                "summarizedCount" = $3,
+                "updatedAt" = NOW()
+            WHERE id = $1
+        """, session_id, summary, summarized_count)
+
+
 # =============================================================================
 # AWS SERVICE REFERENCE (kept for backwards compatibility)
 # =============================================================================
@@ -1358,11 +1428,6 @@ async def add_knowledge_chunk(
     """Add a knowledge chunk. Mirrors crawl4ai crawled_pages table."""
     pool = await get_pool()
     
-    # Format embedding for pgvector
-    embedding_str = None
-    if embedding:
-        embedding_str = "[" + ",".join(str(x) for x in embedding) + "]"
-    
     async with pool.acquire() as conn:
         result = await conn.fetchrow("""
             INSERT INTO "AcademyKnowledgeChunk" (
@@ -1373,44 +1438,21 @@ async def add_knowledge_chunk(
                 metadata = EXCLUDED.metadata,
                 embedding = EXCLUDED.embedding
             RETURNING id
-        """, url, chunk_number, content, json.dumps(metadata), source_id, embedding_str)
-        
-        return result["id"]
+        """, url, chunk_number, content, json.dumps(metadata), source_id, embedding or None)
+    
+    _notify_source_write(source_id)
+    return result["id"]
 
 
 async def add_knowledge_chunks_batch(
     chunks: List[dict],  # [{"url": str, "chunk_number": int, "content": str, "metadata": dict, "source_id": str, "embedding": List[float]}]
 ) -> int:
-    """Add multiple knowledge chunks in batch."""
-    pool = await get_pool()
-    count = 0
-    
-    async with pool.acquire() as conn:
-        for chunk in chunks:
-            embedding_str = None
-            if chunk.get("embedding"):
-                embedding_str = "[" + ",".join(str(x) for x in chunk["embedding"]) + "]"
-            
-            try:
-                await conn.execute("""
-                    INSERT INTO "AcademyKnowledgeChunk" (
-                        url, "chunkNumber", content, metadata, "sourceId", embedding, "createdAt"
-                    ) VALUES ($1, $2, $3, $4, $5, $6::vector, NOW())
-                    ON CONFLICT (url, "chunkNumber") DO UPDATE SET
-                        content = EXCLUDED.content,
-                        metadata = EXCLUDED.metadata,
-                        embedding = EXCLUDED.embedding
-                """, 
-                    chunk["url"],
-                    chunk["chunk_number"],
-                    chunk["content"],
-                    json.dumps(chunk.get("metadata", {})),
-                    chunk["source_id"],
-                    embedding_str,
-                )
-                count += 1
-            except Exception as e:
-                logger.error(f"Error adding chunk {chunk['url']} #{chunk['chunk_number']}: {e}")
+    """Add multiple knowledge chunks in batch (COPY-based, see bulk_save_crawled_pages)."""
+    try:
+        count = await bulk_save_crawled_pages(chunks)
+    except Exception as e:
+        logger.error(f"Error adding {len(chunks)} knowledge chunks: {e}")
+        return 0
     
     logger.info(f"Added {count} knowledge chunks")
     return count
@@ -1420,13 +1462,13 @@ async def search_knowledge_chunks(
     query_embedding: List[float],
     limit: int = 10,
     source_filter: Optional[str] = None,
+    recall: str = None,
 ) -> List[dict]:
     """Search knowledge chunks by vector similarity. Mirrors crawl4ai match_crawled_pages."""
     pool = await get_pool()
     
-    embedding_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
-    
-    async with pool.acquire() as conn:
+    async with pool.acquire() as conn, conn.transaction():
+        await apply_recall(conn, recall, limit)
         if source_filter:
             rows = await conn.fetch("""
                 SELECT id, url, "chunkNumber", content, metadata, "sourceId",
@@ -1435,7 +1477,7 @@ async def search_knowledge_chunks(
                 WHERE "sourceId" = $3
                 ORDER BY embedding <=> $1::vector
                 LIMIT $2
-            """, embedding_str, limit, source_filter)
+            """, query_embedding, limit, source_filter)
         else:
             rows = await conn.fetch("""
                 SELECT id, url, "chunkNumber", content, metadata, "sourceId",
@@ -1443,7 +1485,7 @@ async def search_knowledge_chunks(
                 FROM "AcademyKnowledgeChunk"
                 ORDER BY embedding <=> $1::vector
                 LIMIT $2
-            """, embedding_str, limit)
+            """, query_embedding, limit)
         
         return [
             {
@@ -1499,8 +1541,9 @@ async def delete_knowledge_source(source_id: str) -> bool:
         result = await conn.execute("""
             DELETE FROM "AcademyKnowledgeSource" WHERE id = $1
         """, source_id)
-        
-        return "DELETE 1" in result
+    
+    _notify_source_write(source_id)
+    return "DELETE 1" in result
 
 
 # =============================================================================
@@ -1520,10 +1563,6 @@ async def save_crawled_page(
     """Save a crawled page chunk. Maps to AcademyKnowledgeChunk."""
     pool = await get_pool()
     
-    embedding_str = None
-    if embedding:
-        embedding_str = "[" + ",".join(str(x) for x in embedding) + "]"
-    
     async with pool.acquire() as conn:
         # Ensure source exists first
         await conn.execute("""
@@ -1540,9 +1579,10 @@ async def save_crawled_page(
                 metadata = EXCLUDED.metadata,
                 embedding = EXCLUDED.embedding
             RETURNING id
-        """, url, chunk_number, content, json.dumps(metadata or {}), source_id, embedding_str)
-        
-        return result["id"]
+        """, url, chunk_number, content, json.dumps(metadata or {}), source_id, embedding or None)
+    
+    _notify_source_write(source_id)
+    return result["id"]
 
 
 async def search_crawled_pages(
@@ -1551,13 +1591,17 @@ async def search_crawled_pages(
     source_id: str = None,
     tenant_id: str = None,  # Ignored
     metadata_filter: Dict[str, Any] = None,  # Not implemented yet
+    recall: str = None,
 ) -> List[Dict[str, Any]]:
-    """Search crawled pages by vector similarity. Maps to AcademyKnowledgeChunk."""
-    pool = await get_pool()
+    """
+    Search crawled pages by vector similarity. Maps to AcademyKnowledgeChunk.
     
-    embedding_str = "[" + ",".join(str(x) for x in embedding) + "]"
+    recall: "fast", "balanced" or "exact" (see vector_index.RECALL_PROFILES)
+    """
+    pool = await get_pool()
     
-    async with pool.acquire() as conn:
+    async with pool.acquire() as conn, conn.transaction():
+        await apply_recall(conn, recall, limit)
         if source_id:
             rows = await conn.fetch("""
                 SELECT id, url, "chunkNumber" as chunk_number, content, metadata, "sourceId" as source_id,
@@ -1566,7 +1610,7 @@ async def search_crawled_pages(
                 WHERE "sourceId" = $3
                 ORDER BY embedding <=> $1::vector
                 LIMIT $2
-            """, embedding_str, limit, source_id)
+            """, embedding, limit, source_id)
         else:
             rows = await conn.fetch("""
                 SELECT id, url, "chunkNumber" as chunk_number, content, metadata, "sourceId" as source_id,
@@ -1574,7 +1618,41 @@ async def search_crawled_pages(
                 FROM "AcademyKnowledgeChunk"
                 ORDER BY embedding <=> $1::vector
                 LIMIT $2
-            """, embedding_str, limit)
+            """, embedding, limit)
+        
+        return [dict(row) for row in rows]
+
+
+# Full-text config for lexical search (must match the GIN expression index)
+FTS_CONFIG = "english"
+
+
+async def search_crawled_pages_lexical(
+    query: str,
+    limit: int = 10,
+    source_id: str = None,
+) -> List[Dict[str, Any]]:
+    """
+    Search crawled pages by full-text match (tsvector/GIN). Maps to AcademyKnowledgeChunk.
+    
+    Query terms are OR-ed and ranked with ts_rank_cd, so chunks containing more
+    of the exact identifiers (e.g. put-bucket-acl, AssumeRoleWithWebIdentity) rank first.
+    """
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            WITH q AS (
+                SELECT NULLIF(replace(plainto_tsquery('{FTS_CONFIG}', $1)::text, '&', '|'), '')::tsquery AS query
+            )
+            SELECT id, url, "chunkNumber" as chunk_number, content, metadata, "sourceId" as source_id,
+                   ts_rank_cd(to_tsvector('{FTS_CONFIG}', content), q.query) as lexical_score
+            FROM "AcademyKnowledgeChunk", q
+            WHERE to_tsvector('{FTS_CONFIG}', content) @@ q.query
+              AND ($3::text IS NULL OR "sourceId" = $3)
+            ORDER BY lexical_score DESC
+            LIMIT $2
+        """, query, limit, source_id)
         
         return [dict(row) for row in rows]
 
@@ -1599,6 +1677,303 @@ async def ensure_source(
         """, source_id, summary, word_count)
 
 
+async def ensure_sources(source_ids: List[str]) -> None:
+    """Ensure many sources exist in one statement (once per crawl job)."""
+    if not source_ids:
+        return
+    
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            INSERT INTO "AcademyKnowledgeSource" (id, "createdAt", "updatedAt")
+            SELECT DISTINCT unnest($1::text[]), NOW(), NOW()
+            ON CONFLICT (id) DO NOTHING
+        """, list(source_ids))
+
+
+# =============================================================================
+# BULK INGEST - COPY into a temp table, one merge per batch
+# =============================================================================
+
+# Rows per COPY + merge transaction
+COPY_BATCH_SIZE = int(os.getenv("COPY_BATCH_SIZE", "1000"))
+
+_CHUNK_STAGE_COLUMNS = ["url", "chunkNumber", "content", "metadata", "sourceId", "embedding"]
+
+
+async def bulk_save_crawled_pages(
+    chunks: List[dict],  # [{"url": str, "chunk_number": int, "content": str, "metadata": dict, "source_id": str, "embedding": List[float]}]
+    batch_size: int = None,
+) -> int:
+    """
+    Upsert many chunks with COPY instead of one round trip per row.
+    
+    Each batch is streamed with copy_records_to_table into a transaction-scoped
+    temp table (embeddings travel in pgvector's binary format) and merged into
+    AcademyKnowledgeChunk with a single INSERT ... SELECT ... ON CONFLICT.
+    Sources must already exist (see ensure_sources).
+    
+    Returns:
+        Number of chunks written
+    """
+    if not chunks:
+        return 0
+    
+    batch_size = batch_size or COPY_BATCH_SIZE
+    
+    # ON CONFLICT can't touch the same row twice in one statement, so last write wins here
+    rows = {}
+    for chunk in chunks:
+        embedding = chunk.get("embedding")
+        rows[(chunk["url"], chunk["chunk_number"])] = (
+            chunk["url"],
+            chunk["chunk_number"],
+            chunk["content"],
+            json.dumps(chunk.get("metadata") or {}),
+            chunk["source_id"],
+            embedding if embedding else None,
+        )
+    records = list(rows.values())
+    
+    pool = await get_pool()
+    count = 0
+    
+    async with pool.acquire() as conn:
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            async with conn.transaction():
+                await conn.execute("""
+                    CREATE TEMP TABLE _chunk_stage (
+                        url text,
+                        "chunkNumber" int,
+                        content text,
+                        metadata jsonb,
+                        "sourceId" text,
+                        embedding vector
+                    ) ON COMMIT DROP
+                """)
+                await conn.copy_records_to_table(
+                    "_chunk_stage", records=batch, columns=_CHUNK_STAGE_COLUMNS
+                )
+                await conn.execute("""
+                    INSERT INTO "AcademyKnowledgeChunk" (
+                        url, "chunkNumber", content, metadata, "sourceId", embedding, "createdAt"
+                    )
+                    SELECT url, "chunkNumber", content, metadata, "sourceId", embedding, NOW()
+                    FROM _chunk_stage
+                    ON CONFLICT (url, "chunkNumber") DO UPDATE SET
+                        content = EXCLUDED.content,
+                        metadata = EXCLUDED.metadata,
+                        embedding = EXCLUDED.embedding
+                """)
+            count += len(batch)
+    
+    _notify_source_write(*(record[4] for record in records))
+    return count
+
+
+# =============================================================================
+# CODE EXAMPLES & DEFERRED SUMMARIES - filled in later by enrichment.py
+# =============================================================================
+
+async def save_code_examples(
+    examples: List[dict],  # [{"url": str, "chunk_number": int, "content": str, "summary": str, "metadata": dict, "source_id": str, "embedding": List[float]}]
+) -> int:
+    """Upsert code examples in one pipelined round trip. Maps to AcademyCodeExample."""
+    if not examples:
+        return 0
+    
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        await conn.executemany("""
+            INSERT INTO "AcademyCodeExample" (url, "chunkNumber", content, summary, metadata, "sourceId", embedding, "createdAt")
+            VALUES ($1, $2, $3, $4, $5, $6, $7::vector, NOW())
+            ON CONFLICT (url, "chunkNumber") DO UPDATE SET
+                content = EXCLUDED.content,
+                summary = EXCLUDED.summary,
+                metadata = EXCLUDED.metadata,
+                embedding = EXCLUDED.embedding
+        """, [
+            (
+                e["url"], e["chunk_number"], e["content"], e["summary"],
+                json.dumps(e.get("metadata") or {}), e["source_id"], e.get("embedding") or None,
+            )
+            for e in examples
+        ])
+    
+    return len(examples)
+
+
+async def update_code_example_summaries(
+    updates: List[dict],  # [{"url": str, "chunk_number": int, "content": str, "summary": str, "embedding": List[float]}]
+) -> int:
+    """Store generated summaries (and summary-aware embeddings) for existing code examples.
+    
+    Rows whose content changed since the summary was requested are left alone.
+    """
+    if not updates:
+        return 0
+    
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        await conn.executemany("""
+            UPDATE "AcademyCodeExample"
+            SET summary = $4, embedding = COALESCE($5::vector, embedding)
+            WHERE url = $1 AND "chunkNumber" = $2 AND content = $3
+        """, [
+            (u["url"], u["chunk_number"], u["content"], u["summary"], u.get("embedding") or None)
+            for u in updates
+        ])
+    
+    return len(updates)
+
+
+async def update_source_summaries(summaries: Dict[str, str]) -> None:
+    """Set generated summaries for many sources in one statement."""
+    if not summaries:
+        return
+    
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE "AcademyKnowledgeSource" AS s
+            SET summary = u.summary, "updatedAt" = NOW()
+            FROM unnest($1::text[], $2::text[]) AS u(id, summary)
+            WHERE s.id = u.id
+        """, list(summaries.keys()), list(summaries.values()))
+
+
+# =============================================================================
+# PAGE FINGERPRINTS - incremental recrawl state
+# =============================================================================
+
+async def get_page_fingerprints(urls: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Get stored fingerprints (validators, page hash, chunk hashes) for URLs."""
+    if not urls:
+        return {}
+    
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT url, "sourceId", "contentHash", "chunkHashes", etag, "lastModified"
+            FROM "AcademyPageFingerprint"
+            WHERE url = ANY($1::text[])
+        """, urls)
+        
+        return {
+            row["url"]: {
+                "source_id": row["sourceId"],
+                "content_hash": row["contentHash"],
+                "chunk_hashes": json.loads(row["chunkHashes"]) if row["chunkHashes"] else [],
+                "etag": row["etag"],
+                "last_modified": row["lastModified"],
+            }
+            for row in rows
+        }
+
+
+async def save_page_fingerprint(
+    url: str,
+    source_id: str,
+    content_hash: str,
+    chunk_hashes: List[str],
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> None:
+    """Upsert a page fingerprint and drop chunks past the page's new chunk count."""
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                INSERT INTO "AcademyPageFingerprint" (
+                    url, "sourceId", "contentHash", "chunkHashes", etag, "lastModified",
+                    "crawledAt", "updatedAt"
+                ) VALUES ($1, $2, $3, $4, $5, $6, NOW(), NOW())
+                ON CONFLICT (url) DO UPDATE SET
+                    "sourceId" = EXCLUDED."sourceId",
+                    "contentHash" = EXCLUDED."contentHash",
+                    "chunkHashes" = EXCLUDED."chunkHashes",
+                    etag = EXCLUDED.etag,
+                    "lastModified" = EXCLUDED."lastModified",
+                    "crawledAt" = NOW(),
+                    "updatedAt" = NOW()
+            """, url, source_id, content_hash, json.dumps(chunk_hashes), etag, last_modified)
+            
+            # Stale trailing chunks from a previously longer version of the page
+            trimmed = await conn.execute("""
+                DELETE FROM "AcademyKnowledgeChunk"
+                WHERE url = $1 AND "chunkNumber" >= $2
+            """, url, len(chunk_hashes))
+    
+    if trimmed != "DELETE 0":
+        _notify_source_write(source_id)
+
+
+async def delete_crawled_page(url: str) -> None:
+    """Remove a page's chunks and fingerprint (page no longer exists upstream)."""
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            source_id = await conn.fetchval(
+                'SELECT "sourceId" FROM "AcademyKnowledgeChunk" WHERE url = $1 LIMIT 1', url
+            )
+            await conn.execute('DELETE FROM "AcademyKnowledgeChunk" WHERE url = $1', url)
+            await conn.execute('DELETE FROM "AcademyPageFingerprint" WHERE url = $1', url)
+    
+    if source_id:
+        _notify_source_write(source_id)
+
+
+# =============================================================================
+# EMBEDDING CACHE - content-addressed by (model, sha256(text))
+# =============================================================================
+
+async def get_cached_embeddings(model: str, content_hashes: List[str]) -> Dict[str, List[float]]:
+    """Fetch cached embeddings for a set of content hashes in one query."""
+    if not content_hashes:
+        return {}
+    
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("""
+            SELECT "contentHash", embedding
+            FROM "AcademyEmbeddingCache"
+            WHERE model = $1 AND "contentHash" = ANY($2::text[])
+        """, model, content_hashes)
+        
+        return {
+            row["contentHash"]: row["embedding"]
+            for row in rows
+            if row["embedding"]
+        }
+
+
+async def save_cached_embeddings(model: str, embeddings: Dict[str, List[float]]) -> None:
+    """Insert embeddings into the cache (content_hash -> embedding). Existing rows are kept."""
+    if not embeddings:
+        return
+    
+    pool = await get_pool()
+    
+    async with pool.acquire() as conn:
+        await conn.executemany("""
+            INSERT INTO "AcademyEmbeddingCache" (model, "contentHash", embedding, "createdAt")
+            VALUES ($1, $2, $3::vector, NOW())
+            ON CONFLICT (model, "contentHash") DO NOTHING
+        """, [
+            (model, content_hash, embedding)
+            for content_hash, embedding in embeddings.items()
+        ])
+
+
 # =============================================================================
 # LEARNER JOURNEY REPORTS
 # =============================================================================
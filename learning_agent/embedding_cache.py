@@ -0,0 +1,96 @@
+"""
+Content-Addressed Embedding Cache
+=================================
+Caches embeddings keyed by (model, sha256(text)) so recrawls don't re-embed
+byte-identical chunks.
+
+Two tiers:
+- In-process LRU (compact float32 arrays)
+- PostgreSQL "AcademyEmbeddingCache" table shared by all workers
+"""
+
+import os
+import hashlib
+import logging
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+import db
+
+logger = logging.getLogger("cloudmigrate-embedding-cache")
+
+# Max embeddings kept in memory (~6KB each at 1536 float32 dims)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "5000"))
+
+_lru: "OrderedDict[Tuple[str, str], array]" = OrderedDict()
+
+
+def content_hash(text: str) -> str:
+    """sha256 hex digest of the text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _lru_get(key: Tuple[str, str]) -> Optional[List[float]]:
+    value = _lru.get(key)
+    if value is None:
+        return None
+    _lru.move_to_end(key)
+    return value.tolist()
+
+
+def _lru_put(key: Tuple[str, str], embedding: List[float]) -> None:
+    _lru[key] = array("f", embedding)
+    _lru.move_to_end(key)
+    while len(_lru) > EMBEDDING_CACHE_SIZE:
+        _lru.popitem(last=False)
+
+
+async def lookup(model: str, texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Look up cached embeddings for texts in bulk.
+
+    Checks the in-process LRU first, then fetches remaining hashes from
+    PostgreSQL in a single query. Database errors are treated as misses.
+
+    Returns:
+        List aligned with texts: the cached embedding or None on a miss
+    """
+    hashes = [content_hash(t) for t in texts]
+    results: List[Optional[List[float]]] = [_lru_get((model, h)) for h in hashes]
+
+    missing = list({h for h, r in zip(hashes, results) if r is None})
+    if not missing:
+        return results
+
+    try:
+        found = await db.get_cached_embeddings(model, missing)
+    except Exception as e:
+        logger.warning(f"Embedding cache lookup failed: {e}")
+        return results
+
+    for i, h in enumerate(hashes):
+        if results[i] is None and h in found:
+            results[i] = found[h]
+            _lru_put((model, h), found[h])
+
+    return results
+
+
+async def store(model: str, texts: List[str], embeddings: List[List[float]]) -> None:
+    """Store freshly created embeddings in both cache tiers (zero vectors are skipped)."""
+    rows: Dict[str, List[float]] = {}
+    for text, embedding in zip(texts, embeddings):
+        if not embedding or not any(embedding):
+            continue
+        h = content_hash(text)
+        rows[h] = embedding
+        _lru_put((model, h), embedding)
+
+    if not rows:
+        return
+
+    try:
+        await db.save_cached_embeddings(model, rows)
+    except Exception as e:
+        logger.warning(f"Embedding cache write failed: {e}")
@@ -0,0 +1,165 @@
+"""
+Async Embedding Engine
+======================
+Native asyncio embedding client used by the crawl and RAG paths.
+
+- One AsyncOpenAI client per API key (no event-loop blocking)
+- Global semaphore bounding in-flight embedding requests
+- Token-aware packing of inputs up to the model's request limits
+- Jittered exponential backoff between retries
+"""
+
+import os
+import asyncio
+import random
+import logging
+from typing import List, Tuple, Optional
+
+from openai import AsyncOpenAI
+
+from tokenizer import count_tokens, truncate_to_tokens
+from openai_clients import get_async_client
+
+logger = logging.getLogger("cloudmigrate-embeddings")
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+
+# OpenAI limits for text-embedding-3-*: 8191 tokens per input,
+# 2048 inputs and 300k tokens per request
+MAX_INPUT_TOKENS = 8191
+MAX_BATCH_INPUTS = int(os.getenv("EMBEDDING_MAX_BATCH_INPUTS", "2048"))
+MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "250000"))
+
+# Max embedding requests in flight across the whole process
+MAX_CONCURRENT_REQUESTS = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "8"))
+
+MAX_RETRIES = 3
+BASE_RETRY_DELAY = 1.0
+
+_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+
+def _get_client(api_key: str) -> AsyncOpenAI:
+    """Shared AsyncOpenAI client for an API key."""
+    # Retries are handled here so backoff is jittered and semaphore-aware
+    return get_async_client(api_key, max_retries=0)
+
+
+def zero_embedding() -> List[float]:
+    """Placeholder embedding for inputs that could not be embedded."""
+    return [0.0] * EMBEDDING_DIMENSIONS
+
+
+def pack_batches(texts: List[str], token_counts: Optional[List[int]] = None) -> List[List[int]]:
+    """
+    Group text indices into request-sized batches.
+
+    Each batch stays under MAX_BATCH_INPUTS inputs and MAX_BATCH_TOKENS tokens.
+    Empty texts are skipped (callers get a zero embedding for them).
+
+    Args:
+        texts: Texts to pack
+        token_counts: Precomputed token counts (computed here if omitted)
+
+    Returns:
+        List of batches, each a list of indices into texts
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        tokens = token_counts[i] if token_counts is not None else count_tokens(text)
+        tokens = min(tokens, MAX_INPUT_TOKENS)
+        if current and (
+            len(current) >= MAX_BATCH_INPUTS
+            or current_tokens + tokens > MAX_BATCH_TOKENS
+        ):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _backoff(attempt: int) -> None:
+    """Sleep with full-jitter exponential backoff."""
+    delay = BASE_RETRY_DELAY * (2 ** attempt)
+    await asyncio.sleep(random.uniform(delay / 2, delay * 1.5))
+
+
+async def _request(client: AsyncOpenAI, inputs: List[str]) -> Tuple[List[List[float]], int]:
+    """Send one embeddings request under the global concurrency limit."""
+    async with _semaphore:
+        response = await client.embeddings.create(model=EMBEDDING_MODEL, input=inputs)
+    tokens = response.usage.total_tokens if getattr(response, "usage", None) else 0
+    return [item.embedding for item in response.data], tokens
+
+
+async def _embed_batch(client: AsyncOpenAI, inputs: List[str]) -> Tuple[List[List[float]], int]:
+    """Embed one packed batch, retrying with backoff and falling back to per-input calls."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            return await _request(client, inputs)
+        except Exception as e:
+            if attempt < MAX_RETRIES - 1:
+                logger.warning(f"Error creating batch embeddings (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
+                await _backoff(attempt)
+            else:
+                logger.error(f"Failed to create batch embeddings after {MAX_RETRIES} attempts: {e}")
+
+    # Fallback: embed inputs one by one so a single bad input doesn't sink the batch
+    async def embed_one(i: int, text: str) -> Tuple[List[float], int]:
+        try:
+            embeddings, tokens = await _request(client, [text])
+            return embeddings[0], tokens
+        except Exception as e:
+            logger.error(f"Failed to create embedding for text {i}: {e}")
+            return zero_embedding(), 0
+
+    results = await asyncio.gather(*[embed_one(i, t) for i, t in enumerate(inputs)])
+    return [r[0] for r in results], sum(r[1] for r in results)
+
+
+async def embed_texts(texts: List[str], api_key: str) -> Tuple[List[List[float]], int]:
+    """
+    Create embeddings for texts, packing them into as few requests as the
+    model limits allow and running those requests concurrently.
+
+    Args:
+        texts: Texts to embed (order is preserved in the output)
+        api_key: OpenAI API key to use
+
+    Returns:
+        Tuple of (embeddings aligned with texts, total tokens used)
+    """
+    if not texts:
+        return [], 0
+
+    client = _get_client(api_key)
+    token_counts = [count_tokens(t) for t in texts]
+    inputs = [
+        truncate_to_tokens(t, MAX_INPUT_TOKENS) if n > MAX_INPUT_TOKENS else t
+        for t, n in zip(texts, token_counts)
+    ]
+    batches = pack_batches(inputs, token_counts)
+
+    results = await asyncio.gather(*[
+        _embed_batch(client, [inputs[i] for i in batch]) for batch in batches
+    ])
+
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
+    total_tokens = 0
+    for batch, (batch_embeddings, tokens) in zip(batches, results):
+        total_tokens += tokens
+        for i, embedding in zip(batch, batch_embeddings):
+            embeddings[i] = embedding
+
+    return [e if e is not None else zero_embedding() for e in embeddings], total_tokens
@@ -0,0 +1,401 @@
+"""
+Deferred Enrichment Queue
+=========================
+Source summaries and code-example summaries are LLM calls that used to sit
+on the crawl's critical path. They are now queued and filled in afterwards:
+
+- Tasks are added to a Redis stream (enrich:stream) read through a consumer
+  group, so they survive a restart of the worker pool. A batch is
+  acknowledged only once its results are written (or the tasks are requeued
+  or parked); batches of a worker that died are reclaimed by another worker
+  after ENRICH_VISIBILITY_TIMEOUT seconds
+- An in-process pool of ENRICH_WORKERS workers reads up to ENRICH_BATCH_SIZE
+  tasks at a time and summarises several items per (JSON-mode) request,
+  falling back to one request per item on malformed replies
+- Results are written to the summary columns; code examples are also
+  re-embedded with their summary
+
+Chunks and code examples are stored (and searchable) before enrichment
+runs; until then sources have no summary and code examples carry a
+"<language> code example" placeholder.
+
+API keys never go to Redis. Tasks carry a hash of the key and the key
+itself stays in the process that enqueued it. A worker that pops a task
+whose key it doesn't hold parks it per key hash; parked tasks are put back
+on the stream whenever a process holding the key enqueues work or has an
+idle worker, so they reach a process that can run them. Keys are held in
+an LRU of ENRICH_KEY_CACHE_SIZE for as long as parked tasks live; a key
+that hasn't enqueued anything since is forgotten.
+"""
+
+import os
+import json
+import socket
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+import redis.asyncio as redis
+from openai import AsyncOpenAI
+
+import db
+import embeddings
+import embedding_cache
+from openai_clients import get_async_client, key_id
+from query_cache import TTLCache
+from redis_jobs import get_job_manager, JOB_EXPIRY_HOURS
+
+logger = logging.getLogger("cloudmigrate-enrichment")
+
+ENRICH_STREAM_KEY = "enrich:stream"
+ENRICH_STREAM_GROUP = "enrich-workers"
+ENRICH_PARKED_PREFIX = "enrich:parked:"
+# List used before the stream; drained into it once per process
+LEGACY_QUEUE_KEY = "enrich:queue"
+
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "2"))
+ENRICH_BATCH_SIZE = int(os.getenv("ENRICH_BATCH_SIZE", "8"))
+ENRICH_POLL_SECONDS = float(os.getenv("ENRICH_POLL_SECONDS", "1.0"))
+ENRICH_VISIBILITY_TIMEOUT = int(os.getenv("ENRICH_VISIBILITY_TIMEOUT", "300"))
+ENRICH_STREAM_MAXLEN = 100000
+ENRICH_MAX_ATTEMPTS = 3
+ENRICH_KEY_CACHE_SIZE = int(os.getenv("ENRICH_KEY_CACHE_SIZE", "100"))
+
+# Move every parked task of one key back onto the stream, atomically.
+# KEYS: parked list, stream; ARGV: stream max length
+# Returns the number of tasks released
+RELEASE_PARKED_SCRIPT = """
+local tasks = redis.call('LRANGE', KEYS[1], 0, -1)
+for i = #tasks, 1, -1 do
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], '*', 'task', tasks[i])
+end
+redis.call('DEL', KEYS[1])
+return #tasks
+"""
+
+# Characters of each item sent to the model (as before)
+SOURCE_SAMPLE_CHARS = 5000
+CODE_SAMPLE_CHARS = 2000
+
+SOURCE_SUMMARY = "source_summary"
+CODE_SUMMARY = "code_summary"
+
+_PROMPTS = {
+    SOURCE_SUMMARY: (
+        "You are a helpful assistant that creates concise summaries.",
+        "Summarize this content in 2-3 sentences:\n\n{text}",
+        "Summarize each content item in 2-3 sentences.",
+        150,
+    ),
+    CODE_SUMMARY: (
+        "You are a helpful assistant that summarizes code examples concisely.",
+        "Summarize this {language} code in one sentence:\n\n{text}",
+        "Summarize each code example in one sentence.",
+        100,
+    ),
+}
+
+# key hash -> API key, for this process only; kept as long as parked tasks
+_api_keys = TTLCache(ENRICH_KEY_CACHE_SIZE, 3600 * JOB_EXPIRY_HOURS)
+_workers: List[asyncio.Task] = []
+_stream_ready = False
+_release_parked_script = None
+
+
+def placeholder_code_summary(language: str) -> str:
+    """Summary stored until the real one is generated."""
+    return f"{language} code example"
+
+
+# ----------------------------------------------------------------------
+# Producers
+# ----------------------------------------------------------------------
+
+async def _redis():
+    return await (await get_job_manager()).get_redis()
+
+
+async def _ensure_stream(r) -> None:
+    """Create the stream and consumer group, and drain the pre-stream list queue."""
+    global _stream_ready
+    if _stream_ready:
+        return
+    try:
+        await r.xgroup_create(ENRICH_STREAM_KEY, ENRICH_STREAM_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    while (payload := await r.rpop(LEGACY_QUEUE_KEY)) is not None:
+        await r.xadd(ENRICH_STREAM_KEY, {"task": payload}, maxlen=ENRICH_STREAM_MAXLEN, approximate=True)
+    _stream_ready = True
+
+
+async def _add_tasks(r, payloads: List[str]) -> None:
+    pipe = r.pipeline(transaction=False)
+    for payload in payloads:
+        pipe.xadd(ENRICH_STREAM_KEY, {"task": payload}, maxlen=ENRICH_STREAM_MAXLEN, approximate=True)
+    await pipe.execute()
+
+
+async def enqueue(tasks: List[Dict[str, Any]], api_key: Optional[str], model: str) -> int:
+    """
+    Queue enrichment tasks for the worker pool.
+
+    Args:
+        tasks: Task dicts with a "kind" (SOURCE_SUMMARY or CODE_SUMMARY)
+        api_key: OpenAI key to run them with (kept in-process only)
+        model: Chat model to use
+
+    Returns:
+        Number of tasks queued (0 without an API key or Redis; placeholders remain)
+    """
+    if not tasks:
+        return 0
+    if not api_key:
+        logger.warning(f"No API key for {len(tasks)} enrichment tasks; summaries skipped")
+        return 0
+
+    api_key_id = key_id(api_key)
+    _api_keys.put(api_key_id, api_key)
+
+    payloads = [json.dumps({**task, "key_id": api_key_id, "model": model, "attempts": 0}) for task in tasks]
+    try:
+        r = await _redis()
+        await _ensure_stream(r)
+        await _add_tasks(r, payloads)
+        # Tasks another process parked for want of this key can run again
+        await _release_parked(r, api_key_id)
+    except Exception as e:
+        # Enrichment is best-effort; never fail the crawl over it
+        logger.error(f"Could not queue {len(payloads)} enrichment tasks: {e}")
+        return 0
+
+    ensure_workers()
+    return len(payloads)
+
+
+async def enqueue_source_summary(source_id: str, content: str, api_key: Optional[str], model: str) -> int:
+    """Queue a summary for a source from a sample of its content."""
+    return await enqueue(
+        [{"kind": SOURCE_SUMMARY, "source_id": source_id, "text": content[:SOURCE_SAMPLE_CHARS]}],
+        api_key, model,
+    )
+
+
+async def enqueue_code_summaries(
+    url: str, examples: List[Dict[str, Any]], api_key: Optional[str], model: str
+) -> int:
+    """Queue summaries for stored code examples ({"chunk_number", "code", "language"})."""
+    return await enqueue([
+        {
+            "kind": CODE_SUMMARY,
+            "url": url,
+            "chunk_number": example["chunk_number"],
+            "text": example["code"],
+            "language": example["language"],
+        }
+        for example in examples
+    ], api_key, model)
+
+
+async def _release_parked(r, api_key_id: str) -> int:
+    """Put tasks parked for want of this key back onto the stream."""
+    global _release_parked_script
+    if _release_parked_script is None:
+        _release_parked_script = r.register_script(RELEASE_PARKED_SCRIPT)
+    released = await _release_parked_script(
+        keys=[f"{ENRICH_PARKED_PREFIX}{api_key_id}", ENRICH_STREAM_KEY], args=[ENRICH_STREAM_MAXLEN]
+    )
+    if released:
+        logger.info(f"Released {released} parked enrichment tasks")
+    return released
+
+
+# ----------------------------------------------------------------------
+# Workers
+# ----------------------------------------------------------------------
+
+def ensure_workers() -> None:
+    """Start the in-process worker pool if it isn't running."""
+    _workers[:] = [w for w in _workers if not w.done()]
+    while len(_workers) < ENRICH_WORKERS:
+        consumer = f"{socket.gethostname()}-{os.getpid()}-{len(_workers)}"
+        _workers.append(asyncio.create_task(_worker_loop(consumer)))
+
+
+async def _read_batch(r, consumer: str) -> List[Tuple[str, Optional[str]]]:
+    """Reclaim a batch abandoned by a lost worker, else wait for new tasks."""
+    response = await r.xautoclaim(
+        ENRICH_STREAM_KEY, ENRICH_STREAM_GROUP, consumer,
+        min_idle_time=ENRICH_VISIBILITY_TIMEOUT * 1000, start_id="0-0", count=ENRICH_BATCH_SIZE,
+    )
+    # Trimmed entries come back without fields; they are just acknowledged
+    entries = [(entry_id, fields.get("task") if fields else None) for entry_id, fields in response[1]]
+    if entries:
+        logger.warning(f"Reclaimed {len(entries)} enrichment tasks from a lost worker")
+        return entries
+
+    response = await r.xreadgroup(
+        ENRICH_STREAM_GROUP, consumer, {ENRICH_STREAM_KEY: ">"},
+        count=ENRICH_BATCH_SIZE, block=int(ENRICH_POLL_SECONDS * 1000),
+    )
+    if not response:
+        return []
+    return [(entry_id, fields.get("task")) for entry_id, fields in response[0][1]]
+
+
+async def _worker_loop(consumer: str) -> None:
+    global _stream_ready
+    while True:
+        try:
+            r = await _redis()
+            await _ensure_stream(r)
+            entries = await _read_batch(r, consumer)
+            if not entries:
+                # Idle: pull back tasks other processes parked for keys held here
+                for api_key_id in _api_keys.keys():
+                    if _api_keys.get(api_key_id) is not None:
+                        await _release_parked(r, api_key_id)
+                continue
+            await _process(entries, r)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, redis.ResponseError) and "NOGROUP" in str(e):
+                # Stream or group deleted (FLUSHDB, manual cleanup): recreate on the next pass
+                _stream_ready = False
+            logger.error(f"Enrichment worker error: {e}")
+            await asyncio.sleep(ENRICH_POLL_SECONDS)
+
+
+async def _ack(r, entry_ids: List[str]) -> None:
+    if not entry_ids:
+        return
+    pipe = r.pipeline(transaction=False)
+    pipe.xack(ENRICH_STREAM_KEY, ENRICH_STREAM_GROUP, *entry_ids)
+    pipe.xdel(ENRICH_STREAM_KEY, *entry_ids)
+    await pipe.execute()
+
+
+async def _process(entries: List[Tuple[str, Optional[str]]], r) -> None:
+    """Run a batch; each group is acknowledged once written, requeued or parked."""
+    await _ack(r, [entry_id for entry_id, payload in entries if payload is None])
+
+    groups: Dict[Tuple[str, str, str], List[Tuple[str, Dict[str, Any]]]] = {}
+    for entry_id, payload in entries:
+        if payload is not None:
+            task = json.loads(payload)
+            groups.setdefault((task["key_id"], task["model"], task["kind"]), []).append((entry_id, task))
+
+    for (api_key_id, model, kind), group in groups.items():
+        entry_ids = [entry_id for entry_id, _ in group]
+        tasks = [task for _, task in group]
+        api_key = _api_keys.get(api_key_id)
+        if api_key is None:
+            parked_key = f"{ENRICH_PARKED_PREFIX}{api_key_id}"
+            await r.lpush(parked_key, *[json.dumps(t) for t in tasks])
+            await r.expire(parked_key, 3600 * JOB_EXPIRY_HOURS)
+            await _ack(r, entry_ids)
+            continue
+        try:
+            summaries = await _summarize(get_async_client(api_key), model, kind, tasks)
+            if kind == SOURCE_SUMMARY:
+                await _store_source_summaries(tasks, summaries)
+            else:
+                await _store_code_summaries(tasks, summaries, api_key)
+        except Exception as e:
+            retry = [t for t in tasks if t["attempts"] + 1 < ENRICH_MAX_ATTEMPTS]
+            logger.warning(f"{kind} batch of {len(tasks)} failed ({e}); requeueing {len(retry)}")
+            if retry:
+                await _add_tasks(r, [json.dumps({**t, "attempts": t["attempts"] + 1}) for t in retry])
+        await _ack(r, entry_ids)
+
+
+# ----------------------------------------------------------------------
+# LLM calls
+# ----------------------------------------------------------------------
+
+def _item_text(task: Dict[str, Any]) -> str:
+    limit = SOURCE_SAMPLE_CHARS if task["kind"] == SOURCE_SUMMARY else CODE_SAMPLE_CHARS
+    return task["text"][:limit]
+
+
+async def _summarize_one(client: AsyncOpenAI, model: str, task: Dict[str, Any]) -> str:
+    system, single, _, max_tokens = _PROMPTS[task["kind"]]
+    response = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": single.format(text=_item_text(task), language=task.get("language", ""))},
+        ],
+        temperature=0.3,
+        max_tokens=max_tokens,
+    )
+    return response.choices[0].message.content.strip()
+
+
+async def _summarize(client: AsyncOpenAI, model: str, kind: str, tasks: List[Dict[str, Any]]) -> List[str]:
+    """One request for the whole group; per-item requests if the reply doesn't line up."""
+    if len(tasks) == 1:
+        return [await _summarize_one(client, model, tasks[0])]
+
+    system, _, instruction, max_tokens = _PROMPTS[kind]
+    items = "\n".join(
+        f'<item index="{i}"{f" language={json.dumps(t["language"])}" if t.get("language") else ""}>\n'
+        f"{_item_text(t)}\n</item>"
+        for i, t in enumerate(tasks)
+    )
+    try:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": (
+                    f"{items}\n{instruction} "
+                    f'Respond with JSON: {{"summaries": [...]}} containing exactly {len(tasks)} strings, in item index order.'
+                )},
+            ],
+            temperature=0.3,
+            max_tokens=max_tokens * len(tasks),
+            response_format={"type": "json_object"},
+        )
+        summaries = json.loads(response.choices[0].message.content).get("summaries")
+        if not isinstance(summaries, list) or len(summaries) != len(tasks):
+            raise ValueError(f"expected {len(tasks)} summaries")
+        return [str(s).strip() for s in summaries]
+    except Exception as e:
+        logger.warning(f"Batched {kind} failed ({e}); summarising items individually")
+        return list(await asyncio.gather(*[_summarize_one(client, model, t) for t in tasks]))
+
+
+# ----------------------------------------------------------------------
+# Writers
+# ----------------------------------------------------------------------
+
+async def _store_source_summaries(tasks: List[Dict[str, Any]], summaries: List[str]) -> None:
+    await db.update_source_summaries({
+        task["source_id"]: summary for task, summary in zip(tasks, summaries) if summary
+    })
+
+
+async def _store_code_summaries(tasks: List[Dict[str, Any]], summaries: List[str], api_key: str) -> None:
+    """Save summaries and re-embed each example as "summary\\ncode" (as at ingest before)."""
+    texts = [f"{summary}\n{task['text']}" for task, summary in zip(tasks, summaries)]
+    vectors = await embedding_cache.lookup(embeddings.EMBEDDING_MODEL, texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        new_vectors, _ = await embeddings.embed_texts([texts[i] for i in missing], api_key)
+        await embedding_cache.store(embeddings.EMBEDDING_MODEL, [texts[i] for i in missing], new_vectors)
+        for i, vector in zip(missing, new_vectors):
+            vectors[i] = vector
+
+    await db.update_code_example_summaries([
+        {
+            "url": task["url"],
+            "chunk_number": task["chunk_number"],
+            "content": task["text"],
+            "summary": summary,
+            "embedding": vector if vector and any(vector) else None,
+        }
+        for task, summary, vector in zip(tasks, summaries, vectors)
+    ])
@@ -13,8 +13,8 @@ import json
 import uuid
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
-from openai import AsyncOpenAI
 
+from openai_clients import get_async_client
 from utils import get_request_api_key, get_request_model, ApiKeyRequiredError
 
 
@@ -293,7 +293,7 @@ async def _chat_json(
         )
     
     model = model or get_request_model() or "gpt-4o"
-    client = AsyncOpenAI(api_key=key)
+    client = get_async_client(key)
     
     response = await client.chat.completions.create(
         model=model,
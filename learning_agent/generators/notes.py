@@ -8,9 +8,9 @@ import json
 import os
 from typing import List, Optional, Dict
 from pydantic import BaseModel
-from openai import AsyncOpenAI
 
 from prompts import NOTES_GENERATOR_PROMPT, PERSONA_NOTES_PROMPT
+from openai_clients import get_async_client
 from utils import get_request_api_key, ApiKeyRequiredError
 
 
@@ -42,7 +42,7 @@ async def _chat_json(messages: List[Dict], model: str = "gpt-4o", api_key: Optio
         raise ApiKeyRequiredError(
             "OpenAI API key required. Please configure your API key in Settings."
         )
-    client = AsyncOpenAI(api_key=key)
+    client = get_async_client(key)
     response = await client.chat.completions.create(
         model=model,
         messages=messages,
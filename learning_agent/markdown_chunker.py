@@ -0,0 +1,368 @@
+"""
+Token-Aware Markdown Chunker
+============================
+Single-pass replacement for the character-window smart_chunk_markdown.
+
+1. The document is scanned once, line by line, into blocks: headings,
+   fenced code, tables, list items and paragraphs. Each block is tokenised
+   once.
+2. Blocks are packed greedily into chunks of at most max_tokens. A heading
+   closes the current chunk once it holds min_tokens, so sections start
+   fresh chunks; code fences, tables and list items are never cut.
+3. Blocks larger than the budget are split on their own structure: code by
+   lines (each piece re-fenced), tables by rows (header repeated),
+   paragraphs and oversized headings by sentences, then by tokens as a last
+   resort. The repeated fence or header counts against the budget; if it
+   would take more than half of it, the block is split by lines without it.
+
+Per-chunk metadata (header path, headers, offsets, counts) is produced in
+the same pass, so no second scan like extract_section_info is needed.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from tokenizer import count_tokens, get_encoding, CHARS_PER_TOKEN
+
+# Default token budget per chunk and overlap carried into the next chunk
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "1000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+
+# Fraction of the budget a chunk must hold before a heading starts a new one
+CHUNK_MIN_FILL = 0.3
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d{1,9}[.)])\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# First non-space characters of lines that may be fences or list items;
+# anything else is plain text (or an obvious heading/table row) and skips the regexes
+_FENCE_STARTS = frozenset("`~")
+_ITEM_STARTS = frozenset("-*+0123456789")
+
+
+@dataclass
+class Block:
+    """A structural unit of the document that is kept whole when possible."""
+    kind: str  # heading | code | table | list | paragraph
+    text: str
+    start: int
+    end: int
+    tokens: int = 0
+    level: int = 0
+    title: str = ""
+
+
+@dataclass
+class Chunk:
+    """A chunk of markdown and its section metadata."""
+    text: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+# ----------------------------------------------------------------------
+# Pass 1: blocks
+# ----------------------------------------------------------------------
+
+def iter_blocks(text: str) -> Iterator[Block]:
+    """
+    Split markdown into structural blocks in one scan.
+
+    Blank lines stay attached to the block before them (leading ones to the
+    first block), so the blocks' texts concatenate back to the document.
+    """
+    kind: Optional[str] = None
+    heading: Optional[re.Match] = None
+    start = 0
+    offset = 0
+    length = len(text)
+    after_blank = False
+
+    while offset < length:
+        line_start = offset
+        newline = text.find("\n", offset)
+        offset = length if newline < 0 else newline + 1
+        line = text[line_start:offset]
+        stripped = line.strip()
+
+        if not stripped:
+            after_blank = True
+            continue
+
+        first = stripped[0]
+        fence_match = _FENCE.match(line) if first in _FENCE_STARTS else None
+        heading_match = _HEADING.match(line) if first == "#" else None
+        is_table = first == "|"
+        is_item = first in _ITEM_STARTS and _LIST_ITEM.match(line) is not None
+        structural = bool(fence_match or heading_match or is_table or is_item)
+
+        continues = (
+            (kind == "paragraph" and not after_blank and not structural)
+            or (kind == "table" and is_table and not after_blank)
+            # Lazy or indented continuation lines of a list item
+            or (kind == "list" and not structural and (not after_blank or line[:1] in (" ", "\t")))
+        )
+        after_blank = False
+        if continues:
+            continue
+
+        if kind is not None:
+            yield _make_block(kind, heading, text, start, line_start)
+            start = line_start
+
+        heading = heading_match
+        if fence_match:
+            kind = "code"
+            # Jump straight past the matching closing fence (or to the end if unclosed)
+            fence = fence_match.group(1)
+            closing = re.compile(rf"^ {{0,3}}{re.escape(fence)}{re.escape(fence[0])}*[ \t]*\r?$", re.MULTILINE)
+            match = closing.search(text, offset)
+            if match is None:
+                offset = length
+            else:
+                newline = text.find("\n", match.end())
+                offset = length if newline < 0 else newline + 1
+        elif heading_match:
+            kind = "heading"
+        elif is_table:
+            kind = "table"
+        elif is_item:
+            kind = "list"
+        else:
+            kind = "paragraph"
+
+    if kind is not None:
+        yield _make_block(kind, heading, text, start, len(text))
+
+
+def _make_block(kind: str, heading: Optional[re.Match], text: str, start: int, end: int) -> Block:
+    if kind == "heading":
+        return Block(kind, text[start:end], start, end, level=len(heading.group(1)), title=heading.group(2))
+    return Block(kind, text[start:end], start, end)
+
+
+# ----------------------------------------------------------------------
+# Oversized blocks
+# ----------------------------------------------------------------------
+
+def _split_by_tokens(text: str, start: int, max_tokens: int) -> List[Block]:
+    """Hard split on token boundaries (or characters without tiktoken)."""
+    enc = get_encoding()
+    if enc is None:
+        step = max_tokens * CHARS_PER_TOKEN
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+    else:
+        tokens = enc.encode(text, disallowed_special=())
+        pieces = []
+        i = 0
+        while i < len(tokens):
+            n = max_tokens
+            piece = enc.decode(tokens[i:i + n])
+            # A cut mid-word or mid-character can re-encode to more tokens than the slice
+            while n > 1 and count_tokens(piece) > max_tokens:
+                n -= 1
+                piece = enc.decode(tokens[i:i + n])
+            pieces.append(piece)
+            i += n
+
+    blocks = []
+    for piece in pieces:
+        end = min(start + len(piece), start + len(text))
+        blocks.append(Block("paragraph", piece, start, end, count_tokens(piece)))
+        start = end
+    return blocks
+
+
+def _pack_units(kind: str, units: List[Tuple[str, int]], max_tokens: int,
+                prefix: str = "", suffix: str = "") -> List[Block]:
+    """
+    Greedily pack (text, offset) units into blocks under max_tokens,
+    wrapping each block in prefix/suffix (fence lines, table header).
+    """
+    overhead = count_tokens(prefix) + count_tokens(suffix)
+    budget = max(1, max_tokens - overhead)
+    blocks: List[Block] = []
+    parts: List[str] = []
+    part_tokens = 0
+    part_start = units[0][1] if units else 0
+
+    def flush(end: int) -> None:
+        body = "".join(parts)
+        blocks.append(Block(kind, f"{prefix}{body}{suffix}", part_start, end, part_tokens + overhead))
+
+    for unit, unit_start in units:
+        unit_tokens = count_tokens(unit)
+        if unit_tokens > budget:
+            if parts:
+                flush(unit_start)
+                parts, part_tokens = [], 0
+            for piece in _split_by_tokens(unit, unit_start, budget):
+                blocks.append(Block(kind, f"{prefix}{piece.text}{suffix}", piece.start, piece.end,
+                                    count_tokens(piece.text) + overhead))
+            part_start = unit_start + len(unit)
+            continue
+        if parts and part_tokens + unit_tokens > budget:
+            flush(unit_start)
+            parts, part_tokens, part_start = [], 0, unit_start
+        parts.append(unit)
+        part_tokens += unit_tokens
+
+    if parts:
+        flush(units[-1][1] + len(units[-1][0]))
+    return blocks
+
+
+def _lines_with_offsets(text: str, start: int) -> List[Tuple[str, int]]:
+    units = []
+    for line in text.splitlines(keepends=True):
+        units.append((line, start))
+        start += len(line)
+    return units
+
+
+def _wrapper_fits(prefix: str, suffix: str, max_tokens: int) -> bool:
+    """Whether repeating prefix/suffix on every piece leaves at least half the budget for content."""
+    return count_tokens(prefix) + count_tokens(suffix) <= max_tokens // 2
+
+
+def split_block(block: Block, max_tokens: int) -> List[Block]:
+    """Split a block over the budget along its own structure."""
+    if block.kind == "code":
+        lines = _lines_with_offsets(block.text, block.start)
+        opening = lines[0][0]
+        fence = _FENCE.match(opening).group(1)
+        body = lines[1:]
+        closing = ""
+        if body and body[-1][0].strip().startswith(fence):
+            closing = body.pop()[0]
+        while body and not body[-1][0].strip():
+            body.pop()
+        closing = closing or f"{fence}\n"
+        if not body:
+            return _split_by_tokens(block.text, block.start, max_tokens)
+        if not _wrapper_fits(opening, closing, max_tokens):
+            return _pack_units("code", lines, max_tokens)
+        return _pack_units("code", body, max_tokens, opening, closing)
+
+    if block.kind == "table":
+        lines = _lines_with_offsets(block.text, block.start)
+        header = "".join(line for line, _ in lines[:2])
+        rows = lines[2:]
+        if not rows:
+            return _split_by_tokens(block.text, block.start, max_tokens)
+        if not _wrapper_fits(header, "", max_tokens):
+            return _pack_units("table", lines, max_tokens)
+        return _pack_units("table", rows, max_tokens, header)
+
+    # Paragraphs, list items and oversized headings: sentences, then tokens
+    units: List[Tuple[str, int]] = []
+    position = 0
+    for match in _SENTENCE_END.finditer(block.text):
+        units.append((block.text[position:match.end()], block.start + position))
+        position = match.end()
+    if position < len(block.text):
+        units.append((block.text[position:], block.start + position))
+    return _pack_units("paragraph" if block.kind == "heading" else block.kind, units, max_tokens)
+
+
+# ----------------------------------------------------------------------
+# Pass 2: packing
+# ----------------------------------------------------------------------
+
+def _chunk_metadata(blocks: List[Block], tokens: int, header_path: List[str], text: str) -> Dict[str, Any]:
+    headings = [b for b in blocks if b.kind == "heading"]
+    return {
+        "headers": "; ".join(f"{'#' * h.level} {h.title}" for h in headings),
+        "header_path": " > ".join(header_path),
+        "start_offset": blocks[0].start,
+        "end_offset": blocks[-1].end,
+        "token_count": tokens,
+        "char_count": len(text),
+        "word_count": len(text.split()),
+    }
+
+
+def chunk_markdown(
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    min_tokens: Optional[int] = None,
+) -> List[Chunk]:
+    """
+    Split markdown into token-bounded chunks that respect its structure.
+
+    Args:
+        text: Markdown document
+        max_tokens: Token budget per chunk
+        overlap_tokens: Trailing whole blocks (up to this many tokens) repeated
+            at the start of the next chunk within the same section
+        min_tokens: Tokens a chunk needs before a heading closes it
+            (default CHUNK_MIN_FILL of max_tokens)
+
+    Returns:
+        Chunks with metadata: headers, header_path, start_offset, end_offset,
+        token_count, char_count, word_count
+    """
+    max_tokens = max(1, max_tokens)
+    overlap_tokens = min(max(0, overlap_tokens), max_tokens // 2)
+    if min_tokens is None:
+        min_tokens = int(max_tokens * CHUNK_MIN_FILL)
+
+    chunks: List[Chunk] = []
+    heading_stack: List[Block] = []
+    current: List[Block] = []
+    current_tokens = 0
+    current_path: List[str] = []
+    # The header path is fixed by the first non-heading block of a chunk
+    path_open = True
+
+    def flush(carry_overlap: bool) -> None:
+        nonlocal current, current_tokens, path_open
+        chunk_text = "".join(b.text for b in current).strip()
+        if chunk_text:
+            chunks.append(Chunk(chunk_text, _chunk_metadata(current, current_tokens, current_path, chunk_text)))
+
+        carried: List[Block] = []
+        carried_tokens = 0
+        if carry_overlap and overlap_tokens:
+            for b in reversed(current[1:]):
+                if b.kind == "heading" or carried_tokens + b.tokens > overlap_tokens:
+                    break
+                carried.insert(0, b)
+                carried_tokens += b.tokens
+        current, current_tokens = carried, carried_tokens
+        path_open = not carried
+
+    for block in iter_blocks(text):
+        block.tokens = count_tokens(block.text)
+        pieces = [block] if block.tokens <= max_tokens else split_block(block, max_tokens)
+
+        for piece in pieces:
+            if piece.kind == "heading":
+                if current and (current_tokens >= min_tokens or current_tokens + piece.tokens > max_tokens):
+                    flush(carry_overlap=False)
+                while heading_stack and heading_stack[-1].level >= piece.level:
+                    heading_stack.pop()
+                heading_stack.append(piece)
+            elif current and current_tokens + piece.tokens > max_tokens:
+                flush(carry_overlap=True)
+                if current and current_tokens + piece.tokens > max_tokens:
+                    current, current_tokens, path_open = [], 0, True
+
+            if path_open:
+                current_path = [h.title for h in heading_stack]
+                path_open = piece.kind == "heading"
+            current.append(piece)
+            current_tokens += piece.tokens
+
+    if current:
+        flush(carry_overlap=False)
+    return chunks
+
+
+def chunk_size_to_tokens(chunk_size: int) -> int:
+    """Convert the API's character-based chunk_size into a token budget."""
+    return max(1, chunk_size // CHARS_PER_TOKEN)
@@ -0,0 +1,86 @@
+"""
+In-Process Metrics
+==================
+Rolling latency percentiles and counters exposed at GET /api/metrics.
+
+Samples are kept in a bounded window per metric, so percentiles reflect
+recent traffic and memory stays constant.
+"""
+
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any
+
+# Samples kept per latency metric
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2000"))
+
+
+class LatencyTracker:
+    """Rolling window of latency samples with percentile snapshots."""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile in seconds (0.0 when empty)."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        window = len(self.samples)
+        return {
+            "count": self.count,
+            "window": window,
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+            "mean_ms": round(sum(self.samples) / window * 1000, 2) if window else 0.0,
+        }
+
+
+_latencies: Dict[str, LatencyTracker] = {}
+_counters: Dict[str, int] = {}
+
+
+def latency(name: str) -> LatencyTracker:
+    """Get or create the latency tracker for a metric name."""
+    if name not in _latencies:
+        _latencies[name] = LatencyTracker()
+    return _latencies[name]
+
+
+def observe(name: str, seconds: float) -> None:
+    """Record one latency sample."""
+    latency(name).record(seconds)
+
+
+@contextmanager
+def timed(name: str):
+    """Context manager recording the block's wall time under name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def increment(name: str, value: int = 1) -> None:
+    """Increment a counter."""
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot() -> Dict[str, Any]:
+    """All latency percentiles and counters."""
+    return {
+        "latency": {name: tracker.snapshot() for name, tracker in sorted(_latencies.items())},
+        "counters": dict(sorted(_counters.items())),
+    }
@@ -0,0 +1,93 @@
+"""
+Shared OpenAI Clients
+=====================
+One registry of OpenAI clients for the whole process, instead of a new
+AsyncOpenAI (new connection pool, new TLS handshake) per request.
+
+- Every client shares one pooled httpx transport (sync or async), so
+  connections stay warm across requests and across API keys; the key is
+  only a request header
+- HTTP/2 is used when the h2 package is installed (pip install
+  "httpx[http2]"), otherwise HTTP/1.1 keep-alive
+- Clients are cached per (hashed API key, max_retries) in a bounded LRU;
+  raw keys are never used as cache keys
+"""
+
+import os
+import hashlib
+import logging
+import importlib.util
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI, OpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+
+logger = logging.getLogger("cloudmigrate-openai-clients")
+
+OPENAI_CLIENT_CACHE_SIZE = int(os.getenv("OPENAI_CLIENT_CACHE_SIZE", "256"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "120"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true") == "true" and importlib.util.find_spec("h2") is not None
+
+_LIMITS = httpx.Limits(
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+)
+
+_async_http: Optional[httpx.AsyncClient] = None
+_sync_http: Optional[httpx.Client] = None
+_async_clients: "OrderedDict[Tuple[str, Optional[int]], AsyncOpenAI]" = OrderedDict()
+_sync_clients: "OrderedDict[Tuple[str, Optional[int]], OpenAI]" = OrderedDict()
+
+
+def key_id(api_key: str) -> str:
+    """Stable, non-reversible id for an API key (cache and log safe)."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _cached(cache: OrderedDict, key: Tuple[str, Optional[int]], create):
+    client = cache.get(key)
+    if client is None:
+        client = cache[key] = create()
+        # Evicted clients need no closing: the transport is shared
+        while len(cache) > OPENAI_CLIENT_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+    return client
+
+
+def get_async_client(api_key: str, max_retries: Optional[int] = None) -> AsyncOpenAI:
+    """
+    Shared AsyncOpenAI client for an API key.
+
+    Args:
+        api_key: OpenAI API key
+        max_retries: Override the SDK's retry count (e.g. 0 when the caller retries)
+    """
+    global _async_http
+    if _async_http is None or _async_http.is_closed:
+        _async_http = DefaultAsyncHttpxClient(limits=_LIMITS, http2=OPENAI_HTTP2)
+        logger.info(f"OpenAI async transport ready (http2={OPENAI_HTTP2})")
+
+    def create() -> AsyncOpenAI:
+        kwargs = {} if max_retries is None else {"max_retries": max_retries}
+        return AsyncOpenAI(api_key=api_key, http_client=_async_http, **kwargs)
+
+    return _cached(_async_clients, (key_id(api_key), max_retries), create)
+
+
+def get_sync_client(api_key: str, max_retries: Optional[int] = None) -> OpenAI:
+    """Shared synchronous OpenAI client for an API key."""
+    global _sync_http
+    if _sync_http is None or _sync_http.is_closed:
+        _sync_http = DefaultHttpxClient(limits=_LIMITS, http2=OPENAI_HTTP2)
+
+    def create() -> OpenAI:
+        kwargs = {} if max_retries is None else {"max_retries": max_retries}
+        return OpenAI(api_key=api_key, http_client=_sync_http, **kwargs)
+
+    return _cached(_sync_clients, (key_id(api_key), max_retries), create)
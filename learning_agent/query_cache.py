@@ -0,0 +1,263 @@
+"""
+Query Caches for RAG Search
+===========================
+Two levels in front of search_documents:
+
+1. Query embeddings: normalised query text -> embedding, TTL LRU
+2. Semantic results: a new query whose embedding is within
+   SEMANTIC_CACHE_THRESHOLD cosine similarity of a cached query (same
+   search parameters and source filter) reuses that query's results.
+   Hybrid results are keyed on the normalised query text instead: their
+   lexical half depends on the exact terms, and near-identical embeddings
+   (put-bucket-acl vs put-bucket-policy) match different documents
+
+Result entries are invalidated through db's source-write hook whenever
+chunks for a source are written or deleted, and expire after a TTL. The
+hook also publishes the source id on Redis (SOURCE_INVALIDATION_CHANNEL),
+so API processes whose cache was filled before a crawl worker or another
+API worker wrote the chunks drop their entries too.
+
+Each invalidation also bumps a per-source generation. Searches read it
+before querying and only store their results if it is unchanged, so a
+search that overlapped a write can't cache what it read before the write.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Hashable, Set
+
+import numpy as np
+
+from redis_jobs import get_job_manager
+
+logger = logging.getLogger("cloudmigrate-query-cache")
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2000"))
+QUERY_EMBEDDING_TTL = float(os.getenv("QUERY_EMBEDDING_TTL", "3600"))
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "500"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SOURCE_INVALIDATION_CHANNEL = "search-cache:invalidate"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive cache key for query text."""
+    return _WHITESPACE.sub(" ", query.strip().lower())
+
+
+class TTLCache:
+    """LRU with per-entry expiry."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def keys(self) -> List[Hashable]:
+        return list(self._data)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class SemanticResultCache:
+    """
+    Results keyed by embedding neighbourhood within a parameter bucket.
+
+    A bucket is (search parameters..., source filter); lookups compare the
+    query embedding against every cached embedding in the bucket. Entries
+    put with text are only returned for that exact (normalised) text.
+    """
+
+    def __init__(self, max_size: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.threshold = threshold
+        self._entries = TTLCache(max_size, ttl)
+        self._next_id = 0
+        # Bumped on every invalidation: per source, any source, and on clear
+        self._generations: Dict[str, int] = {}
+        self._writes = 0
+        self._epoch = 0
+
+    def generation(self, source_id: Optional[str]) -> Tuple[int, int]:
+        """Token that changes whenever results for source_id (None: any source) may have changed."""
+        if source_id is None:
+            return self._epoch, self._writes
+        return self._epoch, self._generations.get(source_id, 0)
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def get(self, embedding: List[float], bucket: Tuple, text: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Cached results for the nearest query in the bucket (or for exactly text), or None."""
+        if text is not None:
+            entry = self._entries.get((bucket, text))
+            return [dict(r) for r in entry[1]] if entry is not None else None
+
+        query = self._unit(embedding)
+        if query is None:
+            return None
+
+        best_score, best = 0.0, None
+        for key in self._entries.keys():
+            if key[0] != bucket or isinstance(key[1], str):
+                continue
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            score = float(np.dot(entry[0], query))
+            if score > best_score:
+                best_score, best = score, entry
+
+        if best is None or best_score < self.threshold:
+            return None
+        return [dict(r) for r in best[1]]
+
+    def put(self, embedding: List[float], bucket: Tuple, results: List[Dict[str, Any]],
+            generation: Optional[Tuple[int, int]] = None, text: Optional[str] = None) -> None:
+        """
+        Cache results for a query.
+
+        Skipped if generation (read before the search ran) no longer matches
+        the bucket's source: the results may predate a write.
+        """
+        if generation is not None and generation != self.generation(bucket[-1]):
+            return
+        query = self._unit(embedding)
+        if query is None:
+            return
+        if text is not None:
+            key = (bucket, text)
+        else:
+            self._next_id += 1
+            key = (bucket, self._next_id)
+        self._entries.put(key, (query, [dict(r) for r in results]))
+
+    def invalidate_source(self, source_id: str) -> None:
+        """Drop entries that could include results from source_id (its own and unfiltered buckets)."""
+        self._generations[source_id] = self._generations.get(source_id, 0) + 1
+        self._writes += 1
+        for key in self._entries.keys():
+            bucket_source = key[0][-1]
+            if bucket_source is None or bucket_source == source_id:
+                self._entries.pop(key)
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._entries.clear()
+
+
+query_embeddings = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_TTL)
+search_results = SemanticResultCache()
+_listener: Optional[asyncio.Task] = None
+_publishing: Set[asyncio.Task] = set()
+
+
+def get_query_embedding(query: str) -> Optional[List[float]]:
+    """Cached embedding for query text, or None."""
+    cached = query_embeddings.get(normalize_query(query))
+    return cached.tolist() if cached is not None else None
+
+
+def put_query_embedding(query: str, embedding: List[float]) -> None:
+    """Cache a query embedding (zero vectors from failed calls are skipped)."""
+    if embedding and any(embedding):
+        query_embeddings.put(normalize_query(query), array("f", embedding))
+
+
+def get_results(embedding: List[float], bucket: Tuple, query: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Cached results for a query (starts the cross-process invalidation listener).
+
+    With query, only results cached for the same normalised text are returned.
+    """
+    _ensure_listener()
+    return search_results.get(embedding, bucket, normalize_query(query) if query is not None else None)
+
+
+def put_results(embedding: List[float], bucket: Tuple, results: List[Dict[str, Any]],
+                generation: Tuple[int, int], query: Optional[str] = None) -> None:
+    """Cache results unless the bucket's source was invalidated since generation was read."""
+    search_results.put(embedding, bucket, results, generation,
+                       normalize_query(query) if query is not None else None)
+
+
+def invalidate_source(source_id: str) -> None:
+    """db source-write hook: chunks for source_id changed, here and for every other process."""
+    search_results.invalidate_source(source_id)
+    logger.debug(f"Invalidated cached search results for source {source_id}")
+    try:
+        task = asyncio.get_running_loop().create_task(_publish(source_id))
+    except RuntimeError:
+        return
+    _publishing.add(task)
+    task.add_done_callback(_publishing.discard)
+
+
+async def _publish(source_id: str) -> None:
+    try:
+        r = await (await get_job_manager()).get_redis()
+        await r.publish(SOURCE_INVALIDATION_CHANNEL, json.dumps({"source_id": source_id}))
+    except Exception as e:
+        logger.warning(f"Could not publish search cache invalidation ({e}); other processes catch up within the TTL")
+
+
+def _ensure_listener() -> None:
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(_listen())
+
+
+async def _listen() -> None:
+    """Apply invalidations published by other processes (reconnects on error)."""
+    while True:
+        try:
+            r = await (await get_job_manager()).get_redis()
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(SOURCE_INVALIDATION_CHANNEL)
+            # Anything published while we weren't listening is lost
+            search_results.clear()
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    search_results.invalidate_source(json.loads(message["data"])["source_id"])
+            finally:
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Search cache invalidation listener error: {e}")
+            await asyncio.sleep(5)
@@ -0,0 +1,103 @@
+"""
+Incremental Recrawl Helpers
+===========================
+Page fingerprints (HTTP validators + markdown hash) and chunk-level diffs
+so recrawls only re-process pages and chunks that actually changed.
+"""
+
+import asyncio
+import hashlib
+import logging
+from typing import List, Dict, Any, Tuple, Optional
+
+import httpx
+
+logger = logging.getLogger("cloudmigrate-recrawl")
+
+# Status codes that mean a previously crawled page is gone
+GONE_STATUS_CODES = (404, 410)
+
+
+def content_hash(text: str) -> str:
+    """sha256 hex digest used for page and chunk fingerprints."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_validators(headers: Optional[Dict[str, Any]]) -> Tuple[Optional[str], Optional[str]]:
+    """Extract (ETag, Last-Modified) from response headers (case-insensitive)."""
+    if not headers:
+        return None, None
+    lowered = {str(k).lower(): v for k, v in headers.items()}
+    return lowered.get("etag"), lowered.get("last-modified")
+
+
+def changed_chunk_indices(chunk_hashes: List[str], previous_hashes: List[str]) -> List[int]:
+    """Indices of chunks that are new or whose content differs from the previous crawl."""
+    return [
+        i for i, h in enumerate(chunk_hashes)
+        if i >= len(previous_hashes) or previous_hashes[i] != h
+    ]
+
+
+async def probe_unchanged(
+    urls: List[str],
+    fingerprints: Dict[str, Dict[str, Any]],
+    max_concurrent: int = 20,
+    timeout: float = 10.0,
+) -> Dict[str, List[str]]:
+    """
+    Check stored HTTP validators with conditional HEAD requests before crawling.
+
+    Only URLs with a stored ETag or Last-Modified are probed; everything else
+    is reported as changed. Probe errors are treated as changed so the page
+    still gets crawled.
+
+    Returns:
+        {"changed": [...], "unchanged": [...], "gone": [...]}
+    """
+    outcome: Dict[str, List[str]] = {"changed": [], "unchanged": [], "gone": []}
+    to_probe = []
+    for url in urls:
+        fp = fingerprints.get(url)
+        if fp and (fp.get("etag") or fp.get("last_modified")):
+            to_probe.append(url)
+        else:
+            outcome["changed"].append(url)
+
+    if not to_probe:
+        return outcome
+
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def probe(client: httpx.AsyncClient, url: str) -> str:
+        fp = fingerprints[url]
+        headers = {}
+        if fp.get("etag"):
+            headers["If-None-Match"] = fp["etag"]
+        if fp.get("last_modified"):
+            headers["If-Modified-Since"] = fp["last_modified"]
+        try:
+            async with semaphore:
+                resp = await client.head(url, headers=headers)
+        except Exception as e:
+            logger.debug(f"Probe failed for {url}: {e}")
+            return "changed"
+
+        if resp.status_code == 304:
+            return "unchanged"
+        if resp.status_code in GONE_STATUS_CODES:
+            return "gone"
+        # Some servers ignore conditionals on HEAD but still return validators
+        etag, last_modified = get_validators(resp.headers)
+        if (etag and etag == fp.get("etag")) or (
+            not etag and last_modified and last_modified == fp.get("last_modified")
+        ):
+            return "unchanged"
+        return "changed"
+
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+        results = await asyncio.gather(*[probe(client, url) for url in to_probe])
+
+    for url, status in zip(to_probe, results):
+        outcome[status].append(url)
+    return outcome
@@ -3,15 +3,28 @@ Redis-based Job Queue for Crawl4AI
 
 Provides:
 - Persistent job storage (survives restarts)
-- Per-tenant rate limiting
-- Concurrent crawl limits
+- Per-tenant rate limiting (sliding one-hour window)
+- Concurrent crawl limits, checked and applied atomically with job
+  creation by one Lua script (ADMIT_JOB_SCRIPT)
 - Job expiration (auto-cleanup)
+- Job indexes (sorted sets by created_at) for paginated listing
+- A job stream (consumer group) feeding crawl_worker.py processes
+- Live job events on a pub/sub channel per job (crawl:events:{job_id})
+
+Job lifecycle: queued -> running -> completed | failed. A running job whose
+worker stops heartbeating is reclaimed by another worker and runs again
+(attempts counts the deliveries since the job was last queued); failed
+jobs can be re-queued by resume, which starts the count again.
+
+Jobs are Redis hashes with one JSON-encoded value per field, so a progress
+or status update rewrites only the fields it changes.
 """
 
 import os
 import json
+import time
 import redis.asyncio as redis
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator
 from datetime import datetime, timedelta
 import uuid
 
@@ -26,7 +39,104 @@ JOB_EXPIRY_HOURS = int(os.getenv("JOB_EXPIRY_HOURS", "24"))
 # Redis key prefixes
 JOB_PREFIX = "crawl:job:"
 TENANT_ACTIVE_PREFIX = "crawl:active:"
-TENANT_HOURLY_PREFIX = "crawl:hourly:"
+# Sorted set of job ids scored by submission time (sliding window)
+TENANT_HOURLY_PREFIX = "crawl:hourly_window:"
+HOURLY_WINDOW_SECONDS = 3600
+ACTIVE_SET_EXPIRY_SECONDS = 3600 * 2  # safety net if a job never finishes
+JOB_INDEX_KEY = "crawl:jobs:all"
+
+JOB_EVENTS_PREFIX = "crawl:events:"
+TERMINAL_JOB_STATUSES = ("completed", "failed")
+
+# Stream of job ids consumed by crawl workers
+JOB_STREAM_KEY = "crawl:stream"
+JOB_STREAM_GROUP = "crawl-workers"
+JOB_STREAM_MAXLEN = 10000
+# Seconds without a heartbeat before a running job is reclaimed by another worker
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+# Running jobs heartbeat several times per visibility timeout
+JOB_HEARTBEAT_SECONDS = max(1.0, JOB_VISIBILITY_TIMEOUT / 5)
+TENANT_JOB_INDEX_PREFIX = "crawl:jobs:tenant:"
+
+# Fields every job has; unset ones are not stored in the hash
+JOB_FIELDS = ("id", "url", "tenant_id", "status", "params", "created_at",
+              "started_at", "completed_at", "result", "error",
+              "worker", "attempts", "heartbeat_at")
+
+
+def _encode_job(job: Dict[str, Any]) -> Dict[str, str]:
+    return {field: json.dumps(value) for field, value in job.items() if value is not None}
+
+
+def _decode_job(data: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    if not data:
+        return None
+    job = dict.fromkeys(JOB_FIELDS)
+    job.update((field, json.loads(value)) for field, value in data.items())
+    return job
+
+
+def job_is_live(job: Dict[str, Any]) -> bool:
+    """True if the job is running and its runner heartbeated within JOB_VISIBILITY_TIMEOUT."""
+    heartbeat = job.get("heartbeat_at")
+    return job.get("status") == "running" and bool(heartbeat) and (
+        datetime.utcnow() - datetime.fromisoformat(heartbeat)
+    ).total_seconds() < JOB_VISIBILITY_TIMEOUT
+
+
+def _rate_limit_result(active_count: int, hourly_count: int) -> Dict[str, Any]:
+    """Rate limit status (see check_rate_limit) for the given counts."""
+    result = {
+        "active_crawls": active_count,
+        "hourly_crawls": hourly_count,
+        "limits": {
+            "concurrent": MAX_CONCURRENT_CRAWLS_PER_TENANT,
+            "hourly": MAX_CRAWLS_PER_HOUR_PER_TENANT
+        }
+    }
+    
+    if active_count >= MAX_CONCURRENT_CRAWLS_PER_TENANT:
+        result["allowed"] = False
+        result["reason"] = f"Maximum concurrent crawls ({MAX_CONCURRENT_CRAWLS_PER_TENANT}) reached. Please wait for current crawls to complete."
+        return result
+    
+    if hourly_count >= MAX_CRAWLS_PER_HOUR_PER_TENANT:
+        result["allowed"] = False
+        result["reason"] = f"Hourly crawl limit ({MAX_CRAWLS_PER_HOUR_PER_TENANT}) reached. Please try again later."
+        return result
+    
+    result["allowed"] = True
+    return result
+
+
+# Check both limits, register the job and update counters in one step.
+# KEYS: active set, hourly window, job hash, global index, tenant index
+# ARGV: job id, now, max concurrent, max hourly, window, active ttl, job ttl,
+#       then the job hash as field/value pairs
+# Returns {admitted (0/1), active crawls, crawls in window}
+ADMIT_JOB_SCRIPT = """
+local job_id = ARGV[1]
+local now = tonumber(ARGV[2])
+local window = tonumber(ARGV[5])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - window)
+local active = redis.call('SCARD', KEYS[1])
+local hourly = redis.call('ZCARD', KEYS[2])
+
+if active >= tonumber(ARGV[3]) or hourly >= tonumber(ARGV[4]) then
+    return {0, active, hourly}
+end
+
+redis.call('SADD', KEYS[1], job_id)
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('ZADD', KEYS[2], ARGV[2], job_id)
+redis.call('EXPIRE', KEYS[2], window)
+redis.call('HSET', KEYS[3], unpack(ARGV, 8))
+redis.call('EXPIRE', KEYS[3], ARGV[7])
+redis.call('ZADD', KEYS[4], ARGV[2], job_id)
+redis.call('ZADD', KEYS[5], ARGV[2], job_id)
+return {1, active + 1, hourly + 1}
+"""
 
 
 class RedisJobManager:
@@ -34,6 +144,7 @@ class RedisJobManager:
     
     def __init__(self):
         self._redis: Optional[redis.Redis] = None
+        self._admit_job = None
     
     async def get_redis(self) -> redis.Redis:
         """Get or create Redis connection."""
@@ -55,6 +166,8 @@ class RedisJobManager:
         """
         Check if tenant can start a new crawl.
         
+        Advisory only: create_job re-checks atomically when it admits a job.
+        
         Returns:
             {
                 "allowed": bool,
@@ -65,54 +178,15 @@ class RedisJobManager:
             }
         """
         r = await self.get_redis()
-        
-        # Check concurrent crawls
         active_key = f"{TENANT_ACTIVE_PREFIX}{tenant_id}"
-        active_count = await r.scard(active_key)
-        
-        # Check hourly limit
         hourly_key = f"{TENANT_HOURLY_PREFIX}{tenant_id}"
-        hourly_count = await r.get(hourly_key)
-        hourly_count = int(hourly_count) if hourly_count else 0
-        
-        result = {
-            "active_crawls": active_count,
-            "hourly_crawls": hourly_count,
-            "limits": {
-                "concurrent": MAX_CONCURRENT_CRAWLS_PER_TENANT,
-                "hourly": MAX_CRAWLS_PER_HOUR_PER_TENANT
-            }
-        }
-        
-        if active_count >= MAX_CONCURRENT_CRAWLS_PER_TENANT:
-            result["allowed"] = False
-            result["reason"] = f"Maximum concurrent crawls ({MAX_CONCURRENT_CRAWLS_PER_TENANT}) reached. Please wait for current crawls to complete."
-            return result
-        
-        if hourly_count >= MAX_CRAWLS_PER_HOUR_PER_TENANT:
-            result["allowed"] = False
-            result["reason"] = f"Hourly crawl limit ({MAX_CRAWLS_PER_HOUR_PER_TENANT}) reached. Please try again later."
-            return result
-        
-        result["allowed"] = True
-        return result
-    
-    async def increment_rate_counters(self, tenant_id: str, job_id: str):
-        """Increment rate limit counters when starting a crawl."""
-        r = await self.get_redis()
         
-        # Add to active set
-        active_key = f"{TENANT_ACTIVE_PREFIX}{tenant_id}"
-        await r.sadd(active_key, job_id)
-        await r.expire(active_key, 3600 * 2)  # 2 hour expiry for safety
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.scard(active_key)
+            pipe.zcount(hourly_key, time.time() - HOURLY_WINDOW_SECONDS, "+inf")
+            active_count, hourly_count = await pipe.execute()
         
-        # Increment hourly counter
-        hourly_key = f"{TENANT_HOURLY_PREFIX}{tenant_id}"
-        await r.incr(hourly_key)
-        # Set expiry if new key
-        ttl = await r.ttl(hourly_key)
-        if ttl == -1:  # No expiry set
-            await r.expire(hourly_key, 3600)  # 1 hour
+        return _rate_limit_result(active_count, hourly_count)
     
     async def decrement_active_crawls(self, tenant_id: str, job_id: str):
         """Remove job from active set when completed."""
@@ -130,16 +204,9 @@ class RedisJobManager:
         
         Returns job data or error if rate limited.
         """
-        # Check rate limits first
-        rate_check = await self.check_rate_limit(tenant_id)
-        if not rate_check["allowed"]:
-            return {
-                "success": False,
-                "error": rate_check["reason"],
-                "rate_limit": rate_check
-            }
-        
         r = await self.get_redis()
+        if self._admit_job is None:
+            self._admit_job = r.register_script(ADMIT_JOB_SCRIPT)
         
         job_id = str(uuid.uuid4())[:8]
         job_data = {
@@ -155,66 +222,223 @@ class RedisJobManager:
             "error": None
         }
         
-        # Store job
-        job_key = f"{JOB_PREFIX}{job_id}"
-        await r.set(job_key, json.dumps(job_data), ex=3600 * JOB_EXPIRY_HOURS)
+        # Check limits, store the job, index it and count it in one atomic script
+        fields = [item for pair in _encode_job(job_data).items() for item in pair]
+        admitted, active_count, hourly_count = await self._admit_job(
+            keys=[
+                f"{TENANT_ACTIVE_PREFIX}{tenant_id}",
+                f"{TENANT_HOURLY_PREFIX}{tenant_id}",
+                f"{JOB_PREFIX}{job_id}",
+                JOB_INDEX_KEY,
+                f"{TENANT_JOB_INDEX_PREFIX}{tenant_id}",
+            ],
+            args=[
+                job_id, repr(time.time()), MAX_CONCURRENT_CRAWLS_PER_TENANT, MAX_CRAWLS_PER_HOUR_PER_TENANT,
+                HOURLY_WINDOW_SECONDS, ACTIVE_SET_EXPIRY_SECONDS, 3600 * JOB_EXPIRY_HOURS, *fields,
+            ],
+        )
         
-        # Update rate counters
-        await self.increment_rate_counters(tenant_id, job_id)
+        if not admitted:
+            # Counts are as seen by the script, before this submission
+            rate_check = _rate_limit_result(active_count, hourly_count)
+            return {
+                "success": False,
+                "error": rate_check["reason"],
+                "rate_limit": rate_check
+            }
         
         return {
             "success": True,
             "job": job_data
         }
     
+    async def _read_job(self, r: redis.Redis, job_key: str) -> Dict[str, str]:
+        """Raw job hash; converts a job stored as a JSON string by older versions."""
+        try:
+            return await r.hgetall(job_key)
+        except redis.ResponseError:
+            data = await r.get(job_key)
+            if not data:
+                return {}
+            encoded = _encode_job(json.loads(data))
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.delete(job_key)
+                pipe.hset(job_key, mapping=encoded)
+                pipe.expire(job_key, 3600 * JOB_EXPIRY_HOURS)
+                await pipe.execute()
+            return encoded
+    
     async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
         """Get a job by ID."""
         r = await self.get_redis()
-        job_key = f"{JOB_PREFIX}{job_id}"
-        data = await r.get(job_key)
-        return json.loads(data) if data else None
+        return _decode_job(await self._read_job(r, f"{JOB_PREFIX}{job_id}"))
     
     async def update_job(self, job_id: str, **updates) -> bool:
-        """Update job fields."""
+        """Update job fields (only the given fields are written)."""
         r = await self.get_redis()
         job_key = f"{JOB_PREFIX}{job_id}"
         
-        data = await r.get(job_key)
-        if not data:
-            return False
+        job = _decode_job(await self._read_job(r, job_key))
+        if not job or not updates:
+            return bool(job)
         
-        job = json.loads(data)
-        job.update(updates)
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.hset(job_key, mapping={field: json.dumps(value) for field, value in updates.items()})
+            # If starting, set started_at once; if completing, stamp completed_at
+            if updates.get("status") == "running":
+                pipe.hsetnx(job_key, "started_at", json.dumps(datetime.utcnow().isoformat()))
+            if updates.get("status") in ("completed", "failed"):
+                pipe.hset(job_key, "completed_at", json.dumps(datetime.utcnow().isoformat()))
+            pipe.expire(job_key, 3600 * JOB_EXPIRY_HOURS)
+            await pipe.execute()
         
-        # If completing, update timestamps and remove from active
-        if updates.get("status") in ("completed", "failed"):
-            job["completed_at"] = datetime.utcnow().isoformat()
+        # Completed jobs no longer count against the tenant's concurrency
+        if updates.get("status") in TERMINAL_JOB_STATUSES:
             await self.decrement_active_crawls(job["tenant_id"], job_id)
         
-        if updates.get("status") == "running" and not job.get("started_at"):
-            job["started_at"] = datetime.utcnow().isoformat()
-        
-        await r.set(job_key, json.dumps(job), ex=3600 * JOB_EXPIRY_HOURS)
+        if "status" in updates:
+            await self.publish_event(job_id, {
+                "type": "status",
+                "status": updates["status"],
+                "result": updates.get("result"),
+                "error": updates.get("error"),
+            })
+        elif "progress" in updates:
+            await self.publish_event(job_id, {"type": "progress", "progress": updates["progress"]})
         return True
     
-    async def list_jobs(self, tenant_id: str = None, limit: int = 20) -> List[Dict[str, Any]]:
-        """List recent jobs, optionally filtered by tenant."""
+    async def list_jobs(self, tenant_id: str = None, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """List recent jobs (newest first), optionally filtered by tenant."""
         r = await self.get_redis()
+        index_key = f"{TENANT_JOB_INDEX_PREFIX}{tenant_id}" if tenant_id else JOB_INDEX_KEY
+        
+        # Index entries can't expire individually: trim anything far older
+        # than JOB_EXPIRY_HOURS, then drop listed ids whose hash has expired
+        # (a tenant's ids leave its index the next time it lists jobs)
+        cutoff = time.time() - 2 * 3600 * JOB_EXPIRY_HOURS
+        await r.zremrangebyscore(index_key, "-inf", cutoff)
+        
+        job_ids = await r.zrevrange(index_key, offset, offset + limit - 1)
+        if not job_ids:
+            return []
         
-        # Get all job keys
-        keys = await r.keys(f"{JOB_PREFIX}*")
+        async with r.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hgetall(f"{JOB_PREFIX}{job_id}")
+            results = await pipe.execute(raise_on_error=False)
         
         jobs = []
-        for key in keys:
-            data = await r.get(key)
-            if data:
-                job = json.loads(data)
-                if tenant_id is None or job.get("tenant_id") == tenant_id:
-                    jobs.append(job)
+        expired = []
+        for job_id, data in zip(job_ids, results):
+            if isinstance(data, redis.ResponseError):
+                data = await self._read_job(r, f"{JOB_PREFIX}{job_id}")
+            job = _decode_job(data)
+            if job:
+                jobs.append(job)
+            else:
+                expired.append(job_id)
+        
+        if expired:
+            await self._unindex(r, index_key, expired)
+        return jobs
+    
+    async def count_jobs(self, tenant_id: str = None) -> int:
+        """Number of indexed jobs (may include a few not yet pruned)."""
+        r = await self.get_redis()
+        index_key = f"{TENANT_JOB_INDEX_PREFIX}{tenant_id}" if tenant_id else JOB_INDEX_KEY
+        return await r.zcard(index_key)
+    
+    async def _unindex(self, r: redis.Redis, index_key: str, job_ids: List[str]) -> None:
+        """Remove expired job ids from an index and the global index."""
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.zrem(index_key, *job_ids)
+            pipe.zrem(JOB_INDEX_KEY, *job_ids)
+            await pipe.execute()
+    
+    # ============================================
+    # LIVE EVENTS
+    # ============================================
+    
+    async def publish_event(self, job_id: str, event: Dict[str, Any]) -> None:
+        """Publish a job event to its subscribers (dropped if nobody listens)."""
+        r = await self.get_redis()
+        await r.publish(f"{JOB_EVENTS_PREFIX}{job_id}", json.dumps({**event, "job_id": job_id, "ts": time.time()}))
+    
+    async def job_events(self, job_id: str, idle_timeout: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Subscribe to a job's events.
         
-        # Sort by created_at descending
-        jobs.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-        return jobs[:limit]
+        Yields each event, or None after idle_timeout seconds without one
+        (so callers can send keep-alives). The subscription is active before
+        the first yield, so read the job's current state after starting this.
+        """
+        r = await self.get_redis()
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(f"{JOB_EVENTS_PREFIX}{job_id}")
+        try:
+            yield None
+            while True:
+                message = await pubsub.get_message(timeout=idle_timeout)
+                yield json.loads(message["data"]) if message else None
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+    
+    # ============================================
+    # WORKER QUEUE
+    # ============================================
+    
+    async def ensure_job_stream(self) -> None:
+        """Create the job stream and its consumer group if missing."""
+        r = await self.get_redis()
+        try:
+            await r.xgroup_create(JOB_STREAM_KEY, JOB_STREAM_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+    
+    async def enqueue_job(self, job_id: str) -> None:
+        """Queue a job for the crawl workers (status -> queued, attempts reset)."""
+        await self.ensure_job_stream()
+        # A new submission or resume is a fresh delivery; only lost-worker redeliveries count
+        await self.update_job(job_id, status="queued", error=None, completed_at=None, attempts=0)
+        r = await self.get_redis()
+        await r.xadd(JOB_STREAM_KEY, {"job_id": job_id}, maxlen=JOB_STREAM_MAXLEN, approximate=True)
+    
+    async def claim_job(self, job_id: str, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Mark a job as running on worker_id and count the attempt.
+        
+        Returns the job, or None if it no longer exists or already finished
+        (a redelivered message for a completed job).
+        """
+        job = await self.get_job(job_id)
+        if not job or job["status"] not in ("queued", "running"):
+            return None
+        
+        r = await self.get_redis()
+        job_key = f"{JOB_PREFIX}{job_id}"
+        now = json.dumps(datetime.utcnow().isoformat())
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.hincrby(job_key, "attempts", 1)
+            pipe.hset(job_key, mapping={"status": json.dumps("running"), "worker": json.dumps(worker_id), "heartbeat_at": now})
+            pipe.hsetnx(job_key, "started_at", now)
+            pipe.expire(job_key, 3600 * JOB_EXPIRY_HOURS)
+            attempts = (await pipe.execute())[0]
+        
+        job.update(status="running", worker=worker_id, attempts=attempts)
+        return job
+    
+    async def heartbeat_jobs(self, job_ids: List[str]) -> None:
+        """Record that the workers running these jobs are alive."""
+        if not job_ids:
+            return
+        r = await self.get_redis()
+        now = json.dumps(datetime.utcnow().isoformat())
+        async with r.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hset(f"{JOB_PREFIX}{job_id}", "heartbeat_at", now)
+            await pipe.execute()
     
     async def get_tenant_stats(self, tenant_id: str) -> Dict[str, Any]:
         """Get crawl statistics for a tenant."""
@@ -223,15 +447,21 @@ class RedisJobManager:
         active_key = f"{TENANT_ACTIVE_PREFIX}{tenant_id}"
         hourly_key = f"{TENANT_HOURLY_PREFIX}{tenant_id}"
         
-        active_count = await r.scard(active_key)
-        hourly_count = await r.get(hourly_key)
-        hourly_ttl = await r.ttl(hourly_key)
+        now = time.time()
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.scard(active_key)
+            pipe.zcount(hourly_key, now - HOURLY_WINDOW_SECONDS, "+inf")
+            pipe.zrangebyscore(hourly_key, now - HOURLY_WINDOW_SECONDS, "+inf", start=0, num=1, withscores=True)
+            active_count, hourly_count, oldest = await pipe.execute()
+        
+        # The window frees a slot when its oldest submission turns an hour old
+        hourly_reset = oldest[0][1] + HOURLY_WINDOW_SECONDS - now if oldest else 0
         
         return {
             "tenant_id": tenant_id,
             "active_crawls": active_count,
-            "hourly_crawls": int(hourly_count) if hourly_count else 0,
-            "hourly_reset_seconds": max(0, hourly_ttl),
+            "hourly_crawls": hourly_count,
+            "hourly_reset_seconds": max(0, int(hourly_reset)),
             "limits": {
                 "max_concurrent": MAX_CONCURRENT_CRAWLS_PER_TENANT,
                 "max_hourly": MAX_CRAWLS_PER_HOUR_PER_TENANT
@@ -270,6 +500,24 @@ async def update_crawl_job(job_id: str, **updates) -> bool:
     return await manager.update_job(job_id, **updates)
 
 
+async def publish_job_event(job_id: str, event: Dict[str, Any]) -> None:
+    """Publish a live event for a crawl job."""
+    manager = await get_job_manager()
+    await manager.publish_event(job_id, event)
+
+
+async def enqueue_crawl_job(job_id: str) -> None:
+    """Queue a crawl job for crawl_worker.py."""
+    manager = await get_job_manager()
+    await manager.enqueue_job(job_id)
+
+
+async def heartbeat_crawl_jobs(job_ids: List[str]) -> None:
+    """Record that the processes running these crawl jobs are alive."""
+    manager = await get_job_manager()
+    await manager.heartbeat_jobs(job_ids)
+
+
 async def check_tenant_rate_limit(tenant_id: str) -> Dict[str, Any]:
     """Check if tenant can start a new crawl."""
     manager = await get_job_manager()
@@ -282,7 +530,13 @@ async def get_tenant_crawl_stats(tenant_id: str) -> Dict[str, Any]:
     return await manager.get_tenant_stats(tenant_id)
 
 
-async def list_tenant_jobs(tenant_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+async def list_tenant_jobs(tenant_id: str, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
     """List recent jobs for a tenant."""
     manager = await get_job_manager()
-    return await manager.list_jobs(tenant_id, limit)
+    return await manager.list_jobs(tenant_id, limit, offset)
+
+
+async def count_tenant_jobs(tenant_id: str) -> int:
+    """Number of recent jobs for a tenant."""
+    manager = await get_job_manager()
+    return await manager.count_jobs(tenant_id)
@@ -0,0 +1,179 @@
+"""
+Cross-Encoder Reranking Service
+===============================
+Keeps CrossEncoder inference off the event loop and amortises it across
+concurrent requests.
+
+- Inference runs in a dedicated single-thread executor
+- Pairs from concurrent rerank calls are micro-batched into one predict()
+- (query_hash, chunk) -> score LRU skips re-scoring repeated queries
+- Rerank latency is recorded under the "rerank" metric (p50/p99)
+"""
+
+import os
+import time
+import zlib
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger("cloudmigrate-reranker")
+
+# Max pairs per predict() call and how long to wait for more requests to join a batch
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "64"))
+RERANK_MAX_WAIT_MS = float(os.getenv("RERANK_MAX_WAIT_MS", "5"))
+
+# Cached (query, chunk) scores
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+
+# Candidates fetched per requested result before reranking (k x N)
+RERANK_OVERFETCH = int(os.getenv("RERANK_OVERFETCH", "4"))
+
+
+def _query_hash(query: str) -> str:
+    return hashlib.sha1(query.strip().lower().encode("utf-8")).hexdigest()
+
+
+def _chunk_key(result: Dict[str, Any], text: str) -> Tuple[Any, int]:
+    """Chunk id plus a content checksum, so recrawled chunks keeping their id are re-scored."""
+    return result.get("id"), zlib.crc32(text.encode("utf-8"))
+
+
+class RerankService:
+    """Micro-batching, cached cross-encoder scorer."""
+
+    def __init__(
+        self,
+        model,
+        batch_size: int = RERANK_BATCH_SIZE,
+        max_wait_ms: float = RERANK_MAX_WAIT_MS,
+        cache_size: int = RERANK_CACHE_SIZE,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple, float]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._batch_loop())
+
+    async def _batch_loop(self) -> None:
+        """Collect queued requests into batches and score them in the executor."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            pair_count = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while pair_count < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                pair_count += len(item[0])
+
+            pairs = [pair for item_pairs, _ in batch for pair in item_pairs]
+            start = time.perf_counter()
+            try:
+                scores = await loop.run_in_executor(
+                    self._executor,
+                    lambda: self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False),
+                )
+                metrics.observe("rerank_inference", time.perf_counter() - start)
+                metrics.increment("rerank_pairs_scored", len(pairs))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_pairs, future in batch:
+                if not future.done():
+                    future.set_result([float(s) for s in scores[offset:offset + len(item_pairs)]])
+                offset += len(item_pairs)
+
+    async def _predict(self, pairs: List[List[str]]) -> List[float]:
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((pairs, future))
+        return await future
+
+    def _cache_get(self, key: Tuple) -> Optional[float]:
+        score = self._cache.get(key)
+        if score is not None:
+            self._cache.move_to_end(key)
+        return score
+
+    def _cache_put(self, key: Tuple, score: float) -> None:
+        self._cache[key] = score
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def rerank(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        content_key: str = "content",
+        top_k: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Score results against the query and sort by rerank_score.
+
+        Args:
+            query: The search query
+            results: Search results (typically over-fetched by RERANK_OVERFETCH)
+            content_key: Key holding each result's text
+            top_k: Return only the best top_k results
+
+        Returns:
+            Reranked results; on scoring errors the input order is kept
+        """
+        if not results:
+            return results
+
+        start = time.perf_counter()
+        qhash = _query_hash(query)
+        keys = []
+        misses = []
+        for i, result in enumerate(results):
+            text = result.get(content_key, "") or ""
+            key = (qhash,) + _chunk_key(result, text)
+            keys.append(key)
+            score = self._cache_get(key)
+            if score is None:
+                misses.append(i)
+            else:
+                result["rerank_score"] = score
+
+        metrics.increment("rerank_cache_hits", len(results) - len(misses))
+        metrics.increment("rerank_cache_misses", len(misses))
+
+        try:
+            if misses:
+                scores = await self._predict([[query, results[i].get(content_key, "") or ""] for i in misses])
+                for i, score in zip(misses, scores):
+                    results[i]["rerank_score"] = score
+                    self._cache_put(keys[i], score)
+        except Exception as e:
+            logger.error(f"Error during reranking: {e}")
+            return results[:top_k] if top_k else results
+
+        reranked = sorted(results, key=lambda x: x.get("rerank_score", 0), reverse=True)
+        metrics.observe("rerank", time.perf_counter() - start)
+        return reranked[:top_k] if top_k else reranked
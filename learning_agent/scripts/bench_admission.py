@@ -0,0 +1,112 @@
+"""
+Crawl Admission Load Test
+=========================
+Fires parallel crawl submissions for one tenant at REDIS_URL and checks
+that the Lua admission script never admits more jobs than the limits
+allow, alongside the previous check-then-increment sequence for contrast.
+
+Usage:
+    python scripts/bench_admission.py [--submits 200] [--concurrent 5] [--hourly 20]
+
+Uses a throwaway tenant id and deletes its keys afterwards.
+"""
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dotenv import load_dotenv
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def legacy_admit(r, tenant_id: str) -> bool:
+    """The old sequence: SCARD + GET, then SADD/EXPIRE/INCR/TTL/EXPIRE."""
+    import redis_jobs
+    active_key = f"{redis_jobs.TENANT_ACTIVE_PREFIX}{tenant_id}"
+    hourly_key = f"legacy:hourly:{tenant_id}"
+    active = await r.scard(active_key)
+    hourly = int(await r.get(hourly_key) or 0)
+    if active >= redis_jobs.MAX_CONCURRENT_CRAWLS_PER_TENANT or hourly >= redis_jobs.MAX_CRAWLS_PER_HOUR_PER_TENANT:
+        return False
+    job_id = str(uuid.uuid4())[:8]
+    await r.sadd(active_key, job_id)
+    await r.expire(active_key, 3600 * 2)
+    await r.incr(hourly_key)
+    if await r.ttl(hourly_key) == -1:
+        await r.expire(hourly_key, 3600)
+    return True
+
+
+async def timed(coro) -> Tuple[bool, float]:
+    start = time.perf_counter()
+    admitted = await coro
+    return admitted, (time.perf_counter() - start) * 1000
+
+
+async def run(name: str, submits: int, admit) -> int:
+    results = await asyncio.gather(*[timed(admit()) for _ in range(submits)])
+    latencies = [ms for _, ms in results]
+    admitted = sum(1 for ok, _ in results if ok)
+    print(f"{name:<8} admitted {admitted:4d}/{submits}  "
+          f"p50 {statistics.median(latencies):6.2f} ms  p95 {percentile(latencies, 0.95):6.2f} ms  "
+          f"p99 {percentile(latencies, 0.99):6.2f} ms")
+    return admitted
+
+
+async def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--submits", type=int, default=200)
+    parser.add_argument("--concurrent", type=int, default=5, help="MAX_CONCURRENT_CRAWLS_PER_TENANT")
+    parser.add_argument("--hourly", type=int, default=20, help="MAX_CRAWLS_PER_HOUR_PER_TENANT")
+    args = parser.parse_args()
+
+    # Limits are read at import
+    os.environ["MAX_CONCURRENT_CRAWLS_PER_TENANT"] = str(args.concurrent)
+    os.environ["MAX_CRAWLS_PER_HOUR_PER_TENANT"] = str(args.hourly)
+    import redis_jobs
+
+    manager = redis_jobs.RedisJobManager()
+    r = await manager.get_redis()
+    expected = min(args.concurrent, args.hourly)
+    print(f"{args.submits} parallel submits, limits concurrent={args.concurrent} hourly={args.hourly}\n")
+
+    tenants = [f"loadtest-{uuid.uuid4().hex[:8]}" for _ in range(2)]
+    try:
+        async def lua_admit() -> bool:
+            return (await manager.create_job("https://example.com", tenants[0]))["success"]
+
+        admitted = await run("lua", args.submits, lua_admit)
+        active = await r.scard(f"{redis_jobs.TENANT_ACTIVE_PREFIX}{tenants[0]}")
+        print(f"         limit {expected}, active set {active}: {'OK' if admitted == active == expected else 'VIOLATED'}")
+
+        admitted = await run("legacy", args.submits, lambda: legacy_admit(r, tenants[1]))
+        print(f"         limit {expected}: {'OK' if admitted <= expected else 'VIOLATED'}")
+    finally:
+        for tenant_id in tenants:
+            job_ids = await r.zrange(f"{redis_jobs.TENANT_JOB_INDEX_PREFIX}{tenant_id}", 0, -1)
+            await r.delete(
+                f"{redis_jobs.TENANT_ACTIVE_PREFIX}{tenant_id}",
+                f"{redis_jobs.TENANT_HOURLY_PREFIX}{tenant_id}",
+                f"{redis_jobs.TENANT_JOB_INDEX_PREFIX}{tenant_id}",
+                f"legacy:hourly:{tenant_id}",
+                *[f"{redis_jobs.JOB_PREFIX}{job_id}" for job_id in job_ids],
+            )
+            if job_ids:
+                await r.zrem(redis_jobs.JOB_INDEX_KEY, *job_ids)
+        await manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
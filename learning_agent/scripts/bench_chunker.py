@@ -0,0 +1,180 @@
+"""
+Markdown Chunker Benchmark
+==========================
+Compares the token-aware chunker (markdown_chunker.chunk_markdown) with the
+previous character-window smart_chunk_markdown on large documentation pages.
+
+Usage:
+    python scripts/bench_chunker.py [--url URL ...] [--file PATH ...] [--chunk-size 5000] [--repeat 5]
+
+Without --url/--file a few large AWS documentation pages are fetched as
+markdown through crawl4ai. Reports throughput plus chunk-quality stats:
+token size distribution, chunks over the token budget, chunks that cut a
+code fence or table, and chunks starting mid-sentence.
+"""
+
+import os
+import re
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from typing import List, Dict, Any, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dotenv import load_dotenv
+
+from tokenizer import count_tokens
+from markdown_chunker import chunk_markdown, chunk_size_to_tokens
+
+DEFAULT_URLS = [
+    "https://docs.aws.amazon.com/AmazonS3/latest/userguide/bucketnamingrules.html",
+    "https://docs.aws.amazon.com/lambda/latest/dg/configuration-concurrency.html",
+    "https://docs.aws.amazon.com/vpc/latest/userguide/vpc-peering.html",
+    "https://docs.aws.amazon.com/IAM/latest/UserGuide/reference_policies_elements_condition_operators.html",
+]
+
+
+def legacy_smart_chunk_markdown(text: str, chunk_size: int = 5000) -> List[str]:
+    """The character-window chunker this benchmark is measured against."""
+    chunks = []
+    start = 0
+    text_length = len(text)
+
+    while start < text_length:
+        end = start + chunk_size
+        if end >= text_length:
+            chunks.append(text[start:].strip())
+            break
+
+        chunk = text[start:end]
+        code_block = chunk.rfind('```')
+        if code_block != -1 and code_block > chunk_size * 0.3:
+            end = start + code_block
+        elif '\n\n' in chunk:
+            last_break = chunk.rfind('\n\n')
+            if last_break > chunk_size * 0.3:
+                end = start + last_break
+        elif '. ' in chunk:
+            last_period = chunk.rfind('. ')
+            if last_period > chunk_size * 0.3:
+                end = start + last_period + 1
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end
+
+    return chunks
+
+
+def legacy_with_metadata(text: str, chunk_size: int = 5000) -> List[Dict[str, Any]]:
+    """Legacy chunking plus the per-chunk extract_section_info scan and token count it needed."""
+    chunks = []
+    for chunk in legacy_smart_chunk_markdown(text, chunk_size):
+        headers = re.findall(r'^(#+)\s+(.+)$', chunk, re.MULTILINE)
+        chunks.append({
+            "headers": '; '.join(f'{h[0]} {h[1]}' for h in headers),
+            "char_count": len(chunk),
+            "word_count": len(chunk.split()),
+            "token_count": count_tokens(chunk),
+        })
+    return chunks
+
+
+def _headerless_table(chunk: str) -> bool:
+    """True if the chunk's first table row isn't followed by a |---| separator (cut table)."""
+    lines = chunk.splitlines()
+    for i, line in enumerate(lines):
+        if line.lstrip().startswith("|"):
+            following = lines[i + 1].strip() if i + 1 < len(lines) else ""
+            return not (following and set(following) <= set("|-: "))
+    return False
+
+
+def quality(chunks: List[str], max_tokens: int) -> Dict[str, Any]:
+    """Size distribution and structural damage for a list of chunk texts."""
+    tokens = sorted(count_tokens(c) for c in chunks) or [0]
+    split_fences = sum(1 for c in chunks if c.count("```") % 2)
+    split_tables = sum(1 for c in chunks if _headerless_table(c))
+    mid_sentence = sum(1 for c in chunks if c[:1].islower())
+    return {
+        "chunks": len(chunks),
+        "tokens_mean": round(statistics.mean(tokens), 1),
+        "tokens_p95": tokens[min(len(tokens) - 1, int(len(tokens) * 0.95))],
+        "tokens_max": tokens[-1],
+        "over_budget": sum(1 for t in tokens if t > max_tokens),
+        "split_code_fences": split_fences,
+        "headerless_table_chunks": split_tables,
+        "mid_sentence_starts": mid_sentence,
+    }
+
+
+def bench(name: str, fn: Callable[[str], List[str]], docs: List[str], repeat: int) -> float:
+    total_bytes = sum(len(d.encode("utf-8")) for d in docs)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for doc in docs:
+            fn(doc)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f"{name:<12} {best * 1000:9.1f} ms  {total_bytes / best / 1e6:7.2f} MB/s")
+    return best
+
+
+async def fetch_markdown(urls: List[str]) -> List[str]:
+    from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, CacheMode
+
+    docs = []
+    async with AsyncWebCrawler() as crawler:
+        for url in urls:
+            result = await crawler.arun(url=url, config=CrawlerRunConfig(cache_mode=CacheMode.BYPASS))
+            if result.success and result.markdown:
+                docs.append(str(result.markdown))
+                print(f"Fetched {url}: {len(result.markdown):,} chars")
+            else:
+                print(f"Failed {url}: {result.error_message}")
+    return docs
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", action="append", default=[])
+    parser.add_argument("--file", action="append", default=[])
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Characters (legacy); converted to tokens for the new chunker")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    docs = [open(path, encoding="utf-8").read() for path in args.file]
+    if args.url or not docs:
+        docs += asyncio.run(fetch_markdown(args.url or DEFAULT_URLS))
+    if not docs:
+        print("No documents to benchmark")
+        return
+
+    max_tokens = chunk_size_to_tokens(args.chunk_size)
+    print(f"\n{len(docs)} documents, {sum(len(d) for d in docs):,} chars, budget {args.chunk_size} chars / {max_tokens} tokens\n")
+
+    legacy = lambda doc: legacy_smart_chunk_markdown(doc, args.chunk_size)
+    token_aware = lambda doc: [c.text for c in chunk_markdown(doc, max_tokens=max_tokens)]
+
+    bench("legacy", legacy, docs, args.repeat)
+    legacy_time = bench("legacy+meta", lambda doc: legacy_with_metadata(doc, args.chunk_size), docs, args.repeat)
+    new_time = bench("token", lambda doc: chunk_markdown(doc, max_tokens=max_tokens), docs, args.repeat)
+    print(f"speedup vs legacy+meta {legacy_time / new_time:.2f}x (both produce section metadata and token counts)\n")
+
+    rows = {
+        "legacy": quality([c for doc in docs for c in legacy(doc)], max_tokens),
+        "token": quality([c for doc in docs for c in token_aware(doc)], max_tokens),
+    }
+    print(f"{'metric':<24}" + "".join(f"{name:>12}" for name in rows))
+    for metric in rows["legacy"]:
+        print(f"{metric:<24}" + "".join(f"{stats[metric]:>12}" for stats in rows.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Ingest Benchmark
+================
+Compares per-row chunk upserts (save_crawled_page) with the COPY-based bulk
+writer (bulk_save_crawled_pages) against the database in DATABASE_URL.
+
+Usage:
+    python scripts/bench_ingest.py --rows 2000 --batch-size 1000
+
+Rows are written under a throwaway source and deleted afterwards.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dotenv import load_dotenv
+
+import db
+from embeddings import EMBEDDING_DIMENSIONS
+
+BENCH_SOURCE_ID = "bench.ingest.local"
+
+
+def make_rows(n: int, run: str) -> list:
+    """Synthetic chunks with random embeddings."""
+    return [
+        {
+            "url": f"https://{BENCH_SOURCE_ID}/{run}/page-{i // 10}",
+            "chunk_number": i % 10,
+            "content": f"Benchmark chunk {i} " * 50,
+            "metadata": {"bench": True, "run": run},
+            "source_id": BENCH_SOURCE_ID,
+            "embedding": [random.random() for _ in range(EMBEDDING_DIMENSIONS)],
+        }
+        for i in range(n)
+    ]
+
+
+async def bench_row_by_row(rows: list) -> float:
+    start = time.perf_counter()
+    for row in rows:
+        await db.save_crawled_page(
+            url=row["url"],
+            chunk_number=row["chunk_number"],
+            content=row["content"],
+            source_id=row["source_id"],
+            metadata=row["metadata"],
+            embedding=row["embedding"],
+        )
+    return time.perf_counter() - start
+
+
+async def bench_bulk(rows: list, batch_size: int) -> float:
+    start = time.perf_counter()
+    await db.ensure_sources([BENCH_SOURCE_ID])
+    await db.bulk_save_crawled_pages(rows, batch_size=batch_size)
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunk ingest throughput")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=db.COPY_BATCH_SIZE)
+    parser.add_argument("--skip-row-by-row", action="store_true")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    try:
+        if not args.skip_row_by_row:
+            elapsed = await bench_row_by_row(make_rows(args.rows, "row"))
+            print(f"row-by-row: {args.rows} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/sec)")
+
+        elapsed = await bench_bulk(make_rows(args.rows, "bulk"), args.batch_size)
+        print(f"copy bulk:  {args.rows} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/sec)")
+    finally:
+        await db.delete_knowledge_source(BENCH_SOURCE_ID)
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Search Mode Relevance Benchmark
+===============================
+Offline comparison of vector, lexical and hybrid retrieval on a labelled
+query set, reporting hit@k, MRR and mean latency per mode.
+
+Usage:
+    python scripts/bench_search_modes.py [--queries queries.jsonl] [--k 5]
+
+Each query line is {"query": str, "relevant": [url substrings], "source": optional str}.
+A result counts as relevant when its URL contains any listed substring.
+Without --queries a small built-in AWS set is used. Requires DATABASE_URL
+and an OpenAI key for the query embeddings.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dotenv import load_dotenv
+
+import db
+from utils import search_documents, set_request_api_key, SEARCH_MODES
+
+DEFAULT_QUERIES = [
+    {"query": "s3api put-bucket-acl", "relevant": ["put-bucket-acl", "acl-overview"]},
+    {"query": "AssumeRoleWithWebIdentity", "relevant": ["AssumeRoleWithWebIdentity", "id_roles_providers_oidc"]},
+    {"query": "how do I encrypt an EBS volume", "relevant": ["EBSEncryption", "ebs-encryption"]},
+    {"query": "DynamoDB global tables replication", "relevant": ["GlobalTables"]},
+    {"query": "lambda reserved concurrency", "relevant": ["configuration-concurrency", "reserved-concurrency"]},
+    {"query": "VPC peering transitive routing", "relevant": ["vpc-peering", "peering"]},
+    {"query": "rds create-db-snapshot", "relevant": ["create-db-snapshot", "USER_CreateSnapshot"]},
+    {"query": "difference between SQS standard and FIFO queues", "relevant": ["FIFO-queues", "standard-queues"]},
+]
+
+
+def load_queries(path: str) -> list:
+    if not path:
+        return DEFAULT_QUERIES
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def first_relevant_rank(results: list, relevant: list) -> int:
+    """1-based rank of the first relevant result, or 0 if none."""
+    for rank, result in enumerate(results, start=1):
+        url = result.get("url") or ""
+        if any(marker in url for marker in relevant):
+            return rank
+    return 0
+
+
+async def run_mode(mode: str, queries: list, k: int) -> dict:
+    hits = 0
+    reciprocal_ranks = 0.0
+    latency = 0.0
+    for q in queries:
+        start = time.perf_counter()
+        results = await search_documents(q["query"], source_id=q.get("source"), match_count=k, search_mode=mode)
+        latency += time.perf_counter() - start
+        rank = first_relevant_rank(results, q["relevant"])
+        if rank:
+            hits += 1
+            reciprocal_ranks += 1.0 / rank
+    n = len(queries)
+    return {"hit": hits / n, "mrr": reciprocal_ranks / n, "latency_ms": latency / n * 1000}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare search modes on labelled queries")
+    parser.add_argument("--queries", help="JSONL file of labelled queries")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=list(SEARCH_MODES), choices=list(SEARCH_MODES))
+    args = parser.parse_args()
+
+    load_dotenv()
+    set_request_api_key(os.getenv("OPENAI_API_KEY"))
+    queries = load_queries(args.queries)
+
+    try:
+        print(f"{len(queries)} queries, k={args.k}")
+        print(f"{'mode':<10} {'hit@k':>7} {'MRR':>7} {'latency':>10}")
+        for mode in args.modes:
+            m = await run_mode(mode, queries, args.k)
+            print(f"{mode:<10} {m['hit']:>7.2f} {m['mrr']:>7.3f} {m['latency_ms']:>8.1f}ms")
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
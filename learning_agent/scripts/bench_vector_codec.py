@@ -0,0 +1,110 @@
+"""
+pgvector Codec Benchmark
+========================
+Compares the old '[x,y,...]' text formatting with the binary vector codec.
+
+Usage:
+    python scripts/bench_vector_codec.py --iterations 2000
+    python scripts/bench_vector_codec.py --query   # also time searches against DATABASE_URL
+
+Encode timings need no database. --query runs the same similarity search
+through a text-parameter connection and a binary-codec connection.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import asyncpg
+from dotenv import load_dotenv
+
+from embeddings import EMBEDDING_DIMENSIONS
+from pgvector_codec import encode_vector, decode_vector, register_vector_codec
+
+SEARCH_SQL = """
+    SELECT id, 1 - (embedding <=> $1::vector) AS similarity
+    FROM "AcademyKnowledgeChunk"
+    ORDER BY embedding <=> $1::vector
+    LIMIT 10
+"""
+
+
+def text_format(embedding) -> str:
+    return "[" + ",".join(str(x) for x in embedding) + "]"
+
+
+def timeit(fn, iterations: int) -> float:
+    """Microseconds per call."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_encode(iterations: int) -> None:
+    vector = [random.random() for _ in range(EMBEDDING_DIMENSIONS)]
+    buffer = array("f", vector)
+    encoded = encode_vector(vector)
+
+    print(f"encode ({EMBEDDING_DIMENSIONS} dims, µs/vector):")
+    print(f"  text format:         {timeit(lambda: text_format(vector), iterations):8.1f}")
+    print(f"  binary from list:    {timeit(lambda: encode_vector(vector), iterations):8.1f}")
+    print(f"  binary from array:   {timeit(lambda: encode_vector(buffer), iterations):8.1f}")
+    try:
+        import numpy as np
+        ndarray = np.asarray(vector, dtype=np.float32)
+        print(f"  binary from numpy:   {timeit(lambda: encode_vector(ndarray), iterations):8.1f}")
+    except ImportError:
+        pass
+    print(f"  binary decode:       {timeit(lambda: decode_vector(encoded), iterations):8.1f}")
+
+
+async def bench_query(iterations: int) -> None:
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("DATABASE_URL not set; skipping query latency")
+        return
+
+    vector = [random.random() for _ in range(EMBEDDING_DIMENSIONS)]
+    text_conn = await asyncpg.connect(database_url)
+    binary_conn = await asyncpg.connect(database_url)
+    await register_vector_codec(binary_conn)
+
+    async def run(conn, param) -> float:
+        await conn.fetch(SEARCH_SQL, param)  # warm up / prepare
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await conn.fetch(SEARCH_SQL, param)
+        return (time.perf_counter() - start) / iterations * 1000
+
+    try:
+        print("search latency (ms/query):")
+        print(f"  text parameter:      {await run(text_conn, text_format(vector)):8.2f}")
+        print(f"  binary parameter:    {await run(binary_conn, vector):8.2f}")
+    finally:
+        await text_conn.close()
+        await binary_conn.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark pgvector text vs binary encoding")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--query", action="store_true", help="Also time searches against DATABASE_URL")
+    parser.add_argument("--query-iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    bench_encode(args.iterations)
+    if args.query:
+        await bench_query(args.query_iterations)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Vector Index Maintenance CLI
+============================
+Create, inspect and drop pgvector HNSW (and full-text GIN) indexes on the
+knowledge tables.
+
+Usage:
+    python scripts/manage_vector_index.py status
+    python scripts/manage_vector_index.py create [--table AcademyKnowledgeChunk] [--source-id docs.aws.amazon.com]
+    python scripts/manage_vector_index.py progress [--watch 5]
+    python scripts/manage_vector_index.py drop <index_name>
+
+Indexes are built CONCURRENTLY, so run `progress` from another shell to
+follow a long build.
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dotenv import load_dotenv
+
+import db
+import vector_index
+
+
+async def cmd_status(conn, args) -> None:
+    indexes = await vector_index.index_report(conn)
+    if not indexes:
+        print("No vector indexes found")
+    for idx in indexes:
+        state = "valid" if idx["valid"] else "INVALID (failed or still building)"
+        print(f"{idx['table']:<24} {idx['name']:<60} {idx['size']:>10}  {state}")
+    await cmd_progress(conn, args)
+
+
+async def cmd_create(conn, args) -> None:
+    tables = [args.table] if args.table else list(vector_index.INDEXED_TABLES)
+    for table in tables:
+        name = await vector_index.create_hnsw_index(conn, table, partition_value=args.source_id)
+        print(f"✓ {table}: {name}")
+        if args.source_id is None and table == "AcademyKnowledgeChunk":
+            name = await vector_index.create_lexical_index(conn, table, fts_config=db.FTS_CONFIG)
+            print(f"✓ {table}: {name}")
+
+
+async def cmd_progress(conn, args) -> None:
+    while True:
+        builds = await vector_index.build_progress(conn)
+        if not builds:
+            print("No index builds in progress")
+        for b in builds:
+            pct = f"{100 * b['blocks_done'] / b['blocks_total']:.1f}%" if b["blocks_total"] else "-"
+            print(f"{b['table']:<24} {b['name'] or '?':<60} {b['phase']:<40} blocks {pct}  tuples {b['tuples_done']}/{b['tuples_total']}")
+        if not getattr(args, "watch", None) or not builds:
+            return
+        await asyncio.sleep(args.watch)
+
+
+async def cmd_drop(conn, args) -> None:
+    await vector_index.drop_index(conn, args.name)
+    print(f"✓ Dropped {args.name}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Manage pgvector indexes")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("status", help="Index sizes, validity and in-flight builds")
+
+    create = sub.add_parser("create", help="Create HNSW and full-text indexes (CONCURRENTLY)")
+    create.add_argument("--table", choices=list(vector_index.INDEXED_TABLES))
+    create.add_argument("--source-id", help="Build a partial index for one sourceId")
+
+    progress = sub.add_parser("progress", help="Show CREATE INDEX progress")
+    progress.add_argument("--watch", type=float, help="Refresh every N seconds until builds finish")
+
+    drop = sub.add_parser("drop", help="Drop an index by name")
+    drop.add_argument("name")
+
+    args = parser.parse_args()
+    load_dotenv()
+
+    commands = {"status": cmd_status, "create": cmd_create, "progress": cmd_progress, "drop": cmd_drop}
+    pool = await db.get_pool()
+    try:
+        async with pool.acquire() as conn:
+            await commands[args.command](conn, args)
+    finally:
+        await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
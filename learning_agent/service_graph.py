@@ -0,0 +1,336 @@
+"""
+AWS Service Graph Extraction
+============================
+Finds AWS service mentions in crawled pages and writes them to Neo4j as
+AWSService / Document nodes with typed, CO_MENTIONED and MENTIONS edges.
+
+- Mentions are found with one compiled, case-insensitive alternation of
+  every service name, bounded so "Config" no longer matches
+  "configuration"
+- Services have integer ids; AWS_RELATIONSHIP_PATTERNS is expanded once
+  at import into a (source, target) -> [rel_types] lookup and a boolean
+  id x id mask, so a page's co-mention pairs are checked in one
+  vectorised step (relationships_among, also usable for diagram checks)
+- ServiceGraphWriter buffers pages and writes each batch in a single
+  transaction with one UNWIND statement per kind of row (services,
+  documents + MENTIONS, CO_MENTIONED, and one per relationship type,
+  since Cypher can't parameterise relationship types)
+"""
+
+import os
+import re
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("cloudmigrate-service-graph")
+
+# Pages buffered before a graph write during crawl jobs
+GRAPH_BATCH_PAGES = int(os.getenv("GRAPH_BATCH_PAGES", "25"))
+
+# AWS Services list for extraction
+AWS_SERVICES = {
+    # Compute
+    "EC2": "Compute", "Lambda": "Compute", "ECS": "Compute", "EKS": "Compute", 
+    "Fargate": "Compute", "Lightsail": "Compute", "Batch": "Compute", "Elastic Beanstalk": "Compute",
+    "App Runner": "Compute", "Outposts": "Compute",
+    # Storage
+    "S3": "Storage", "EBS": "Storage", "EFS": "Storage", "FSx": "Storage", 
+    "Storage Gateway": "Storage", "Backup": "Storage", "Snow Family": "Storage",
+    # Database
+    "RDS": "Database", "DynamoDB": "Database", "Aurora": "Database", "ElastiCache": "Database",
+    "Neptune": "Database", "DocumentDB": "Database", "Keyspaces": "Database", "QLDB": "Database",
+    "Timestream": "Database", "MemoryDB": "Database", "Redshift": "Database",
+    # Networking
+    "VPC": "Networking", "CloudFront": "Networking", "Route 53": "Networking", 
+    "API Gateway": "Networking", "Direct Connect": "Networking", "Global Accelerator": "Networking",
+    "Transit Gateway": "Networking", "PrivateLink": "Networking", "App Mesh": "Networking",
+    "Cloud Map": "Networking", "ELB": "Networking", "ALB": "Networking", "NLB": "Networking",
+    # Security
+    "IAM": "Security", "Cognito": "Security", "Secrets Manager": "Security", 
+    "KMS": "Security", "CloudHSM": "Security", "WAF": "Security", "Shield": "Security",
+    "GuardDuty": "Security", "Inspector": "Security", "Macie": "Security",
+    "Security Hub": "Security", "Detective": "Security", "Firewall Manager": "Security",
+    # Management
+    "CloudWatch": "Management", "CloudTrail": "Management", "Config": "Management",
+    "Systems Manager": "Management", "CloudFormation": "Management", "Service Catalog": "Management",
+    "Trusted Advisor": "Management", "Control Tower": "Management", "Organizations": "Management",
+    "License Manager": "Management", "Cost Explorer": "Management",
+    # Migration
+    "Migration Hub": "Migration", "Application Migration Service": "Migration", 
+    "Database Migration Service": "Migration", "DMS": "Migration", "DataSync": "Migration",
+    "Transfer Family": "Migration", "Snow Family": "Migration", "Application Discovery Service": "Migration",
+    # Analytics
+    "Athena": "Analytics", "EMR": "Analytics", "Kinesis": "Analytics", "QuickSight": "Analytics",
+    "Data Pipeline": "Analytics", "Glue": "Analytics", "Lake Formation": "Analytics",
+    "MSK": "Analytics", "OpenSearch": "Analytics", "Elasticsearch": "Analytics",
+    # AI/ML
+    "SageMaker": "AI/ML", "Rekognition": "AI/ML", "Comprehend": "AI/ML", "Polly": "AI/ML",
+    "Transcribe": "AI/ML", "Translate": "AI/ML", "Lex": "AI/ML", "Personalize": "AI/ML",
+    "Forecast": "AI/ML", "Textract": "AI/ML", "Bedrock": "AI/ML", "CodeWhisperer": "AI/ML",
+    # Integration
+    "SQS": "Integration", "SNS": "Integration", "EventBridge": "Integration", 
+    "Step Functions": "Integration", "MQ": "Integration", "AppFlow": "Integration",
+    # Developer Tools
+    "CodeCommit": "Developer Tools", "CodeBuild": "Developer Tools", "CodeDeploy": "Developer Tools",
+    "CodePipeline": "Developer Tools", "CodeArtifact": "Developer Tools", "X-Ray": "Developer Tools",
+    "Cloud9": "Developer Tools", "CloudShell": "Developer Tools",
+}
+
+# Common relationship patterns between AWS services
+AWS_RELATIONSHIP_PATTERNS = [
+    # Compute relationships
+    (["Lambda"], ["S3", "DynamoDB", "SQS", "SNS", "API Gateway", "EventBridge", "Kinesis"], "TRIGGERS"),
+    (["EC2", "ECS", "EKS"], ["ELB", "ALB", "NLB"], "BEHIND"),
+    (["EC2", "ECS", "EKS", "Lambda"], ["RDS", "Aurora", "DynamoDB", "ElastiCache"], "CONNECTS_TO"),
+    (["EC2", "ECS", "EKS"], ["EBS", "EFS"], "USES_STORAGE"),
+    # Storage relationships
+    (["S3"], ["CloudFront"], "DISTRIBUTED_BY"),
+    (["S3"], ["Lambda", "Glue", "Athena"], "TRIGGERS"),
+    # Database relationships
+    (["RDS", "Aurora"], ["Secrets Manager"], "STORES_CREDENTIALS_IN"),
+    (["DynamoDB"], ["DAX"], "CACHED_BY"),
+    # Security relationships
+    (["EC2", "ECS", "EKS", "Lambda", "RDS"], ["IAM"], "AUTHENTICATED_BY"),
+    (["Secrets Manager", "KMS"], ["RDS", "Aurora", "S3", "EBS"], "ENCRYPTS"),
+    (["CloudFront", "ALB", "API Gateway"], ["WAF"], "PROTECTED_BY"),
+    # Monitoring relationships
+    (["EC2", "ECS", "EKS", "Lambda", "RDS", "DynamoDB"], ["CloudWatch"], "MONITORED_BY"),
+    (["CloudWatch"], ["SNS"], "ALERTS_VIA"),
+    # Migration relationships
+    (["Migration Hub"], ["Application Migration Service", "Database Migration Service", "DMS"], "TRACKS"),
+    (["DMS"], ["RDS", "Aurora", "DynamoDB", "Redshift"], "MIGRATES_TO"),
+]
+
+
+# ----------------------------------------------------------------------
+# Service ids and relationship index (built once at import)
+# ----------------------------------------------------------------------
+
+# Every known service gets an integer id; ids follow alphabetical order, so
+# sorting ids sorts names. Pattern-only names (e.g. DAX) get ids too.
+SERVICE_NAMES: List[str] = sorted(
+    set(AWS_SERVICES) | {name for sources, targets, _ in AWS_RELATIONSHIP_PATTERNS for name in sources + targets}
+)
+SERVICE_IDS: Dict[str, int] = {name: i for i, name in enumerate(SERVICE_NAMES)}
+_ID_BY_LOWER: Dict[str, int] = {name.lower(): i for name, i in SERVICE_IDS.items()}
+
+# Relationship types for each ordered (source, target) service pair
+RELATIONSHIP_LOOKUP: Dict[Tuple[str, str], List[str]] = {}
+for _sources, _targets, _rel_type in AWS_RELATIONSHIP_PATTERNS:
+    for _source in _sources:
+        for _target in _targets:
+            if _source != _target:
+                RELATIONSHIP_LOOKUP.setdefault((_source, _target), []).append(_rel_type)
+
+_RELATIONSHIPS_BY_ID: Dict[Tuple[int, int], List[str]] = {
+    (SERVICE_IDS[source], SERVICE_IDS[target]): rel_types
+    for (source, target), rel_types in RELATIONSHIP_LOOKUP.items()
+}
+
+# RELATIONSHIP_MASK[a, b] is True when service a has a known relationship to b
+RELATIONSHIP_MASK = np.zeros((len(SERVICE_NAMES), len(SERVICE_NAMES)), dtype=bool)
+for _source_id, _target_id in _RELATIONSHIPS_BY_ID:
+    RELATIONSHIP_MASK[_source_id, _target_id] = True
+
+_NAMES = np.array(SERVICE_NAMES, dtype=object)
+
+# Longest names first so "Elastic Beanstalk" wins over shorter overlaps.
+# Only AWS_SERVICES names are matched in page text.
+SERVICE_MATCHER = re.compile(
+    r"(?<![\w-])(" + "|".join(
+        re.escape(name) for name in sorted(AWS_SERVICES, key=len, reverse=True)
+    ) + r")(?![\w-])",
+    re.IGNORECASE,
+)
+
+
+def service_id(name: str) -> Optional[int]:
+    """Id for a service name (case-insensitive), or None if unknown."""
+    return _ID_BY_LOWER.get(name.strip().lower())
+
+
+def find_service_ids(content: str) -> np.ndarray:
+    """Sorted ids of the AWS services mentioned in content."""
+    ids = {_ID_BY_LOWER[match.lower()] for match in SERVICE_MATCHER.findall(content)}
+    return np.fromiter(sorted(ids), dtype=np.intp, count=len(ids))
+
+
+def find_services(content: str) -> List[str]:
+    """Names of the AWS services mentioned in content, sorted."""
+    return [SERVICE_NAMES[i] for i in find_service_ids(content)]
+
+
+def service_pairs(ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Every unordered pair (a < b) of distinct, sorted service ids."""
+    first, second = np.triu_indices(len(ids), k=1)
+    return ids[first], ids[second]
+
+
+def relationships_among(ids: np.ndarray) -> List[Tuple[int, int, str]]:
+    """
+    Known (source_id, target_id, rel_type) relationships between any two of ids.
+
+    The pair mask is evaluated for all pairs at once; only pairs with a
+    relationship touch the lookup dict. Shared by page extraction and
+    anything else that checks services against AWS_RELATIONSHIP_PATTERNS.
+    """
+    first, second = service_pairs(ids)
+    forward = RELATIONSHIP_MASK[first, second]
+    backward = RELATIONSHIP_MASK[second, first]
+    relationships = []
+    for source, target in zip(first[forward].tolist(), second[forward].tolist()):
+        relationships.extend((source, target, rel_type) for rel_type in _RELATIONSHIPS_BY_ID[(source, target)])
+    for source, target in zip(second[backward].tolist(), first[backward].tolist()):
+        relationships.extend((source, target, rel_type) for rel_type in _RELATIONSHIPS_BY_ID[(source, target)])
+    return relationships
+
+
+def known_relationships(source: str, target: str) -> List[str]:
+    """Relationship types from source to target (case-insensitive names)."""
+    source_id, target_id = service_id(source), service_id(target)
+    if source_id is None or target_id is None:
+        return []
+    return list(_RELATIONSHIPS_BY_ID.get((source_id, target_id), ()))
+
+
+@dataclass
+class PageGraph:
+    """Services and edges extracted from one page."""
+    url: str
+    services: List[str]
+    relationships: List[Tuple[str, str, str]] = field(default_factory=list)  # (source, target, rel_type)
+    co_mentions: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def extract_page_graph(content: str, url: str) -> PageGraph:
+    """Services mentioned on a page plus their typed and co-mention pairs."""
+    ids = find_service_ids(content)
+    first, second = service_pairs(ids)
+    return PageGraph(
+        url,
+        _NAMES[ids].tolist(),
+        [(SERVICE_NAMES[s], SERVICE_NAMES[t], rel_type) for s, t, rel_type in relationships_among(ids)],
+        list(zip(_NAMES[first].tolist(), _NAMES[second].tolist())),
+    )
+
+
+# ----------------------------------------------------------------------
+# Neo4j writes
+# ----------------------------------------------------------------------
+
+_MERGE_SERVICES = """
+    UNWIND $rows AS row
+    MERGE (s:AWSService {name: row.name, tenant_id: $tenant_id})
+    SET s.category = row.category,
+        s.last_seen = datetime(),
+        s.mention_count = COALESCE(s.mention_count, 0) + row.mentions
+"""
+
+_MERGE_DOCUMENTS = """
+    UNWIND $rows AS row
+    MERGE (d:Document {url: row.url, tenant_id: $tenant_id})
+    SET d.crawled_at = datetime()
+    WITH d, row
+    UNWIND row.services AS name
+    MATCH (s:AWSService {name: name, tenant_id: $tenant_id})
+    MERGE (d)-[:MENTIONS]->(s)
+"""
+
+_MERGE_CO_MENTIONS = """
+    UNWIND $rows AS row
+    MATCH (s1:AWSService {name: row.s1, tenant_id: $tenant_id}),
+          (s2:AWSService {name: row.s2, tenant_id: $tenant_id})
+    MERGE (s1)-[r:CO_MENTIONED]-(s2)
+    SET r.count = COALESCE(r.count, 0) + row.count,
+        r.last_url = row.url
+"""
+
+_MERGE_RELATIONSHIPS = """
+    UNWIND $rows AS row
+    MATCH (s1:AWSService {{name: row.s1, tenant_id: $tenant_id}}),
+          (s2:AWSService {{name: row.s2, tenant_id: $tenant_id}})
+    MERGE (s1)-[r:{rel_type}]->(s2)
+    SET r.source_url = row.url, r.updated = datetime()
+"""
+
+def graph_rows(pages: List[PageGraph]) -> Dict[str, Any]:
+    """Aggregate a batch of pages into UNWIND parameter lists."""
+    mentions = Counter(name for page in pages for name in page.services)
+    co_mentions: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    relationships: Dict[str, Dict[Tuple[str, str], str]] = {}
+    for page in pages:
+        for s1, s2 in page.co_mentions:
+            row = co_mentions.setdefault((s1, s2), {"s1": s1, "s2": s2, "count": 0})
+            row["count"] += 1
+            row["url"] = page.url
+        for s1, s2, rel_type in page.relationships:
+            relationships.setdefault(rel_type, {})[(s1, s2)] = page.url
+
+    return {
+        "services": [
+            {"name": name, "category": AWS_SERVICES.get(name, "Other"), "mentions": count}
+            for name, count in mentions.items()
+        ],
+        "documents": [{"url": page.url, "services": page.services} for page in pages if page.services],
+        "co_mentions": list(co_mentions.values()),
+        "relationships": {
+            rel_type: [{"s1": s1, "s2": s2, "url": url} for (s1, s2), url in rows.items()]
+            for rel_type, rows in relationships.items()
+        },
+    }
+
+
+async def write_page_graphs(neo4j_driver, pages: List[PageGraph], tenant_id: str) -> None:
+    """Write a batch of pages in one transaction (a few UNWIND statements)."""
+    rows = graph_rows([page for page in pages if page.services])
+    if not rows["services"]:
+        return
+
+    async def write(tx) -> None:
+        await tx.run(_MERGE_SERVICES, rows=rows["services"], tenant_id=tenant_id)
+        await tx.run(_MERGE_DOCUMENTS, rows=rows["documents"], tenant_id=tenant_id)
+        if rows["co_mentions"]:
+            await tx.run(_MERGE_CO_MENTIONS, rows=rows["co_mentions"], tenant_id=tenant_id)
+        for rel_type, rel_rows in rows["relationships"].items():
+            # rel_type comes from AWS_RELATIONSHIP_PATTERNS, never from content
+            await tx.run(_MERGE_RELATIONSHIPS.format(rel_type=rel_type), rows=rel_rows, tenant_id=tenant_id)
+
+    async with neo4j_driver.session() as session:
+        await session.execute_write(write)
+
+
+class ServiceGraphWriter:
+    """
+    Buffers extracted pages for one crawl job and writes them in batches.
+
+    add() extracts immediately (so counts are available per page) and
+    flushes every batch_pages pages; call flush() when the job ends.
+    Write errors are logged, never raised, like the per-page writer before.
+    """
+
+    def __init__(self, neo4j_driver, tenant_id: str, batch_pages: int = GRAPH_BATCH_PAGES):
+        self.neo4j_driver = neo4j_driver
+        self.tenant_id = tenant_id
+        self.batch_pages = batch_pages
+        self._pending: List[PageGraph] = []
+
+    async def add(self, content: str, url: str) -> Dict[str, int]:
+        page = extract_page_graph(content, url)
+        if page.services:
+            self._pending.append(page)
+            if len(self._pending) >= self.batch_pages:
+                await self.flush()
+        return {"extracted": len(page.services), "relationships": len(page.relationships)}
+
+    async def flush(self) -> None:
+        pages, self._pending = self._pending, []
+        if not pages:
+            return
+        try:
+            await write_page_graphs(self.neo4j_driver, pages, self.tenant_id)
+        except Exception as e:
+            logger.error(f"Error writing {len(pages)} pages to the AWS service graph: {e}")
@@ -0,0 +1,180 @@
+"""
+Async Sitemap Engine
+====================
+Streams sitemap URLs without blocking the event loop or loading whole
+documents into memory.
+
+- Fetched with httpx; gzip is handled both as Content-Encoding and as
+  .xml.gz payloads
+- Parsed incrementally (XMLPullParser, the feed-based form of iterparse),
+  clearing each <url>/<sitemap> element once read
+- <sitemapindex> children are followed concurrently, up to SITEMAP_MAX_DEPTH
+- URLs are deduplicated by canonical form
+- since= keeps only entries whose <lastmod> is at or after the cutoff
+  (entries without a lastmod are kept); index children older than the
+  cutoff are not fetched at all
+"""
+
+import os
+import zlib
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Tuple, Optional, Union, AsyncIterator
+from xml.etree.ElementTree import XMLPullParser
+
+import httpx
+
+from crawl_frontier import canonicalize_url
+
+logger = logging.getLogger("cloudmigrate-sitemap")
+
+SITEMAP_MAX_CONCURRENCY = int(os.getenv("SITEMAP_MAX_CONCURRENCY", "8"))
+SITEMAP_MAX_DEPTH = int(os.getenv("SITEMAP_MAX_DEPTH", "5"))
+SITEMAP_TIMEOUT = float(os.getenv("SITEMAP_TIMEOUT", "30"))
+
+# URLs buffered between the fetchers and the consumer
+SITEMAP_QUEUE_SIZE = 1000
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_DONE = object()
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """W3C datetime (date, or date-time with optional offset) -> aware UTC datetime."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+async def _stream_entries(
+    client: httpx.AsyncClient, sitemap_url: str
+) -> AsyncIterator[Tuple[str, str, Optional[datetime]]]:
+    """Yield (kind, loc, lastmod) per <url> or <sitemap> entry as the document downloads."""
+    parser = XMLPullParser(events=("end",))
+    inflater = None
+
+    async with client.stream("GET", sitemap_url) as resp:
+        if resp.status_code != 200:
+            logger.warning(f"Sitemap {sitemap_url} returned HTTP {resp.status_code}")
+            return
+
+        async for data in resp.aiter_bytes():
+            if inflater is None:
+                # .xml.gz served without Content-Encoding arrives still compressed
+                gzipped = data[:2] == _GZIP_MAGIC
+                inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else False
+            parser.feed(inflater.decompress(data) if inflater else data)
+
+            for _, element in parser.read_events():
+                kind = _local_name(element.tag)
+                if kind not in ("url", "sitemap"):
+                    continue
+                loc = lastmod = None
+                for child in element:
+                    name = _local_name(child.tag)
+                    if name == "loc":
+                        loc = (child.text or "").strip()
+                    elif name == "lastmod":
+                        lastmod = parse_lastmod(child.text)
+                element.clear()
+                if loc:
+                    yield kind, loc, lastmod
+
+        if inflater:
+            parser.feed(inflater.flush())
+        parser.close()
+
+
+async def iter_sitemap_urls(
+    sitemap_url: str,
+    since: Optional[Union[datetime, str]] = None,
+    max_concurrent: int = SITEMAP_MAX_CONCURRENCY,
+    client: Optional[httpx.AsyncClient] = None,
+) -> AsyncIterator[Tuple[str, Optional[datetime]]]:
+    """
+    Stream (url, lastmod) for every page in a sitemap or sitemap index.
+
+    Args:
+        sitemap_url: Sitemap or sitemap index URL (.xml or .xml.gz)
+        since: Only yield pages modified at or after this time (datetime or ISO string)
+        max_concurrent: Sitemaps fetched at once while following an index
+        client: Optional shared httpx client
+
+    Yields:
+        (page URL, lastmod or None), deduplicated, in arrival order
+    """
+    cutoff = parse_lastmod(since) if isinstance(since, str) else since
+    if cutoff is not None and cutoff.tzinfo is None:
+        cutoff = cutoff.replace(tzinfo=timezone.utc)
+
+    def is_recent(lastmod: Optional[datetime]) -> bool:
+        return cutoff is None or lastmod is None or lastmod >= cutoff
+
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient(timeout=SITEMAP_TIMEOUT, follow_redirects=True)
+
+    semaphore = asyncio.Semaphore(max_concurrent)
+    out: asyncio.Queue = asyncio.Queue(SITEMAP_QUEUE_SIZE)
+    seen_sitemaps = {canonicalize_url(sitemap_url)}
+    seen_urls = set()
+    tasks = set()
+    outstanding = [0]
+
+    async def fetch(url: str, depth: int) -> None:
+        try:
+            async with semaphore:
+                async for kind, loc, lastmod in _stream_entries(client, url):
+                    if kind == "sitemap":
+                        key = canonicalize_url(loc)
+                        if depth < SITEMAP_MAX_DEPTH and key not in seen_sitemaps and is_recent(lastmod):
+                            seen_sitemaps.add(key)
+                            schedule(loc, depth + 1)
+                    elif is_recent(lastmod):
+                        key = canonicalize_url(loc)
+                        if key not in seen_urls:
+                            seen_urls.add(key)
+                            await out.put((loc, lastmod))
+        except Exception as e:
+            logger.warning(f"Error reading sitemap {url}: {e}")
+        finally:
+            outstanding[0] -= 1
+            if outstanding[0] == 0:
+                await out.put(_DONE)
+
+    def schedule(url: str, depth: int) -> None:
+        outstanding[0] += 1
+        task = asyncio.create_task(fetch(url, depth))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    try:
+        schedule(sitemap_url, 0)
+        while (item := await out.get()) is not _DONE:
+            yield item
+    finally:
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if own_client:
+            await client.aclose()
+
+
+async def fetch_sitemap_urls(
+    sitemap_url: str,
+    since: Optional[Union[datetime, str]] = None,
+    max_concurrent: int = SITEMAP_MAX_CONCURRENCY,
+) -> List[str]:
+    """All page URLs from a sitemap (see iter_sitemap_urls)."""
+    return [url async for url, _ in iter_sitemap_urls(sitemap_url, since, max_concurrent)]
@@ -0,0 +1,61 @@
+"""
+Token Counting Helpers
+======================
+Shared tokeniser for embedding batch packing and chunk sizing.
+Uses tiktoken when available, otherwise a ~4 chars/token estimate.
+"""
+
+from functools import lru_cache
+from typing import List
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with crawl4ai
+    tiktoken = None
+
+# Encoding used by text-embedding-3-* and the gpt-4o/gpt-4.1 family
+DEFAULT_ENCODING = "cl100k_base"
+
+# Rough characters-per-token ratio used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=4)
+def get_encoding(name: str = DEFAULT_ENCODING):
+    """Get a cached tiktoken encoding, or None if tiktoken is unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:
+        return None
+
+
+def encode(text: str) -> List[int]:
+    """Encode text to token ids (empty list if tiktoken is unavailable)."""
+    enc = get_encoding()
+    if enc is None:
+        return []
+    return enc.encode(text, disallowed_special=())
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text."""
+    if not text:
+        return 0
+    enc = get_encoding()
+    if enc is None:
+        # Rounded up, so counts of the parts of a text add up to at least its own count
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Truncate text so it fits within max_tokens."""
+    enc = get_encoding()
+    if enc is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
@@ -9,11 +9,19 @@ from typing import List, Dict, Any, Optional, Tuple
 from urllib.parse import urlparse
 from pathlib import Path
 import openai
-import time
 import contextvars
 
 # Use db.py for database operations
 import db
+import embeddings
+import embedding_cache
+import query_cache
+import contextual
+import enrichment
+from openai_clients import get_sync_client
+
+# Cached search results are dropped (in every process) whenever a source's chunks change
+db.register_source_write_hook(query_cache.invalidate_source)
 
 # Default model (fallback only - prefer user's preferredModel)
 DEFAULT_MODEL = "gpt-4o-mini"
@@ -60,15 +68,24 @@ def get_openai_client(api_key: Optional[str] = None) -> openai.OpenAI:
         raise ApiKeyRequiredError(
             "OpenAI API key required. Please configure your API key in Settings."
         )
-    return openai.OpenAI(api_key=key)
+    return get_sync_client(key)
 
 
-def create_embeddings_batch(texts: List[str]) -> Tuple[List[List[float]], int]:
+async def create_embeddings_batch(
+    texts: List[str],
+    use_cache: bool = False,
+    stats: Optional[Dict[str, int]] = None
+) -> Tuple[List[List[float]], int]:
     """
-    Create embeddings for multiple texts in a single API call.
+    Create embeddings for multiple texts without blocking the event loop.
+    
+    Inputs are packed into token-aware batches and sent through the shared
+    async embedding engine (see embeddings.py).
     
     Args:
         texts: List of texts to create embeddings for
+        use_cache: Reuse embeddings for byte-identical texts (see embedding_cache.py)
+        stats: Optional dict to accumulate embedding_cache_hits/misses into
         
     Returns:
         Tuple of (List of embeddings, total tokens used)
@@ -76,143 +93,115 @@ def create_embeddings_batch(texts: List[str]) -> Tuple[List[List[float]], int]:
     if not texts:
         return [], 0
     
-    max_retries = 3
-    retry_delay = 1.0
+    key = get_request_api_key()
+    if not key:
+        raise ApiKeyRequiredError(
+            "OpenAI API key required. Please configure your API key in Settings."
+        )
+    
+    if not use_cache:
+        return await embeddings.embed_texts(texts, key)
+    
+    model = embeddings.EMBEDDING_MODEL
+    results = await embedding_cache.lookup(model, texts)
+    
+    # Embed each distinct missing text once
+    miss_texts = list(dict.fromkeys(t for t, e in zip(texts, results) if e is None))
     total_tokens = 0
+    if miss_texts:
+        new_embeddings, total_tokens = await embeddings.embed_texts(miss_texts, key)
+        await embedding_cache.store(model, miss_texts, new_embeddings)
+        created = dict(zip(miss_texts, new_embeddings))
+        results = [e if e is not None else created[t] for t, e in zip(texts, results)]
     
-    client = get_openai_client()
+    if stats is not None:
+        stats["embedding_cache_hits"] = stats.get("embedding_cache_hits", 0) + len(texts) - len(miss_texts)
+        stats["embedding_cache_misses"] = stats.get("embedding_cache_misses", 0) + len(miss_texts)
     
-    for retry in range(max_retries):
-        try:
-            response = client.embeddings.create(
-                model="text-embedding-3-small",
-                input=texts
-            )
-            total_tokens = response.usage.total_tokens if hasattr(response, 'usage') else sum(len(t.split()) for t in texts)
-            return [item.embedding for item in response.data], total_tokens
-        except Exception as e:
-            if retry < max_retries - 1:
-                print(f"Error creating batch embeddings (attempt {retry + 1}/{max_retries}): {e}")
-                time.sleep(retry_delay)
-                retry_delay *= 2
-            else:
-                print(f"Failed to create batch embeddings after {max_retries} attempts: {e}")
-                # Fallback: create embeddings one by one
-                embeddings = []
-                for i, text in enumerate(texts):
-                    try:
-                        truncated_text = text[:30000] if len(text) > 30000 else text
-                        individual_response = client.embeddings.create(
-                            model="text-embedding-3-small",
-                            input=[truncated_text]
-                        )
-                        embeddings.append(individual_response.data[0].embedding)
-                        if hasattr(individual_response, 'usage'):
-                            total_tokens += individual_response.usage.total_tokens
-                    except Exception as individual_error:
-                        print(f"Failed to create embedding for text {i}: {individual_error}")
-                        embeddings.append([0.0] * 1536)
-                
-                return embeddings, total_tokens
-    
-    return [], 0
-
-
-def create_embedding(text: str) -> Tuple[List[float], int]:
-    """Create an embedding for a single text."""
-    try:
-        embeddings, tokens = create_embeddings_batch([text])
-        return (embeddings[0] if embeddings else [0.0] * 1536), tokens
-    except Exception as e:
-        print(f"Error creating embedding: {e}")
-        return [0.0] * 1536, 0
+    return results, total_tokens
 
 
-def generate_contextual_embedding(full_document: str, chunk: str) -> Tuple[str, bool, int]:
-    """
-    Generate contextual information for a chunk within a document.
-    """
+async def create_embedding(text: str) -> Tuple[List[float], int]:
+    """Create an embedding for a single text."""
     try:
-        prompt = f"""<document> 
-{full_document[:25000]} 
-</document>
-Here is the chunk we want to situate within the whole document 
-<chunk> 
-{chunk}
-</chunk> 
-Please give a short succinct context to situate this chunk within the overall document for the purposes of improving search retrieval of the chunk. Answer only with the succinct context and nothing else."""
-
-        client = get_openai_client()
-        response = client.chat.completions.create(
-            model=get_request_model(),
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that provides concise contextual information."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=200
-        )
-        
-        context = response.choices[0].message.content.strip()
-        tokens_used = response.usage.total_tokens if hasattr(response, 'usage') else 0
-        contextual_text = f"{context}\n---\n{chunk}"
-        
-        return contextual_text, True, tokens_used
-    
+        batch, tokens = await create_embeddings_batch([text])
+        return (batch[0] if batch else embeddings.zero_embedding()), tokens
     except Exception as e:
-        print(f"Error generating contextual embedding: {e}. Using original chunk instead.")
-        return chunk, False, 0
+        print(f"Error creating embedding: {e}")
+        return embeddings.zero_embedding(), 0
 
 
-async def _process_batch(
-    batch_idx: int,
+async def embed_chunk_rows(
     batch_urls: List[str],
     batch_chunk_numbers: List[int],
     batch_contents: List[str],
     batch_metadatas: List[Dict[str, Any]],
     url_to_full_document: Dict[str, str],
-    tenant_id: str,
-    use_contextual_embeddings: bool
-) -> int:
-    """Process a single batch - can be run in parallel."""
-    # Apply contextual embedding if enabled
+    use_contextual_embeddings: bool,
+    stats: Optional[Dict[str, int]] = None
+) -> List[Dict[str, Any]]:
+    """Contextualise (optionally) and embed chunks into rows for db.bulk_save_crawled_pages."""
+    # Apply contextual embedding if enabled (concurrent, document-prefix-first prompts)
     if use_contextual_embeddings:
+        key = get_request_api_key()
+        if not key:
+            raise ApiKeyRequiredError(
+                "OpenAI API key required. Please configure your API key in Settings."
+            )
+        situated = await contextual.contextualize_chunks(
+            batch_urls, batch_contents, url_to_full_document, key, get_request_model()
+        )
         contextual_contents = []
-        for j, content in enumerate(batch_contents):
-            url = batch_urls[j]
-            full_document = url_to_full_document.get(url, "")
-            result, success, _ = generate_contextual_embedding(full_document, content)
+        for j, (result, success) in enumerate(situated):
             contextual_contents.append(result)
             if success:
                 batch_metadatas[j]["contextual_embedding"] = True
     else:
         contextual_contents = batch_contents
     
-    # Create embeddings
-    batch_embeddings, _ = create_embeddings_batch(contextual_contents)
+    # Create embeddings (cache hits skip the OpenAI call)
+    batch_embeddings, _ = await create_embeddings_batch(contextual_contents, use_cache=True, stats=stats)
     
-    # Save to database
-    saved = 0
+    rows = []
     for j in range(len(contextual_contents)):
         parsed_url = urlparse(batch_urls[j])
-        source_id = parsed_url.netloc or parsed_url.path
-        
-        try:
-            await db.save_crawled_page(
-                url=batch_urls[j],
-                chunk_number=batch_chunk_numbers[j],
-                content=contextual_contents[j],
-                source_id=source_id,
-                metadata={
-                    "chunk_size": len(contextual_contents[j]),
-                    **batch_metadatas[j]
-                },
-                embedding=batch_embeddings[j] if j < len(batch_embeddings) else None,
-                tenant_id=tenant_id
-            )
-            saved += 1
-        except Exception as e:
-            print(f"Error saving crawled page: {e}")
+        rows.append({
+            "url": batch_urls[j],
+            "chunk_number": batch_chunk_numbers[j],
+            "content": contextual_contents[j],
+            "source_id": parsed_url.netloc or parsed_url.path,
+            "metadata": {
+                "chunk_size": len(contextual_contents[j]),
+                **batch_metadatas[j]
+            },
+            "embedding": batch_embeddings[j] if j < len(batch_embeddings) else None,
+        })
+    return rows
+
+
+async def _process_batch(
+    batch_idx: int,
+    batch_urls: List[str],
+    batch_chunk_numbers: List[int],
+    batch_contents: List[str],
+    batch_metadatas: List[Dict[str, Any]],
+    url_to_full_document: Dict[str, str],
+    tenant_id: str,
+    use_contextual_embeddings: bool,
+    stats: Optional[Dict[str, int]] = None
+) -> int:
+    """Process a single batch - can be run in parallel."""
+    rows = await embed_chunk_rows(
+        batch_urls, batch_chunk_numbers, batch_contents, batch_metadatas,
+        url_to_full_document, use_contextual_embeddings, stats
+    )
+    
+    # Save to database (one COPY + merge for the whole batch)
+    try:
+        saved = await db.bulk_save_crawled_pages(rows)
+    except Exception as e:
+        print(f"Error saving crawled pages batch {batch_idx + 1}: {e}")
+        saved = 0
     
     print(f"Saved batch {batch_idx + 1}: {saved} documents")
     return saved
@@ -227,7 +216,7 @@ async def add_documents_to_db(
     tenant_id: str = None,
     batch_size: int = 20,
     max_parallel_batches: int = None
-) -> None:
+) -> Dict[str, int]:
     """
     Add documents to the local PostgreSQL crawled_pages table.
     
@@ -236,6 +225,9 @@ async def add_documents_to_db(
     Args:
         tenant_id: Tenant ID for multi-tenant isolation
         max_parallel_batches: Number of batches to process in parallel (env: MAX_PARALLEL_BATCHES, default 4)
+    
+    Returns:
+        Stats dict with chunks_saved, embedding_cache_hits and embedding_cache_misses
     """
     import asyncio
     
@@ -245,6 +237,11 @@ async def add_documents_to_db(
     use_contextual_embeddings = os.getenv("USE_CONTEXTUAL_EMBEDDINGS", "false") == "true"
     print(f"Use contextual embeddings: {use_contextual_embeddings}, parallel batches: {max_parallel_batches}")
     
+    stats = {"chunks_saved": 0, "embedding_cache_hits": 0, "embedding_cache_misses": 0}
+    
+    # Create every source row once per job instead of once per chunk
+    await db.ensure_sources({urlparse(u).netloc or urlparse(u).path for u in urls})
+    
     # Prepare all batches
     batches = []
     for i in range(0, len(contents), batch_size):
@@ -272,33 +269,135 @@ async def add_documents_to_db(
                 batch["metadatas"],
                 url_to_full_document,
                 tenant_id,
-                use_contextual_embeddings
+                use_contextual_embeddings,
+                stats
             )
             for batch in group
         ]
         
         # Run batch group in parallel
-        await asyncio.gather(*tasks)
+        saved_counts = await asyncio.gather(*tasks)
+        stats["chunks_saved"] += sum(saved_counts)
     
-    print(f"Completed all {len(batches)} batches")
+    print(f"Completed all {len(batches)} batches (embedding cache: {stats['embedding_cache_hits']} hits, {stats['embedding_cache_misses']} misses)")
+    return stats
+
+
+# Retrieval modes for search_documents
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+DEFAULT_SEARCH_MODE = os.getenv("DEFAULT_SEARCH_MODE", "vector")
+
+# RRF damping constant (Cormack et al. use 60) and hybrid over-fetch per list
+RRF_K = 60
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Dict[str, Any]]],
+    k: int = RRF_K,
+    key: str = "id"
+) -> List[Dict[str, Any]]:
+    """
+    Fuse ranked result lists with reciprocal rank fusion.
+    
+    Each result scores sum(1 / (k + rank)) across the lists it appears in.
+    Fields from every list are merged, so fused results keep both
+    similarity and lexical_score when present.
+    """
+    scores: Dict[Any, float] = {}
+    merged: Dict[Any, Dict[str, Any]] = {}
+    
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            result_key = result[key]
+            scores[result_key] = scores.get(result_key, 0.0) + 1.0 / (k + rank)
+            merged.setdefault(result_key, {}).update(result)
+    
+    fused = []
+    for result_key in sorted(scores, key=scores.get, reverse=True):
+        merged[result_key]["rrf_score"] = scores[result_key]
+        fused.append(merged[result_key])
+    return fused
 
 
 async def search_documents(
     query: str,
     source_id: str = None,
     match_count: int = 10,
-    metadata_filter: Dict[str, Any] = None
+    metadata_filter: Dict[str, Any] = None,
+    recall: str = None,
+    search_mode: str = None
 ) -> List[Dict[str, Any]]:
     """
-    Search documents by semantic similarity.
+    Search documents by semantic similarity, full-text match, or both.
+    
+    Query embeddings and vector/hybrid results are cached (see query_cache);
+    vector results are reused for near-identical queries, hybrid results
+    for the same query text, until a write to the source invalidates them.
+    
+    Args:
+        recall: "fast", "balanced" or "exact" - trades ANN accuracy for latency
+        search_mode: "vector", "lexical" or "hybrid" (vector + full-text fused with RRF)
     """
-    embedding, _ = create_embedding(query)
-    return await db.search_crawled_pages(
-        embedding=embedding,
-        limit=match_count,
-        source_id=source_id,
-        metadata_filter=metadata_filter
-    )
+    import asyncio
+    import json
+    
+    search_mode = search_mode or DEFAULT_SEARCH_MODE
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search_mode '{search_mode}', expected one of {', '.join(SEARCH_MODES)}")
+    
+    if search_mode == "lexical":
+        return await db.search_crawled_pages_lexical(query, limit=match_count, source_id=source_id)
+    
+    candidate_count = match_count if search_mode == "vector" else match_count * HYBRID_CANDIDATE_MULTIPLIER
+    
+    # The lexical half doesn't need the embedding, so start it straight away
+    lexical_task = None
+    if search_mode == "hybrid":
+        lexical_task = asyncio.create_task(
+            db.search_crawled_pages_lexical(query, limit=candidate_count, source_id=source_id)
+        )
+    
+    # Read before querying: results are only cached if no write landed meanwhile
+    generation = query_cache.search_results.generation(source_id)
+    # Hybrid results depend on the exact terms, not just the embedding neighbourhood
+    cache_text = query if search_mode == "hybrid" else None
+    
+    try:
+        embedding = query_cache.get_query_embedding(query)
+        if embedding is None:
+            embedding, _ = await create_embedding(query)
+            query_cache.put_query_embedding(query, embedding)
+        
+        # Earlier (near-)identical query with the same parameters and source filter
+        bucket = (
+            search_mode, match_count, recall,
+            json.dumps(metadata_filter, sort_keys=True) if metadata_filter else None,
+            source_id,
+        )
+        cached = query_cache.get_results(embedding, bucket, cache_text)
+        if cached is not None:
+            return cached
+        
+        vector_results = await db.search_crawled_pages(
+            embedding=embedding,
+            limit=candidate_count,
+            source_id=source_id,
+            metadata_filter=metadata_filter,
+            recall=recall
+        )
+        
+        if search_mode == "vector":
+            results = vector_results
+        else:
+            lexical_results = await lexical_task
+            results = reciprocal_rank_fusion([vector_results, lexical_results])[:match_count]
+    finally:
+        if lexical_task and not lexical_task.done():
+            lexical_task.cancel()
+    
+    query_cache.put_results(embedding, bucket, results, generation, cache_text)
+    return results
 
 
 def extract_code_blocks(content: str) -> List[Dict[str, Any]]:
@@ -318,25 +417,6 @@ def extract_code_blocks(content: str) -> List[Dict[str, Any]]:
     return code_blocks
 
 
-def generate_code_example_summary(code: str, language: str) -> str:
-    """Generate a summary for a code example."""
-    try:
-        client = get_openai_client()
-        response = client.chat.completions.create(
-            model=get_request_model(),
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that summarizes code examples concisely."},
-                {"role": "user", "content": f"Summarize this {language} code in one sentence:\n\n{code[:2000]}"}
-            ],
-            temperature=0.3,
-            max_tokens=100
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error generating code summary: {e}")
-        return f"{language} code example"
-
-
 async def add_code_examples_to_db(
     url: str,
     code_blocks: List[Dict[str, Any]],
@@ -345,26 +425,47 @@ async def add_code_examples_to_db(
 ) -> None:
     """Add code examples to the database.
     
+    Examples are stored (and searchable) straight away with a placeholder
+    summary; the real summaries are generated in batches by the enrichment
+    queue, which then re-embeds each example with its summary.
+    
     Args:
         tenant_id: Tenant ID for multi-tenant isolation
     """
-    for i, block in enumerate(code_blocks):
-        summary = generate_code_example_summary(block["code"], block["language"])
-        embedding, _ = create_embedding(f"{summary}\n{block['code']}")
-        
-        try:
-            await db.save_code_example(
-                url=url,
-                chunk_number=i,
-                content=block["code"],
-                summary=summary,
-                source_id=source_id,
-                metadata={"language": block["language"]},
-                embedding=embedding,
-                tenant_id=tenant_id
-            )
-        except Exception as e:
-            print(f"Error saving code example: {e}")
+    if not code_blocks:
+        return
+    
+    summaries = [enrichment.placeholder_code_summary(block["language"]) for block in code_blocks]
+    
+    # Embed all code examples in one packed call instead of one request per block
+    code_embeddings, _ = await create_embeddings_batch(
+        [f"{summary}\n{block['code']}" for summary, block in zip(summaries, code_blocks)],
+        use_cache=True
+    )
+    
+    try:
+        await db.save_code_examples([
+            {
+                "url": url,
+                "chunk_number": i,
+                "content": block["code"],
+                "summary": summary,
+                "metadata": {"language": block["language"]},
+                "source_id": source_id,
+                "embedding": embedding,
+            }
+            for i, (block, summary, embedding) in enumerate(zip(code_blocks, summaries, code_embeddings))
+        ])
+    except Exception as e:
+        print(f"Error saving code examples: {e}")
+        return
+    
+    await enrichment.enqueue_code_summaries(
+        url,
+        [{"chunk_number": i, "code": block["code"], "language": block["language"]} for i, block in enumerate(code_blocks)],
+        get_request_api_key(),
+        get_request_model()
+    )
 
 
 async def search_code_examples(
@@ -373,7 +474,7 @@ async def search_code_examples(
     match_count: int = 10
 ) -> List[Dict[str, Any]]:
     """Search code examples by semantic similarity."""
-    embedding, _ = create_embedding(query)
+    embedding, _ = await create_embedding(query)
     return await db.search_code_examples(
         embedding=embedding,
         limit=match_count,
@@ -390,23 +491,9 @@ async def update_source_info(source_id: str, summary: str = None, word_count: in
     await db.ensure_source(source_id, summary, word_count, tenant_id)
 
 
-def extract_source_summary(content: str) -> str:
-    """Extract a summary from content."""
-    try:
-        client = get_openai_client()
-        response = client.chat.completions.create(
-            model=get_request_model(),
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that creates concise summaries."},
-                {"role": "user", "content": f"Summarize this content in 2-3 sentences:\n\n{content[:5000]}"}
-            ],
-            temperature=0.3,
-            max_tokens=150
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error extracting summary: {e}")
-        return ""
+async def queue_source_summary(source_id: str, content: str) -> None:
+    """Summarise a source in the background (see enrichment.py) instead of inline."""
+    await enrichment.enqueue_source_summary(source_id, content, get_request_api_key(), get_request_model())
 
 
 async def save_report(
@@ -421,7 +508,7 @@ async def save_report(
     metadata: Dict[str, Any] = None
 ) -> Dict[str, Any]:
     """Save a report to the database."""
-    embedding, _ = create_embedding(content[:8000])  # Limit for embedding
+    embedding, _ = await create_embedding(content[:8000])  # Limit for embedding
     
     return await db.save_report(
         report_id=report_id,
@@ -444,7 +531,7 @@ async def search_reports(
     threshold: float = 0.7
 ) -> List[Dict[str, Any]]:
     """Search reports by semantic similarity."""
-    embedding, _ = create_embedding(query)
+    embedding, _ = await create_embedding(query)
     return await db.search_reports(
         embedding=embedding,
         limit=match_count,
@@ -490,16 +577,18 @@ async def add_documents_to_supabase(
     contents: List[str],
     metadatas: List[Dict[str, Any]],
     url_to_full_document: Dict[str, str],
+    tenant_id: str = None,
     batch_size: int = 20
-) -> None:
+) -> Dict[str, int]:
     """Alias for add_documents_to_db."""
-    return await add_documents_to_db(urls, chunk_numbers, contents, metadatas, url_to_full_document, batch_size)
+    return await add_documents_to_db(urls, chunk_numbers, contents, metadatas, url_to_full_document, tenant_id, batch_size)
 
 
 async def add_code_examples_to_supabase(
     url: str,
     code_blocks: List[Dict[str, Any]],
-    source_id: str
+    source_id: str,
+    tenant_id: str = None
 ) -> None:
     """Alias for add_code_examples_to_db."""
-    return await add_code_examples_to_db(url, code_blocks, source_id)
+    return await add_code_examples_to_db(url, code_blocks, source_id, tenant_id)
@@ -0,0 +1,155 @@
+"""
+Vector Index Management
+=======================
+HNSW index lifecycle and per-query recall tuning for pgvector searches.
+
+- Global HNSW index per embedding table, plus optional partial indexes
+  for hot partitions (e.g. one sourceId)
+- Recall profiles mapping "fast" / "balanced" / "exact" to hnsw.ef_search,
+  ivfflat.probes, or a forced exact scan
+- GIN full-text indexes backing the lexical half of hybrid search
+- Size, validity and build-progress reporting for the maintenance CLI
+
+Functions take an asyncpg connection so db.py can use them without a
+circular import.
+"""
+
+import os
+import hashlib
+import logging
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger("cloudmigrate-vector-index")
+
+# Embedding tables and the column partial indexes are keyed by
+INDEXED_TABLES: Dict[str, str] = {
+    "AcademyKnowledgeChunk": "sourceId",
+    "AcademyCodeExample": "sourceId",
+}
+
+# HNSW build parameters (pgvector defaults are m=16, ef_construction=64)
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+
+# Per-query settings; None means exact (sequential) scan
+RECALL_PROFILES: Dict[str, Optional[Dict[str, int]]] = {
+    "fast": {"ef_search": 40, "probes": 1},
+    "balanced": {"ef_search": 100, "probes": 10},
+    "exact": None,
+}
+DEFAULT_RECALL = os.getenv("VECTOR_SEARCH_RECALL", "balanced")
+# pgvector rejects larger hnsw.ef_search values
+HNSW_MAX_EF_SEARCH = 1000
+
+
+def index_name(table: str, partition_value: Optional[str] = None) -> str:
+    """Deterministic index name (partition values are hashed to stay under 63 chars)."""
+    base = f"idx_{table.lower()}_embedding_hnsw"
+    if partition_value is None:
+        return base
+    return f"{base}_{hashlib.sha1(partition_value.encode('utf-8')).hexdigest()[:12]}"
+
+
+async def apply_recall(conn, recall: str = None, limit: int = 0) -> None:
+    """
+    Apply a recall profile for the current transaction (SET LOCAL).
+
+    Must be called inside conn.transaction(). "exact" disables index scans
+    so the query falls back to an exact sequential scan. An HNSW scan
+    returns at most ef_search rows, so ef_search is raised to the query's
+    LIMIT when that is larger (rerank and hybrid over-fetch).
+    """
+    recall = recall or DEFAULT_RECALL
+    if recall not in RECALL_PROFILES:
+        raise ValueError(f"Unknown recall '{recall}', expected one of {', '.join(RECALL_PROFILES)}")
+
+    profile = RECALL_PROFILES[recall]
+    if profile is None:
+        await conn.execute("SET LOCAL enable_indexscan = off")
+        return
+
+    ef_search = min(max(int(profile["ef_search"]), int(limit)), HNSW_MAX_EF_SEARCH)
+    await conn.execute(f"SET LOCAL hnsw.ef_search = {ef_search}")
+    await conn.execute(f"SET LOCAL ivfflat.probes = {int(profile['probes'])}")
+    # Plan with the actual filter value so partial indexes can match
+    await conn.execute("SET LOCAL plan_cache_mode = force_custom_plan")
+
+
+async def create_hnsw_index(
+    conn,
+    table: str,
+    partition_value: Optional[str] = None,
+    concurrently: bool = True,
+) -> str:
+    """
+    Create the table's HNSW index (cosine), or a partial one for a single
+    partition value. No-op if it already exists.
+
+    Returns:
+        The index name
+    """
+    if table not in INDEXED_TABLES:
+        raise ValueError(f"Unknown embedding table '{table}'")
+
+    name = index_name(table, partition_value)
+    where = ""
+    if partition_value is not None:
+        literal = await conn.fetchval("SELECT quote_literal($1::text)", partition_value)
+        where = f' WHERE "{INDEXED_TABLES[table]}" = {literal}'
+
+    await conn.execute(f"""
+        CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "{name}"
+        ON "{table}" USING hnsw (embedding vector_cosine_ops)
+        WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}){where}
+    """)
+    logger.info(f"HNSW index ready: {name}")
+    return name
+
+
+async def create_lexical_index(conn, table: str, fts_config: str = "english", concurrently: bool = True) -> str:
+    """Create the GIN full-text index used by hybrid search. No-op if it exists."""
+    if table not in INDEXED_TABLES:
+        raise ValueError(f"Unknown embedding table '{table}'")
+
+    name = f"idx_{table.lower()}_content_fts"
+    await conn.execute(f"""
+        CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "{name}"
+        ON "{table}" USING gin (to_tsvector('{fts_config}', content))
+    """)
+    logger.info(f"Full-text index ready: {name}")
+    return name
+
+
+async def drop_index(conn, name: str) -> None:
+    """Drop a vector index by name."""
+    await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+async def index_report(conn) -> List[Dict[str, Any]]:
+    """Vector and full-text indexes on the embedding tables with size and validity."""
+    rows = await conn.fetch("""
+        SELECT c.relname AS name, t.relname AS "table",
+               pg_relation_size(c.oid) AS size_bytes,
+               pg_size_pretty(pg_relation_size(c.oid)) AS size,
+               i.indisvalid AS valid,
+               pg_get_indexdef(c.oid) AS definition
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_class t ON t.oid = i.indrelid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE t.relname = ANY($1::text[]) AND am.amname IN ('hnsw', 'ivfflat', 'gin')
+        ORDER BY t.relname, c.relname
+    """, list(INDEXED_TABLES))
+    return [dict(row) for row in rows]
+
+
+async def build_progress(conn) -> List[Dict[str, Any]]:
+    """In-flight CREATE INDEX progress from pg_stat_progress_create_index."""
+    rows = await conn.fetch("""
+        SELECT p.pid, t.relname AS "table", c.relname AS name, p.phase,
+               p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total
+        FROM pg_stat_progress_create_index p
+        JOIN pg_class t ON t.oid = p.relid
+        LEFT JOIN pg_class c ON c.oid = p.index_relid
+    """)
+    return [dict(row) for row in rows]
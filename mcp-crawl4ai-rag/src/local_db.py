@@ -7,10 +7,13 @@ import os
 import asyncpg
 import logging
 import json
+from array import array
 from typing import Optional, List, Dict, Any
 from contextlib import asynccontextmanager
 from openai import OpenAI
 
+from pgvector_codec import register_vector_codec
+
 logger = logging.getLogger(__name__)
 
 # Database configuration
@@ -36,7 +39,8 @@ async def get_pool() -> asyncpg.Pool:
             DATABASE_URL,
             min_size=4,
             max_size=pool_size,
-            command_timeout=60
+            command_timeout=60,
+            init=register_vector_codec
         )
     return _pool
 
@@ -49,11 +53,11 @@ async def get_connection():
         yield conn
 
 
-def _format_embedding(embedding: Optional[List[float]]) -> Optional[str]:
-    """Convert embedding list to pgvector string format."""
+def _format_embedding(embedding: Optional[List[float]]) -> Optional[array]:
+    """Pack an embedding into a float32 buffer for the binary pgvector codec."""
     if embedding is None:
         return None
-    return "[" + ",".join(str(x) for x in embedding) + "]"
+    return array("f", embedding)
 
 
 def get_embedding(text: str, api_key: str = None) -> List[float]:
@@ -131,7 +135,7 @@ async def _add_documents(urls: List[str], chunk_numbers: List[int], contents: Li
                 
                 # Generate embedding
                 embedding = get_embedding(content, api_key)
-                embedding_str = _format_embedding(embedding)
+                embedding_vec = _format_embedding(embedding)
                 
                 await conn.execute("""
                     INSERT INTO crawled_pages (url, chunk_number, content, metadata, source_id, tenant_id, user_id, embedding)
@@ -140,7 +144,7 @@ async def _add_documents(urls: List[str], chunk_numbers: List[int], contents: Li
                         content = EXCLUDED.content,
                         metadata = EXCLUDED.metadata,
                         embedding = EXCLUDED.embedding
-                """, url, chunk_num, content, json.dumps(metadata), source_id, tenant_id, embedding_str)
+                """, url, chunk_num, content, json.dumps(metadata), source_id, tenant_id, embedding_vec)
             except Exception as e:
                 logger.error(f"Error adding document {url} chunk {chunk_num}: {e}")
 
@@ -177,7 +181,7 @@ async def _add_code_examples(urls: List[str], chunk_numbers: List[int], codes: L
                 
                 # Generate embedding from summary
                 embedding = get_embedding(summary, api_key)
-                embedding_str = _format_embedding(embedding)
+                embedding_vec = _format_embedding(embedding)
                 
                 await conn.execute("""
                     INSERT INTO code_examples (url, chunk_number, content, summary, metadata, source_id, tenant_id, user_id, embedding)
@@ -187,7 +191,7 @@ async def _add_code_examples(urls: List[str], chunk_numbers: List[int], codes: L
                         summary = EXCLUDED.summary,
                         metadata = EXCLUDED.metadata,
                         embedding = EXCLUDED.embedding
-                """, url, chunk_num, code, summary, json.dumps(metadata), source_id, tenant_id, embedding_str)
+                """, url, chunk_num, code, summary, json.dumps(metadata), source_id, tenant_id, embedding_vec)
             except Exception as e:
                 logger.error(f"Error adding code example {url} chunk {chunk_num}: {e}")
 
@@ -215,7 +219,7 @@ async def _search_documents(query: str, tenant_id: str, api_key: str, match_coun
     """Search documents by embedding similarity."""
     tenant_id = tenant_id or DEFAULT_TENANT_ID
     embedding = get_embedding(query, api_key)
-    embedding_str = _format_embedding(embedding)
+    embedding_vec = _format_embedding(embedding)
     
     async with get_connection() as conn:
         if source_id:
@@ -226,7 +230,7 @@ async def _search_documents(query: str, tenant_id: str, api_key: str, match_coun
                 WHERE tenant_id = $2 AND source_id = $3
                 ORDER BY embedding <=> $1::vector
                 LIMIT $4
-            """, embedding_str, tenant_id, source_id, match_count)
+            """, embedding_vec, tenant_id, source_id, match_count)
         else:
             rows = await conn.fetch("""
                 SELECT url, chunk_number, content, metadata, source_id,
@@ -235,7 +239,7 @@ async def _search_documents(query: str, tenant_id: str, api_key: str, match_coun
                 WHERE tenant_id = $2
                 ORDER BY embedding <=> $1::vector
                 LIMIT $3
-            """, embedding_str, tenant_id, match_count)
+            """, embedding_vec, tenant_id, match_count)
         
         return [dict(row) for row in rows]
 
@@ -265,7 +269,7 @@ async def _search_code_examples(query: str, tenant_id: str, api_key: str, match_
     """Search code examples by embedding similarity."""
     tenant_id = tenant_id or DEFAULT_TENANT_ID
     embedding = get_embedding(query, api_key)
-    embedding_str = _format_embedding(embedding)
+    embedding_vec = _format_embedding(embedding)
     
     async with get_connection() as conn:
         if source_id:
@@ -276,7 +280,7 @@ async def _search_code_examples(query: str, tenant_id: str, api_key: str, match_
                 WHERE tenant_id = $2 AND source_id = $3
                 ORDER BY embedding <=> $1::vector
                 LIMIT $4
-            """, embedding_str, tenant_id, source_id, match_count)
+            """, embedding_vec, tenant_id, source_id, match_count)
         else:
             rows = await conn.fetch("""
                 SELECT url, chunk_number, content, summary, metadata, source_id,
@@ -285,7 +289,7 @@ async def _search_code_examples(query: str, tenant_id: str, api_key: str, match_
                 WHERE tenant_id = $2
                 ORDER BY embedding <=> $1::vector
                 LIMIT $3
-            """, embedding_str, tenant_id, match_count)
+            """, embedding_vec, tenant_id, match_count)
         
         return [dict(row) for row in rows]
 
@@ -335,7 +339,7 @@ async def save_crawled_page(
     """Save a single crawled page to the database."""
     tenant_id = tenant_id or DEFAULT_TENANT_ID
     async with get_connection() as conn:
-        embedding_str = _format_embedding(embedding)
+        embedding_vec = _format_embedding(embedding)
         await conn.execute("""
             INSERT INTO crawled_pages (url, chunk_number, content, metadata, source_id, tenant_id, user_id, embedding)
             VALUES ($1, $2, $3, $4, $5, $6, 'default', $7::vector)
@@ -343,7 +347,7 @@ async def save_crawled_page(
                 content = EXCLUDED.content,
                 metadata = EXCLUDED.metadata,
                 embedding = EXCLUDED.embedding
-        """, url, chunk_number, content, json.dumps(metadata or {}), source_id, tenant_id, embedding_str)
+        """, url, chunk_number, content, json.dumps(metadata or {}), source_id, tenant_id, embedding_vec)
 
 
 async def search_crawled_pages(
@@ -355,7 +359,7 @@ async def search_crawled_pages(
 ) -> List[Dict]:
     """Search crawled pages by embedding similarity."""
     tenant_id = tenant_id or DEFAULT_TENANT_ID
-    embedding_str = _format_embedding(embedding)
+    embedding_vec = _format_embedding(embedding)
     
     async with get_connection() as conn:
         if source_id:
@@ -366,7 +370,7 @@ async def search_crawled_pages(
                 WHERE tenant_id = $2 AND source_id = $3
                 ORDER BY embedding <=> $1::vector
                 LIMIT $4
-            """, embedding_str, tenant_id, source_id, limit)
+            """, embedding_vec, tenant_id, source_id, limit)
         else:
             rows = await conn.fetch("""
                 SELECT url, chunk_number, content, metadata, source_id,
@@ -375,7 +379,7 @@ async def search_crawled_pages(
                 WHERE tenant_id = $2
                 ORDER BY embedding <=> $1::vector
                 LIMIT $3
-            """, embedding_str, tenant_id, limit)
+            """, embedding_vec, tenant_id, limit)
         
         return [dict(row) for row in rows]
 
@@ -388,7 +392,7 @@ async def search_code_examples_by_embedding(
 ) -> List[Dict]:
     """Search code examples by embedding similarity."""
     tenant_id = tenant_id or DEFAULT_TENANT_ID
-    embedding_str = _format_embedding(embedding)
+    embedding_vec = _format_embedding(embedding)
     
     async with get_connection() as conn:
         if source_id:
@@ -399,7 +403,7 @@ async def search_code_examples_by_embedding(
                 WHERE tenant_id = $2 AND source_id = $3
                 ORDER BY embedding <=> $1::vector
                 LIMIT $4
-            """, embedding_str, tenant_id, source_id, limit)
+            """, embedding_vec, tenant_id, source_id, limit)
         else:
             rows = await conn.fetch("""
                 SELECT url, chunk_number, content, summary, metadata, source_id,
@@ -408,7 +412,7 @@ async def search_code_examples_by_embedding(
                 WHERE tenant_id = $2
                 ORDER BY embedding <=> $1::vector
                 LIMIT $3
-            """, embedding_str, tenant_id, limit)
+            """, embedding_vec, tenant_id, limit)
         
         return [dict(row) for row in rows]
 
@@ -426,7 +430,7 @@ async def save_code_example(
     """Save a single code example to the database."""
     tenant_id = tenant_id or DEFAULT_TENANT_ID
     async with get_connection() as conn:
-        embedding_str = _format_embedding(embedding)
+        embedding_vec = _format_embedding(embedding)
         await conn.execute("""
             INSERT INTO code_examples (url, chunk_number, content, summary, metadata, source_id, tenant_id, user_id, embedding)
             VALUES ($1, $2, $3, $4, $5, $6, $7, 'default', $8::vector)
@@ -435,7 +439,7 @@ async def save_code_example(
                 summary = EXCLUDED.summary,
                 metadata = EXCLUDED.metadata,
                 embedding = EXCLUDED.embedding
-        """, url, chunk_number, content, summary, json.dumps(metadata or {}), source_id, tenant_id, embedding_str)
+        """, url, chunk_number, content, summary, json.dumps(metadata or {}), source_id, tenant_id, embedding_vec)
 
 
 async def delete_source(source_id: str, tenant_id: str = None) -> Dict:
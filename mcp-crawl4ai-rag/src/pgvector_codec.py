@@ -0,0 +1,72 @@
+"""
+Binary pgvector Codec
+=====================
+asyncpg type codec for pgvector's ``vector`` type using the binary wire
+format (uint16 dim, uint16 unused, dim x big-endian float4) instead of
+building and parsing '[0.1,0.2,...]' strings.
+
+Accepts lists, ``array('f')`` buffers and 1-d NumPy arrays; decodes to lists.
+"""
+
+import sys
+import struct
+import logging
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy ships with sentence-transformers
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">HH")
+_NEEDS_SWAP = sys.byteorder == "little"
+
+
+def encode_vector(value) -> bytes:
+    """Encode a vector to pgvector's binary format."""
+    if np is not None and isinstance(value, np.ndarray):
+        return _HEADER.pack(value.shape[0], 0) + value.astype(">f4", copy=False).tobytes()
+
+    # array('f', ...) copies, so the caller's buffer is never byteswapped in place
+    buf = array("f", value)
+    if _NEEDS_SWAP:
+        buf.byteswap()
+    return _HEADER.pack(len(buf), 0) + buf.tobytes()
+
+
+def decode_vector(data: bytes) -> list:
+    """Decode pgvector's binary format to a list of floats."""
+    dim, _ = _HEADER.unpack_from(data)
+    buf = array("f")
+    buf.frombytes(data[_HEADER.size:_HEADER.size + dim * 4])
+    if _NEEDS_SWAP:
+        buf.byteswap()
+    return buf.tolist()
+
+
+async def register_vector_codec(conn) -> None:
+    """
+    Register the binary vector codec on a connection (use as pool ``init``).
+
+    Skips registration when the pgvector extension isn't installed so the
+    pool still works for non-vector queries.
+    """
+    schema = await conn.fetchval("""
+        SELECT n.nspname FROM pg_type t
+        JOIN pg_namespace n ON n.oid = t.typnamespace
+        WHERE t.typname = 'vector'
+        LIMIT 1
+    """)
+    if schema is None:
+        logger.warning("pgvector extension not found; vector codec not registered")
+        return
+
+    await conn.set_type_codec(
+        "vector",
+        schema=schema,
+        encoder=encode_vector,
+        decoder=decode_vector,
+        format="binary",
+    )